@@ -7,7 +7,7 @@ from models import User
 from sqlalchemy.future import select
 from schemas import UserResponse
 from datetime import datetime, timedelta
-from typing import Annotated
+from typing import Annotated, Optional
 import os
 
 SECRET_KEY = os.environ.get("SECRET_KEY", "your-secret-key") # Replace with a strong, random key
@@ -22,12 +22,8 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: As
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        bus_number: str = payload.get("sub")
-        if bus_number is None:
-            raise credentials_exception
-    except JWTError:
+    bus_number = decode_access_token(token)
+    if bus_number is None:
         raise credentials_exception
 
     result = await db.execute(select(User).filter(User.bus_number == bus_number))
@@ -36,6 +32,14 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: As
         raise credentials_exception
     return user
 
+def decode_access_token(token: str) -> Optional[str]:
+    """Returns the bus_number a valid, unexpired token was issued for, else None."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
 async def create_access_token(bus_number: str):
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode = {"sub": bus_number, "exp": expire}
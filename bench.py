@@ -0,0 +1,697 @@
+# bench.py
+"""Micro-benchmarks for the hot paths. Run: python bench.py <name> [options]"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import tracemalloc
+
+
+# --- broadcast ---------------------------------------------------------------
+
+async def _bench_broadcast(subscribers: int, buses: int, updates: int, slow_fraction: float):
+    from broadcast import RouteHub
+
+    hub = RouteHub(max_pending=buses, max_lag=0.5)
+    delivered = 0
+
+    async def fast_send(frame):
+        nonlocal delivered
+        delivered += 1
+
+    async def slow_send(frame):
+        await asyncio.sleep(0.05)
+
+    subs = [hub.subscribe("route_1") for _ in range(subscribers)]
+    slow_count = int(subscribers * slow_fraction)
+    pumps = [
+        asyncio.create_task(hub.pump(sub, slow_send if i < slow_count else fast_send))
+        for i, sub in enumerate(subs)
+    ]
+    await asyncio.sleep(0)
+
+    publish_time = 0.0
+    started = time.perf_counter()
+    for i in range(updates):
+        bus = f"bus_{i % buses}"
+        t0 = time.perf_counter()
+        hub.publish("route_1", {"type": "bus", "bus_number": bus, "current_lat": 27.6, "current_lon": 85.5}, key=bus)
+        publish_time += time.perf_counter() - t0
+        if i % buses == buses - 1:
+            # One ingest "tick" per round of bus updates; lets the pumps run
+            await asyncio.sleep(0.01)
+    await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - started
+
+    for sub in subs:
+        sub.close()
+    await asyncio.gather(*pumps, return_exceptions=True)
+
+    channel = hub.stats()["channels"]["route_1"]
+    print(f"subscribers={subscribers} slow={slow_count} buses={buses} updates={updates}")
+    print(f"  publish: {publish_time / updates * 1e6:.1f} us/update "
+          f"({updates * subscribers / publish_time:,.0f} offers/s)")
+    print(f"  wall: {elapsed:.2f}s, fast deliveries: {delivered:,}")
+    print(f"  dropped={channel['dropped']:,} slow_disconnects={channel['slow_disconnects']} "
+          f"avg_send_latency_ms={channel['avg_send_latency_ms']} max_send_latency_ms={channel['max_send_latency_ms']}")
+
+
+def bench_broadcast(args):
+    asyncio.run(_bench_broadcast(args.subscribers, args.buses, args.updates, args.slow_fraction))
+
+
+# --- geometry ----------------------------------------------------------------
+
+def _random_route(vertices: int):
+    lat, lon = 27.59, 85.52
+    coordinates = []
+    for _ in range(vertices):
+        lat += random.uniform(-1e-4, 1e-4)
+        lon += random.uniform(-1e-4, 1e-4)
+        coordinates.append({"lat": lat, "lon": lon})
+    return coordinates
+
+
+def _allocated(build):
+    tracemalloc.start()
+    value = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, size
+
+
+def _timed(fn, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def bench_geometry(args):
+    from geometry import RouteGeometry
+
+    coordinates = _random_route(args.vertices)
+    as_json = json.dumps(coordinates)
+    packed = RouteGeometry.from_coordinates(coordinates).to_bytes()
+
+    _, json_mem = _allocated(lambda: json.loads(as_json))
+    _, packed_mem = _allocated(lambda: RouteGeometry.from_bytes(packed))
+    json_parse = _timed(lambda: json.loads(as_json), args.repeat)
+    packed_parse = _timed(lambda: RouteGeometry.from_bytes(packed), args.repeat)
+
+    geometry = RouteGeometry.from_bytes(packed)
+    append_packed = _timed(lambda: geometry.append(27.6, 85.5), args.repeat)
+
+    print(f"vertices={args.vertices}")
+    print(f"  stored:  json {len(as_json):,} B   packed {len(packed):,} B")
+    print(f"  memory:  json {json_mem:,} B ({json_mem / args.vertices:.0f} B/vertex)   "
+          f"packed {packed_mem:,} B ({packed_mem / args.vertices:.0f} B/vertex)   "
+          f"{json_mem / packed_mem:.1f}x smaller")
+    print(f"  parse:   json {json_parse * 1e3:.3f} ms   packed {packed_parse * 1e3:.3f} ms   "
+          f"{json_parse / packed_parse:.1f}x faster")
+    print(f"  append:  packed {append_packed * 1e9:.0f} ns/vertex")
+
+
+# --- map matching ------------------------------------------------------------
+
+def bench_mapmatch(args):
+    import numpy as np
+    from geometry import RouteGeometry
+    from mapmatch import RouteMatcher
+
+    matcher = RouteMatcher(RouteGeometry.from_coordinates(_random_route(args.vertices)))
+    lats = np.random.default_rng(0).uniform(27.58, 27.63, args.positions)
+    lons = np.random.default_rng(1).uniform(85.50, 85.55, args.positions)
+
+    started = time.perf_counter()
+    for lat, lon in zip(lats.tolist(), lons.tolist()):
+        matcher.snap(lat, lon)
+    single = time.perf_counter() - started
+
+    started = time.perf_counter()
+    matcher.snap_many(lats, lons)
+    batch = time.perf_counter() - started
+
+    print(f"vertices={args.vertices} positions={args.positions}")
+    print(f"  snap:      {args.positions / single:,.0f} positions/s ({single / args.positions * 1e6:.1f} us each)")
+    print(f"  snap_many: {args.positions / batch:,.0f} positions/s")
+
+
+# --- spatial index -----------------------------------------------------------
+
+def bench_nearby(args):
+    from spatial import GridIndex
+
+    index = GridIndex(args.cell_deg)
+    for i in range(args.buses):
+        # Fleet spread over roughly a 60 x 60 km metro area
+        index.update(f"bus_{i}", random.uniform(27.4, 27.95), random.uniform(85.1, 85.7))
+    queries = [(random.uniform(27.4, 27.95), random.uniform(85.1, 85.7)) for _ in range(args.queries)]
+
+    for (lat, lon) in queries[:50]:
+        assert index.nearest(lat, lon, args.radius, args.k) == index.nearest_linear(lat, lon, args.radius, args.k)
+
+    grid = _timed(lambda: [index.nearest(lat, lon, args.radius, args.k) for lat, lon in queries], 1)
+    linear = _timed(lambda: [index.nearest_linear(lat, lon, args.radius, args.k) for lat, lon in queries], 1)
+    print(f"buses={args.buses} queries={args.queries} radius={args.radius}m k={args.k}")
+    print(f"  grid:   {grid / args.queries * 1e6:,.1f} us/query")
+    print(f"  linear: {linear / args.queries * 1e6:,.1f} us/query   ({linear / grid:.0f}x slower)")
+
+
+# --- level of detail ---------------------------------------------------------
+
+def _traced_route(vertices: int, spacing: float = 5.0, noise: float = 2.0):
+    """A GPS-traced road: gently turning heading, a fix every few metres, with jitter."""
+    import math
+    lat, lon, heading = 27.59, 85.52, 0.0
+    m_per_deg = 111_195.0
+    coordinates = []
+    for _ in range(vertices):
+        heading += random.gauss(0, 0.08)
+        lat += spacing * math.cos(heading) / m_per_deg
+        lon += spacing * math.sin(heading) / (m_per_deg * math.cos(math.radians(lat)))
+        coordinates.append({"lat": lat + random.gauss(0, noise) / m_per_deg,
+                            "lon": lon + random.gauss(0, noise) / m_per_deg})
+    return coordinates
+
+
+def bench_simplify(args):
+    from geometry import RouteGeometry
+    from route_cache import RouteEntry
+    from simplify import RouteLod
+
+    geometry = RouteGeometry.from_coordinates(_traced_route(args.vertices))
+    build = _timed(lambda: RouteLod(geometry), args.repeat)
+
+    entry = RouteEntry("route_bench", geometry)
+    full = len(entry.json_bytes())
+    print(f"vertices={args.vertices}  importance pass: {build * 1e3:.1f} ms")
+    print(f"  {'zoom':>4} {'vertices':>9} {'payload':>12} {'of full':>8} {'first':>9} {'cached':>9}")
+    for zoom in args.zooms:
+        started = time.perf_counter()
+        body = entry.json_bytes(zoom)
+        first = time.perf_counter() - started
+        cached = _timed(lambda: entry.json_bytes(zoom), args.repeat)
+        print(f"  {zoom:>4} {len(entry.lod.for_zoom(zoom)):>9,} {len(body):>10,} B {len(body) / full:>7.1%} "
+              f"{first * 1e3:>7.2f}ms {cached * 1e6:>7.1f}us")
+    print(f"  full {len(geometry):>9,} {full:>10,} B")
+
+
+# --- wire formats ------------------------------------------------------------
+
+def bench_codec(args):
+    import gzip
+    from codec import encode_polyline, encode_positions
+    from geometry import RouteGeometry
+
+    geometry = RouteGeometry.from_coordinates(_traced_route(args.vertices))
+    coordinates = geometry.to_coordinates()
+    as_json = json.dumps(coordinates, separators=(",", ":")).encode()
+    polyline = encode_polyline(geometry.lats, geometry.lons)
+    json_time = _timed(lambda: json.dumps(coordinates, separators=(",", ":")), args.repeat)
+    polyline_time = _timed(lambda: encode_polyline(geometry.lats, geometry.lons), args.repeat)
+
+    snapshot = {}
+    for i in range(args.buses):
+        snapshot.setdefault(f"route_{i % args.routes}", []).append({
+            "bus_number": f"BA {i // 1000} KHA {i % 10000:04d}",
+            "current_lat": round(random.uniform(27.55, 27.80), 6),
+            "current_lon": round(random.uniform(85.25, 85.55), 6),
+        })
+    positions_json = json.dumps({"routes": snapshot}).encode()
+    positions = encode_positions(snapshot)
+    positions_json_time = _timed(lambda: json.dumps({"routes": snapshot}), args.repeat)
+    positions_time = _timed(lambda: encode_positions(snapshot), args.repeat)
+
+    def row(name, body, encode):
+        print(f"  {name:<9} {len(body):>11,} B {len(gzip.compress(body)):>11,} B {encode * 1e3:>9.2f} ms")
+
+    print(f"geometry: vertices={args.vertices}  (encoded once per route version, then served from cache)")
+    print(f"  {'format':<9} {'raw':>13} {'gzip':>13} {'encode':>12}")
+    row("json", as_json, json_time)
+    row("polyline", polyline, polyline_time)
+    print(f"  polyline is {len(as_json) / len(polyline):.1f}x smaller raw, "
+          f"{len(gzip.compress(as_json)) / len(gzip.compress(polyline)):.1f}x gzipped")
+    print(f"positions: buses={args.buses} routes={args.routes}")
+    print(f"  {'format':<9} {'raw':>13} {'gzip':>13} {'encode':>12}")
+    row("json", positions_json, positions_json_time)
+    row("binary", positions, positions_time)
+    print(f"  binary is {len(positions_json) / len(positions):.1f}x smaller raw, "
+          f"{len(gzip.compress(positions_json)) / len(gzip.compress(positions)):.1f}x gzipped")
+
+
+# --- GPS filter --------------------------------------------------------------
+
+def bench_gpsfilter(args):
+    import numpy as np
+    from gps_filter import HOLD, PUBLISH, REJECT, GpsFilter
+
+    m_per_deg = 111_195.0
+    rng = np.random.default_rng(0)
+    buses = [f"bus_{i}" for i in range(args.buses)]
+    # Each bus cruises at 8 m/s on a random heading, or sits parked
+    heading = rng.uniform(0, 2 * np.pi, args.buses)
+    speed = np.where(rng.random(args.buses) < args.parked, 0.0, 8.0)
+    lat0 = rng.uniform(27.6, 27.75, args.buses)
+    lon0 = rng.uniform(85.3, 85.5, args.buses)
+
+    def fixes(step):
+        lat = lat0 + speed * step * np.cos(heading) / m_per_deg
+        lon = lon0 + speed * step * np.sin(heading) / (m_per_deg * np.cos(np.radians(lat0)))
+        noisy_lat = lat + rng.normal(0, args.noise, args.buses) / m_per_deg
+        noisy_lon = lon + rng.normal(0, args.noise, args.buses) / m_per_deg
+        jump = rng.random(args.buses) < args.outliers
+        noisy_lat[jump] += 2000 / m_per_deg
+        return lat, lon, noisy_lat, noisy_lon, jump
+
+    def error(lat, lon, true_lat, true_lon, mask):
+        return float(np.sqrt(np.mean(((lat - true_lat) ** 2 + ((lon - true_lon) * np.cos(np.radians(true_lat))) ** 2)[mask])) * m_per_deg)
+
+    batched, single = GpsFilter(), GpsFilter()
+    counts = {REJECT: 0, HOLD: 0, PUBLISH: 0}
+    caught = jumps = 0
+    raw_err = filtered_err = 0.0
+    batch_time = single_time = 0.0
+    for step in range(args.steps):
+        true_lat, true_lon, lat, lon, jump = fixes(step)
+        lat, lon = lat.tolist(), lon.tolist()
+        t = np.full(args.buses, float(step))
+        started = time.perf_counter()
+        out = batched.update_many(buses, lat, lon, t)
+        batch_time += time.perf_counter() - started
+        started = time.perf_counter()
+        one = [single.update(bus, lat[i], lon[i], float(step)) for i, bus in enumerate(buses)]
+        single_time += time.perf_counter() - started
+        assert [v for v, *_ in one] == out.verdict.tolist()
+        assert np.allclose([f[1] for f in one], out.lat, rtol=0, atol=1e-9)
+        for verdict in counts:
+            counts[verdict] += int(np.count_nonzero(out.verdict == verdict))
+        caught += int(np.count_nonzero(jump & (out.verdict == REJECT)))
+        jumps += int(np.count_nonzero(jump))
+        if step >= 10:
+            raw_err += error(lat, lon, true_lat, true_lon, ~jump)
+            filtered_err += error(out.lat, out.lon, true_lat, true_lon, out.verdict != REJECT)
+
+    total = args.buses * args.steps
+    scored = max(args.steps - 10, 1)
+    print(f"buses={args.buses} steps={args.steps} noise={args.noise}m outliers={args.outliers:.1%} parked={args.parked:.0%}")
+    print(f"  published {counts[PUBLISH] / total:.1%}, held {counts[HOLD] / total:.1%}, "
+          f"rejected {counts[REJECT] / total:.1%}  (writes and broadcasts saved: {1 - counts[PUBLISH] / total:.1%})")
+    print(f"  jumps caught: {caught}/{jumps}")
+    print(f"  rms error: raw {raw_err / scored:.2f} m, filtered {filtered_err / scored:.2f} m")
+    print(f"  batched: {batch_time / total * 1e6:.2f} us/fix   one at a time: {single_time / total * 1e6:.2f} us/fix")
+
+
+# --- driver ingest protocols -------------------------------------------------
+
+def bench_driverws(args):
+    import numpy as np
+    from codec import FIX_DTYPE, decode_fix_frame, encode_ack, encode_fix_frame
+    from gps_filter import gps_filter
+    from ingest import ingest_buffer
+    from pipeline import process_fix_records, process_location
+    from schemas import LocationUpdate
+
+    m_per_deg = 111_195.0
+    buses = [f"BA {i // 100} KHA {i:04d}" for i in range(args.buses)]
+    lat0 = np.random.default_rng(0).uniform(27.6, 27.75, args.buses)
+    started_at = time.time() - args.steps
+
+    def position(i, step):
+        return float(lat0[i] + 8.0 * step / m_per_deg), 85.4
+
+    texts = [json.dumps({"bus_number": bus, "lat": position(i, step)[0], "lon": position(i, step)[1]})
+             for step in range(args.steps) for i, bus in enumerate(buses)]
+    frames = []
+    per_frame = args.fixes_per_frame
+    for step in range(args.steps):
+        for start in range(0, args.buses, per_frame):
+            ids = range(start, min(start + per_frame, args.buses))
+            records = np.zeros(len(ids), dtype=FIX_DTYPE)
+            records["bus"] = np.arange(len(ids))
+            records["ts_ms"] = int((started_at + step) * 1000)
+            records["lat"] = [round(position(i, step)[0] * 1e6) for i in ids]
+            records["lon"] = [round(position(i, step)[1] * 1e6) for i in ids]
+            records["speed"] = 800
+            records["heading"] = 0
+            frames.append(encode_fix_frame(len(frames) + 1, [buses[i] for i in ids], records))
+
+    def reset():
+        ingest_buffer._pending.clear()
+        ingest_buffer._history.clear()
+        for bus in buses:
+            gps_filter.forget(bus)
+
+    def json_path():
+        for text in texts:
+            location = LocationUpdate(**json.loads(text))
+            process_location(location)
+            f"Location updated for bus {location.bus_number}".encode()
+
+    def binary_path():
+        for n, frame in enumerate(frames, 1):
+            seq, bus_table, records = decode_fix_frame(frame)
+            process_fix_records(bus_table, records)
+            if n % 16 == 0:
+                encode_ack(seq, 0, 0)
+
+    def json_parse():
+        for text in texts:
+            LocationUpdate(**json.loads(text))
+
+    def binary_parse():
+        for frame in frames:
+            seq, bus_table, records = decode_fix_frame(frame)
+            lat = records["lat"] / 1e6
+            (np.abs(lat) <= 90) & (records["bus"] < len(bus_table))
+
+    fixes = len(texts)
+    print(f"buses={args.buses} steps={args.steps} fixes={fixes:,} fixes/frame={per_frame}")
+    print(f"  {'path':<8} {'bytes/fix':>9} {'parse+validate':>16} {'full ingest':>14} {'frames in':>10} {'acks out':>9}")
+    for name, payload, parse, full, frames_in, acks in (
+        ("json", texts, json_parse, json_path, fixes, fixes),
+        ("binary", frames, binary_parse, binary_path, len(frames), len(frames) // 16 + 1),
+    ):
+        size = sum(len(p) for p in payload) / fixes
+        parse_time = full_time = float("inf")
+        # Best of a few cold runs: each starts from empty filter and buffer state
+        for _ in range(args.repeat):
+            reset()
+            parse_time = min(parse_time, _timed(parse, 1))
+            reset()
+            full_time = min(full_time, _timed(full, 1))
+        print(f"  {name:<8} {size:>9.1f} {fixes / parse_time:>11,.0f} fix/s {fixes / full_time:>9,.0f} fix/s "
+              f"{frames_in:>10,} {acks:>9,}")
+    reset()
+
+
+# --- adaptive reporting rate --------------------------------------------------
+
+def _drive(along, speed, dwell, stops, cruise, accel, dwell_time, layover, length):
+    """Advances a simulated bus by one second: accelerate, brake for the next stop, dwell there."""
+    if dwell > 0:
+        dwell -= 1
+        if dwell <= 0 and along >= length - 0.5:
+            along = 0.0  # back to the start for the next trip
+        return along, 0.0, dwell
+    ahead = stops[stops > along + 0.5]
+    gap = float(ahead[0] - along) if ahead.size else length - along
+    target = min(cruise, (2 * accel * gap) ** 0.5)
+    speed = min(speed + accel, target)
+    if gap - speed <= 0.5:
+        return along + gap, 0.0, layover if along + gap >= length - 0.5 else dwell_time
+    return along + speed, speed, 0.0
+
+
+def bench_reporting(args):
+    import numpy as np
+    from geometry import DistanceProfile, RouteGeometry
+    from gps_filter import gps_filter
+    from fleet import fleet_store
+    from ingest import ingest_buffer
+    from pipeline import process_fixes
+    from reporting import reporting_policy
+    from route_cache import route_cache
+    from geometry import haversine_m
+
+    rng = np.random.default_rng(0)
+    m_per_deg = 111_195.0
+    if args.synthetic:
+        shapes = [(f"sim_route_{r}", _traced_route(args.route_length // 5, noise=0.0)) for r in range(args.synthetic)]
+    else:
+        from main import DEMO_ROUTES
+        shapes = [(route["route_id"], route["coordinates"]) for route in DEMO_ROUTES]
+    routes = []
+    for route_id, coordinates in shapes:
+        geometry = RouteGeometry.from_coordinates(coordinates)
+        route_cache.put(route_id, geometry)
+        profile = DistanceProfile.from_geometry(geometry)
+        stops = np.arange(args.stop_spacing, profile.total, args.stop_spacing)
+        stops = np.append(stops[stops < profile.total - args.stop_spacing / 2], profile.total)
+        reporting_policy.set_stops(route_id, np.concatenate(([0.0], stops)))
+        routes.append((route_id, geometry, profile, stops))
+
+    def position(route, along):
+        _, geometry, profile, _ = route
+        segment, fraction = profile.locate(along)
+        lats, lons = np.frombuffer(geometry.lats), np.frombuffer(geometry.lons)
+        j = min(segment + 1, len(lats) - 1)
+        return lats[segment] + fraction * (lats[j] - lats[segment]), lons[segment] + fraction * (lons[j] - lons[segment])
+
+    buses = [f"SIM {i:04d}" for i in range(args.buses)]
+    assignment = [routes[i % len(routes)] for i in range(args.buses)]
+    # Spread buses over their routes; a share start parked at a terminus for the whole run
+    parked = rng.random(args.buses) < args.parked
+    start = [0.0 if parked[i] else float(rng.uniform(0, route[2].total)) for i, route in enumerate(assignment)]
+
+    def run(adaptive: bool):
+        for bus, route in zip(buses, assignment):
+            fleet_store._remove(bus)
+            gps_filter.forget(bus)
+            fleet_store.register_bus(bus, route[0])
+        ingest_buffer.last_flush_ms = args.load * ingest_buffer.flush_interval * 1000
+        along, speed, dwell = list(start), [0.0] * args.buses, [0.0] * args.buses
+        advice = [None] * args.buses
+        last_sent = [None] * args.buses  # (t, lat, lon)
+        # Both drivers see the same GPS error, so the comparison is of the policy alone
+        noise_rng = np.random.default_rng(1)
+        noise = noise_rng.normal(0, args.noise, (args.buses, 2))
+        rho = args.noise_corr
+        sent = sent_parked = advice_messages = 0
+        errors = {True: [], False: []}
+        t0 = time.time() - args.steps
+        for step in range(args.steps):
+            t = t0 + step
+            send_bus, send_lat, send_lon = [], [], []
+            truth = []
+            for i, route in enumerate(assignment):
+                if not parked[i]:
+                    along[i], speed[i], dwell[i] = _drive(along[i], speed[i], dwell[i], route[3], args.cruise,
+                                                          1.0, args.dwell, args.layover, route[2].total)
+                lat, lon = position(route, along[i])
+                truth.append((lat, lon, float(np.min(np.abs(np.append(route[3], 0.0) - along[i])))))
+                # GPS error drifts rather than jumping independently every second
+                noise[i] = rho * noise[i] + np.sqrt(1 - rho ** 2) * noise_rng.normal(0, args.noise, 2)
+                lat += noise[i][0] / m_per_deg
+                lon += noise[i][1] / (m_per_deg * np.cos(np.radians(lat)))
+                if adaptive and last_sent[i] is not None:
+                    interval, deadband = advice[i] or (1.0, 0.0)
+                    moved = haversine_m(last_sent[i][1], last_sent[i][2], lat, lon)
+                    if t - last_sent[i][0] < interval - 0.5 and moved < deadband:
+                        continue
+                send_bus.append(buses[i]); send_lat.append(lat); send_lon.append(lon)
+                last_sent[i] = (t, lat, lon)
+                sent_parked += int(parked[i])
+            if send_bus:
+                process_fixes(send_bus, send_lat, send_lon, np.full(len(send_bus), t))
+                sent += len(send_bus)
+            ingest_buffer._pending.clear()
+            ingest_buffer._history.clear()
+            if adaptive:
+                for bus in send_bus:
+                    i = int(bus[4:])
+                    revised = reporting_policy.revise(advice[i], bus, fleet_store.get(bus))
+                    if revised is not None:
+                        advice[i] = revised
+                        advice_messages += 1
+            for i, bus in enumerate(buses):
+                state = fleet_store.get(bus)
+                if state is not None:
+                    lat, lon, to_stop = truth[i]
+                    errors[to_stop <= reporting_policy.stop_radius].append(haversine_m(state.lat, state.lon, lat, lon))
+        ingest_buffer.last_flush_ms = 0.0
+        return sent, sent_parked, advice_messages, {near: np.array(e) for near, e in errors.items()}
+
+    lengths = ", ".join(f"{route[2].total / 1000:.1f}" for route in routes)
+    print(f"buses={args.buses} routes={len(routes)} ({lengths} km) steps={args.steps}s stops every {args.stop_spacing:.0f} m, "
+          f"parked={args.parked:.0%} load={args.load:.0%}")
+    print(f"  {'driver':<9} {'fixes':>8} {'advice':>7} {'per bus-min':>11} {'parked':>7} "
+          f"{'near stops p50/p95 m':>21} {'elsewhere p50/p95 m':>20}")
+    baseline = None
+    n_parked = max(int(np.count_nonzero(parked)), 1)
+    for name, adaptive in (("fixed 1s", False), ("adaptive", True)):
+        started = time.perf_counter()
+        sent, sent_parked, advice_messages, errors = run(adaptive)
+        elapsed = time.perf_counter() - started
+        baseline = baseline or sent
+        near, far = errors[True], errors[False]
+        print(f"  {name:<9} {sent:>8,} {advice_messages:>7,} {sent / args.buses / args.steps * 60:>11.1f} "
+              f"{sent_parked / n_parked / args.steps * 60:>7.1f} "
+              f"{np.percentile(near, 50):>10.1f} / {np.percentile(near, 95):<8.1f} "
+              f"{np.percentile(far, 50):>9.1f} / {np.percentile(far, 95):<8.1f} ({elapsed:.1f}s)")
+    print(f"  driver fixes saved: {1 - sent / baseline:.1%}, messages saved counting advice: "
+          f"{1 - (sent + advice_messages) / baseline:.1%}")
+    print(f"  advice by kind: {reporting_policy.stats()['advised']}")
+
+
+# --- rider-side dead reckoning ------------------------------------------------
+
+def bench_predict(args):
+    import numpy as np
+    from deadreckon import DeadReckoner
+    from fleet import FleetStore
+    from geometry import RouteGeometry
+    from mapmatch import RouteMatcher
+    from route_cache import RouteCache
+    from geometry import haversine_m
+
+    rng = np.random.default_rng(0)
+    routes = RouteCache()
+    fleet = FleetStore(max_buses=args.buses * 2)
+    reckoner = DeadReckoner(fleet=fleet, routes=routes)
+    route_ids = [f"sim_route_{r}" for r in range(args.routes)]
+    for route_id in route_ids:
+        routes.put(route_id, RouteGeometry.from_coordinates(_traced_route(args.route_length // 5, noise=0.0)))
+    entries = [routes.get(route_id) for route_id in route_ids]
+    matchers = [RouteMatcher(entry.geometry, entry.profile) for entry in entries]
+
+    buses = [f"SIM {i:05d}" for i in range(args.buses)]
+    route_of = rng.integers(0, args.routes, args.buses)
+    length = np.array([entries[r].total_distance for r in route_of])
+    along = rng.uniform(0, 0.5, args.buses) * length
+    cruise = rng.uniform(4, 12, args.buses)
+    phase = rng.uniform(0, 2 * np.pi, args.buses)
+    next_fix = rng.uniform(0, args.fix_every, args.buses)
+    for bus, r in zip(buses, route_of):
+        fleet.register_bus(bus, route_ids[r])
+
+    def truth(i):
+        entry = entries[route_of[i]]
+        segment, fraction = entry.profile.locate(along[i])
+        lats, lons = np.frombuffer(entry.geometry.lats), np.frombuffer(entry.geometry.lons)
+        j = min(segment + 1, len(lats) - 1)
+        return lats[segment] + fraction * (lats[j] - lats[segment]), lons[segment] + fraction * (lons[j] - lons[segment])
+
+    t0 = time.time() - args.steps
+    held = {}
+    errors = {"last fix": [], "predicted": []}
+    jumps = {"last fix": [], "predicted": []}
+    shown = {}
+    tick_time = 0.0
+    for step in range(args.steps):
+        t = t0 + step
+        # Speeds wander between a crawl and cruise, like traffic
+        speed = cruise * (0.6 + 0.4 * np.sin(phase + step / 40.0))
+        along = np.minimum(along + speed, length)
+        for i in np.flatnonzero(next_fix <= step).tolist():
+            lat, lon = truth(i)
+            state = fleet.update(buses[i], lat, lon, t)
+            snap = matchers[route_of[i]].snap(lat, lon)
+            state.segment, state.along, state.cross_track = snap.segment, snap.along, snap.cross_track
+            reckoner.observe(state, float(speed[i]), None)
+            held[i] = (lat, lon)
+            next_fix[i] = step + args.fix_every
+        started = time.perf_counter()
+        reckoner.tick(t)
+        tick_time += time.perf_counter() - started
+        if step < args.fix_every:
+            continue
+        lat_p, lon_p = reckoner._state["lat"], reckoner._state["lon"]
+        for i in range(0, args.buses, max(args.buses // 500, 1)):
+            true_lat, true_lon = truth(i)
+            slot = reckoner._slots[buses[i]]
+            for name, (lat, lon) in (("last fix", held[i]), ("predicted", (lat_p[slot], lon_p[slot]))):
+                errors[name].append(haversine_m(lat, lon, true_lat, true_lon))
+                previous = shown.get((name, i))
+                if previous is not None:
+                    jumps[name].append(haversine_m(previous[0], previous[1], lat, lon))
+                shown[name, i] = (lat, lon)
+
+    print(f"buses={args.buses} routes={args.routes} fix every {args.fix_every}s, {args.steps} ticks")
+    print(f"  tick: {tick_time / args.steps * 1000:.2f} ms for {args.buses:,} buses "
+          f"({tick_time / args.steps / args.buses * 1e9:.0f} ns/bus)")
+    print(f"  {'marker':<10} {'error p50/p95 m':>17} {'step p95/max m':>16}")
+    for name in errors:
+        error, jump = np.array(errors[name]), np.array(jumps[name])
+        print(f"  {name:<10} {np.percentile(error, 50):>7.1f} / {np.percentile(error, 95):<7.1f} "
+              f"{np.percentile(jump, 95):>7.1f} / {jump.max():<7.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("broadcast", help="route fan-out with simulated riders")
+    p.add_argument("--subscribers", type=int, default=10_000)
+    p.add_argument("--buses", type=int, default=20)
+    p.add_argument("--updates", type=int, default=200)
+    p.add_argument("--slow-fraction", type=float, default=0.01)
+    p.set_defaults(func=bench_broadcast)
+
+    p = sub.add_parser("geometry", help="packed route geometry vs JSON list of dicts")
+    p.add_argument("--vertices", type=int, default=10_000)
+    p.add_argument("--repeat", type=int, default=50)
+    p.set_defaults(func=bench_geometry)
+
+    p = sub.add_parser("mapmatch", help="snap-to-route throughput")
+    p.add_argument("--vertices", type=int, default=60)
+    p.add_argument("--positions", type=int, default=10_000)
+    p.set_defaults(func=bench_mapmatch)
+
+    p = sub.add_parser("nearby", help="grid index vs linear scan for nearest buses")
+    p.add_argument("--buses", type=int, default=20_000)
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--radius", type=float, default=2000.0)
+    p.add_argument("--k", type=int, default=10)
+    p.add_argument("--cell-deg", type=float, default=0.01)
+    p.set_defaults(func=bench_nearby)
+
+    p = sub.add_parser("simplify", help="per-zoom route simplification: payload size and build time")
+    p.add_argument("--vertices", type=int, default=100_000)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--zooms", type=int, nargs="+", default=[8, 11, 13, 15, 17, 19])
+    p.set_defaults(func=bench_simplify)
+
+    p = sub.add_parser("codec", help="polyline / binary positions vs JSON: bytes on wire and encode cost")
+    p.add_argument("--vertices", type=int, default=20_000)
+    p.add_argument("--buses", type=int, default=2_000)
+    p.add_argument("--routes", type=int, default=50)
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(func=bench_codec)
+
+    p = sub.add_parser("gpsfilter", help="ingest smoothing: outliers caught, writes saved, per-fix cost")
+    p.add_argument("--buses", type=int, default=2_000)
+    p.add_argument("--steps", type=int, default=120)
+    p.add_argument("--noise", type=float, default=5.0, help="metres, one sigma")
+    p.add_argument("--outliers", type=float, default=0.01, help="fraction of fixes that jump 2 km")
+    p.add_argument("--parked", type=float, default=0.3, help="fraction of buses standing still")
+    p.set_defaults(func=bench_gpsfilter)
+
+    p = sub.add_parser("driverws", help="driver ingest: JSON text frames vs bus-fix.v1 binary frames, fixes/s on one core")
+    p.add_argument("--buses", type=int, default=1_000)
+    p.add_argument("--steps", type=int, default=30)
+    p.add_argument("--fixes-per-frame", type=int, default=32)
+    p.add_argument("--repeat", type=int, default=5, help="runs per path; the fastest is reported")
+    p.set_defaults(func=bench_driverws)
+
+    p = sub.add_parser("reporting", help="adaptive driver reporting: messages saved and marker error near stops")
+    p.add_argument("--buses", type=int, default=200)
+    p.add_argument("--synthetic", type=int, default=0, help="simulate this many generated routes, not the seeded demo routes")
+    p.add_argument("--route-length", type=int, default=8_000, help="metres, for --synthetic routes")
+    p.add_argument("--stop-spacing", type=float, default=400.0, help="metres")
+    p.add_argument("--steps", type=int, default=1_200, help="seconds simulated")
+    p.add_argument("--cruise", type=float, default=8.0, help="m/s")
+    p.add_argument("--dwell", type=float, default=20.0, help="seconds at each stop")
+    p.add_argument("--layover", type=float, default=300.0, help="seconds at the terminus")
+    p.add_argument("--parked", type=float, default=0.2, help="fraction of buses out of service all run")
+    p.add_argument("--noise", type=float, default=3.0, help="metres of GPS error, one sigma")
+    p.add_argument("--noise-corr", type=float, default=0.9, help="correlation of GPS error from one second to the next")
+    p.add_argument("--load", type=float, default=0.0, help="simulated ingest load, 0..1")
+    p.set_defaults(func=bench_reporting)
+
+    p = sub.add_parser("predict", help="dead-reckoned rider markers: error vs last fix, tick cost for the whole fleet")
+    p.add_argument("--buses", type=int, default=20_000)
+    p.add_argument("--routes", type=int, default=200)
+    p.add_argument("--route-length", type=int, default=10_000, help="metres")
+    p.add_argument("--fix-every", type=int, default=8, help="seconds between driver fixes")
+    p.add_argument("--steps", type=int, default=120)
+    p.set_defaults(func=bench_predict)
+
+    args = parser.parse_args()
+    random.seed(0)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# broadcast.py
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import BROADCAST_MAX_PENDING, BROADCAST_MAX_LAG
+
+
+class ChannelStats:
+    """Counters for one route channel."""
+    __slots__ = ("published", "delivered", "dropped", "slow_disconnects",
+                 "send_latency_total", "send_latency_max")
+
+    def __init__(self):
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.slow_disconnects = 0
+        self.send_latency_total = 0.0
+        self.send_latency_max = 0.0
+
+    def record_send(self, latency: float) -> None:
+        self.delivered += 1
+        self.send_latency_total += latency
+        if latency > self.send_latency_max:
+            self.send_latency_max = latency
+
+
+class Subscriber:
+    """Bounded mailbox for one rider connection.
+
+    Frames are keyed (by bus_number for position updates), so a newer frame
+    for the same bus replaces the one still waiting instead of queueing
+    behind it. When the mailbox is full the oldest frame is dropped. A
+    subscriber that keeps losing frames for longer than `max_lag` seconds is
+    closed by the hub, which also cancels a send the rider has stopped
+    reading.
+    """
+    __slots__ = ("route_id", "max_pending", "max_lag", "stats", "closed",
+                 "_pending", "_ready", "_behind_since", "_seq", "_sending")
+
+    def __init__(self, route_id: str, stats: ChannelStats,
+                 max_pending: int = BROADCAST_MAX_PENDING, max_lag: float = BROADCAST_MAX_LAG):
+        self.route_id = route_id
+        self.max_pending = max_pending
+        self.max_lag = max_lag
+        self.stats = stats
+        self.closed = False
+        self._pending: "OrderedDict[object, Tuple[str, float]]" = OrderedDict()
+        self._ready = asyncio.Event()
+        self._behind_since: Optional[float] = None
+        self._seq = 0
+        self._sending: Optional[asyncio.Task] = None
+
+    def offer(self, key: Optional[str], frame: str, now: float) -> bool:
+        """Queues a frame; returns False if the subscriber should be dropped."""
+        if key is None:
+            # Unkeyed frames are never coalesced
+            self._seq += 1
+            key = self._seq
+        lost = False
+        if key in self._pending:
+            del self._pending[key]
+            lost = True
+        elif len(self._pending) >= self.max_pending:
+            self._pending.popitem(last=False)
+            lost = True
+        self._pending[key] = (frame, now)
+        self._ready.set()
+
+        if lost:
+            self.stats.dropped += 1
+            if self._behind_since is None:
+                self._behind_since = now
+            elif now - self._behind_since > self.max_lag:
+                return False
+        return True
+
+    async def next_frames(self) -> List[Tuple[str, float]]:
+        """Waits for and takes every pending frame; empty once closed."""
+        while not self._pending and not self.closed:
+            self._ready.clear()
+            await self._ready.wait()
+        if self.closed:
+            return []
+        frames = list(self._pending.values())
+        self._pending.clear()
+        self._behind_since = None
+        return frames
+
+    def close(self) -> None:
+        self.closed = True
+        self._pending.clear()
+        self._ready.set()
+        if self._sending is not None:
+            self._sending.cancel()
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+
+class RouteHub:
+    """Fans out bus position updates to riders subscribed to a route.
+
+    Publishing never awaits: each frame is serialized once and offered to
+    every subscriber's mailbox, so a slow rider cannot stall ingest or other
+    riders.
+    """
+
+    def __init__(self, max_pending: int = BROADCAST_MAX_PENDING, max_lag: float = BROADCAST_MAX_LAG):
+        self.max_pending = max_pending
+        self.max_lag = max_lag
+        self._channels: Dict[str, Set[Subscriber]] = {}
+        self._stats: Dict[str, ChannelStats] = {}
+
+    def subscribe(self, route_id: str) -> Subscriber:
+        stats = self._stats.setdefault(route_id, ChannelStats())
+        subscriber = Subscriber(route_id, stats, self.max_pending, self.max_lag)
+        self._channels.setdefault(route_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscribers = self._channels.get(subscriber.route_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._channels[subscriber.route_id]
+
+    def publish(self, route_id: str, message: dict, key: Optional[str] = None) -> int:
+        """Offers a message to every subscriber of the route; returns the fan-out."""
+        subscribers = self._channels.get(route_id)
+        if not subscribers:
+            return 0
+        stats = self._stats[route_id]
+        stats.published += 1
+        frame = json.dumps(message)
+        now = time.monotonic()
+        slow = [s for s in subscribers if not s.offer(key, frame, now)]
+        for subscriber in slow:
+            stats.slow_disconnects += 1
+            subscriber.close()
+            subscribers.discard(subscriber)
+        return len(subscribers)
+
+    async def pump(self, subscriber: Subscriber, send) -> None:
+        """Sends queued frames through `send(text)` until the subscriber is closed."""
+        stats = subscriber.stats
+        while True:
+            frames = await subscriber.next_frames()
+            if not frames:
+                return
+            for frame, queued_at in frames:
+                subscriber._sending = asyncio.current_task()
+                try:
+                    await send(frame)
+                except asyncio.CancelledError:
+                    if subscriber.closed:
+                        # Dropped by publish while this send was stuck behind the rider
+                        return
+                    raise
+                finally:
+                    subscriber._sending = None
+                stats.record_send(time.monotonic() - queued_at)
+
+    def subscriber_count(self, route_id: str) -> int:
+        return len(self._channels.get(route_id, ()))
+
+    def stats(self) -> dict:
+        channels = {}
+        for route_id, stats in self._stats.items():
+            channels[route_id] = {
+                "subscribers": self.subscriber_count(route_id),
+                "published": stats.published,
+                "delivered": stats.delivered,
+                "dropped": stats.dropped,
+                "slow_disconnects": stats.slow_disconnects,
+                "avg_send_latency_ms": round(stats.send_latency_total / stats.delivered * 1000, 3) if stats.delivered else 0.0,
+                "max_send_latency_ms": round(stats.send_latency_max * 1000, 3),
+            }
+        return {"max_pending": self.max_pending, "max_lag": self.max_lag, "channels": channels}
+
+
+route_hub = RouteHub()
@@ -0,0 +1,270 @@
+# codec.py
+import struct
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+POLYLINE_MEDIA_TYPE = "application/vnd.polyline"
+POSITIONS_MEDIA_TYPE = "application/vnd.bus-positions"
+FIX_SUBPROTOCOL = "bus-fix.v1"
+FIX_MEDIA_TYPE = "application/vnd.bus-fix"  # bus-fix.v1 fix frames, back to back, as an HTTP body
+
+POLYLINE_PRECISION = 5  # Google encoded polyline: 1e-5 degrees, ~1.1 m
+POSITION_SCALE = 1_000_000  # bus positions: 1e-6 degrees, ~11 cm
+_POSITIONS_MAGIC = b"BPv1"
+
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def _chunked(values: np.ndarray, bits: int, continuation: int, offset: int) -> bytes:
+    """Little-endian base-2**bits groups, continuation bit on all but the last.
+
+    The shared core of encoded polylines (5-bit groups offset by 63) and
+    LEB128 varints (7-bit groups), done for a whole array at once.
+    """
+    if len(values) == 0:
+        return b""
+    width = max(int(values.max()).bit_length(), 1)
+    groups = -(-width // bits)
+    shifts = np.arange(groups, dtype=np.uint64) * np.uint64(bits)
+    parts = (values[:, None] >> shifts[None, :]) & np.uint64((1 << bits) - 1)
+    more = np.zeros(parts.shape, dtype=bool)
+    more[:, :-1] = (values[:, None] >> shifts[None, 1:]) != 0
+    parts[more] |= np.uint64(continuation)
+    parts += np.uint64(offset)
+    # Group 0 is always written; later ones only while the previous says "more"
+    keep = np.ones(parts.shape, dtype=bool)
+    keep[:, 1:] = more[:, :-1]
+    return parts[keep].astype(np.uint8).tobytes()
+
+
+def _read_chunked(data: bytes, pos: int, bits: int, continuation: int, offset: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        b = data[pos] - offset
+        pos += 1
+        result |= (b & ((1 << bits) - 1)) << shift
+        shift += bits
+        if not b & continuation:
+            return result, pos
+
+
+def _unzigzag(value: int) -> int:
+    return ~(value >> 1) if value & 1 else value >> 1
+
+
+# --- Google encoded polyline -------------------------------------------------
+
+def encode_polyline(lats, lons, precision: int = POLYLINE_PRECISION) -> bytes:
+    """Google encoded polyline of a lat/lon sequence, as ASCII bytes."""
+    factor = 10 ** precision
+    # Round absolute positions before differencing so error never accumulates
+    lat = np.round(np.asarray(lats, dtype=np.float64) * factor).astype(np.int64)
+    lon = np.round(np.asarray(lons, dtype=np.float64) * factor).astype(np.int64)
+    deltas = np.empty(2 * len(lat), dtype=np.int64)
+    deltas[0::2] = np.diff(lat, prepend=0)
+    deltas[1::2] = np.diff(lon, prepend=0)
+    return _chunked(_zigzag(deltas), 5, 0x20, 63)
+
+
+def decode_polyline(encoded, precision: int = POLYLINE_PRECISION) -> List[Tuple[float, float]]:
+    """Inverse of encode_polyline; returns (lat, lon) pairs."""
+    data = encoded.encode() if isinstance(encoded, str) else encoded
+    factor = 10 ** precision
+    points = []
+    pos = lat = lon = 0
+    while pos < len(data):
+        value, pos = _read_chunked(data, pos, 5, 0x20, 63)
+        lat += _unzigzag(value)
+        value, pos = _read_chunked(data, pos, 5, 0x20, 63)
+        lon += _unzigzag(value)
+        points.append((lat / factor, lon / factor))
+    return points
+
+
+# --- binary position snapshots -----------------------------------------------
+
+def encode_varint(value: int) -> bytes:
+    """Unsigned LEB128 varint, as used by protobuf."""
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _string(value) -> bytes:
+    raw = str(value).encode()
+    return encode_varint(len(raw)) + raw
+
+
+def encode_positions(snapshot: Dict[str, List[dict]]) -> bytes:
+    """Packs `{route_id: [{"bus_number", "current_lat", "current_lon"}]}`.
+
+    Layout: b"BPv1", varint route count, then per route its id and bus
+    count, then every bus number, then all latitudes, then all longitudes.
+    Strings are varint length + UTF-8. Coordinates are scaled to integer
+    micro-degrees and delta-encoded bus to bus as zigzag varints, so buses
+    in one city cost a few bytes each. Buses without a position are left out.
+    """
+    header = [_POSITIONS_MAGIC, encode_varint(len(snapshot))]
+    names = []
+    lats = []
+    lons = []
+    for route_id, buses in snapshot.items():
+        located = [bus for bus in buses if bus["current_lat"] is not None and bus["current_lon"] is not None]
+        header.append(_string(route_id))
+        header.append(encode_varint(len(located)))
+        for bus in located:
+            names.append(_string(bus["bus_number"]))
+            lats.append(bus["current_lat"])
+            lons.append(bus["current_lon"])
+    lat = np.round(np.asarray(lats, dtype=np.float64) * POSITION_SCALE).astype(np.int64)
+    lon = np.round(np.asarray(lons, dtype=np.float64) * POSITION_SCALE).astype(np.int64)
+    return b"".join(header + names) + _chunked(_zigzag(np.diff(lat, prepend=0)), 7, 0x80, 0) \
+        + _chunked(_zigzag(np.diff(lon, prepend=0)), 7, 0x80, 0)
+
+
+def decode_positions(data: bytes) -> Dict[str, List[dict]]:
+    """Inverse of encode_positions."""
+    if data[:4] != _POSITIONS_MAGIC:
+        raise ValueError("Not a bus position snapshot")
+    pos = 4
+
+    def varint() -> int:
+        nonlocal pos
+        value, pos = _read_chunked(data, pos, 7, 0x80, 0)
+        return value
+
+    def string() -> str:
+        nonlocal pos
+        length = varint()
+        pos += length
+        return data[pos - length:pos].decode()
+
+    routes = [(string(), varint()) for _ in range(varint())]
+    total = sum(count for _, count in routes)
+    names = [string() for _ in range(total)]
+    columns = []
+    for _ in range(2):
+        value = 0
+        column = []
+        for _ in range(total):
+            value += _unzigzag(varint())
+            column.append(value / POSITION_SCALE)
+        columns.append(column)
+    if pos != len(data):
+        raise ValueError("Trailing bytes in bus position snapshot")
+
+    snapshot = {}
+    i = 0
+    for route_id, count in routes:
+        snapshot[route_id] = [
+            {"bus_number": names[j], "current_lat": columns[0][j], "current_lon": columns[1][j]}
+            for j in range(i, i + count)
+        ]
+        i += count
+    return snapshot
+
+
+# --- driver fix frames (bus-fix.v1 WebSocket subprotocol) ---------------------
+
+FIX_FRAME = 0x01
+ACK_FRAME = 0x02
+RATE_FRAME = 0x03
+_FIX_HEADER = struct.Struct("<BBHHI")  # version, frame type, bus count, fix count, sequence number
+_ACK = struct.Struct("<BBIII")  # version, frame type, sequence acked, fixes accepted, fixes rejected
+_RATE = struct.Struct("<BBHH")  # version, frame type, reporting interval in 0.1 s, dead-band in 0.1 m
+_FIX_VERSION = 1
+UNKNOWN_U16 = 0xFFFF
+
+# One fix: index into the frame's bus table, unix time in ms, lat/lon in
+# micro-degrees, speed in cm/s and heading in centi-degrees (0xFFFF: unknown)
+FIX_DTYPE = np.dtype([("bus", "<u2"), ("ts_ms", "<u8"), ("lat", "<i4"), ("lon", "<i4"),
+                      ("speed", "<u2"), ("heading", "<u2")])
+
+
+def encode_fix_frame(seq: int, bus_numbers: Sequence[str], fixes: np.ndarray) -> bytes:
+    """Packs a FIX_DTYPE array and the bus table its `bus` field indexes."""
+    table = b"".join(len(raw).to_bytes(1, "little") + raw for raw in (str(b).encode() for b in bus_numbers))
+    return _FIX_HEADER.pack(_FIX_VERSION, FIX_FRAME, len(bus_numbers), len(fixes), seq) + table \
+        + np.ascontiguousarray(fixes, dtype=FIX_DTYPE).tobytes()
+
+
+def _decode_fix_frame_at(data: bytes, pos: int) -> Tuple[int, List[str], np.ndarray, int]:
+    if len(data) - pos < _FIX_HEADER.size:
+        raise ValueError("Truncated fix frame")
+    version, kind, bus_count, fix_count, seq = _FIX_HEADER.unpack_from(data, pos)
+    if version != _FIX_VERSION or kind != FIX_FRAME:
+        raise ValueError(f"Unsupported frame version {version} type {kind}")
+    pos += _FIX_HEADER.size
+    bus_numbers = []
+    for _ in range(bus_count):
+        if pos >= len(data):
+            raise ValueError("Truncated bus table")
+        length = data[pos]
+        bus_numbers.append(data[pos + 1:pos + 1 + length].decode())
+        pos += 1 + length
+    end = pos + fix_count * FIX_DTYPE.itemsize
+    if end > len(data):
+        raise ValueError(f"Expected {fix_count} fixes, got {len(data) - pos} bytes")
+    return seq, bus_numbers, np.frombuffer(data, dtype=FIX_DTYPE, count=fix_count, offset=pos), end
+
+
+def decode_fix_frame(data: bytes) -> Tuple[int, List[str], np.ndarray]:
+    """Returns (seq, bus table, FIX_DTYPE records); raises ValueError on a malformed frame.
+
+    Records are a zero-copy view over `data`; only the structure is checked
+    here, field values are validated by the caller in bulk.
+    """
+    seq, bus_numbers, records, end = _decode_fix_frame_at(data, 0)
+    if end != len(data):
+        raise ValueError(f"Expected {len(records)} fixes, got {len(data) - end} trailing bytes")
+    return seq, bus_numbers, records
+
+
+def decode_fix_frames(data: bytes) -> Tuple[List[str], np.ndarray]:
+    """Decodes back-to-back fix frames into one bus table and one FIX_DTYPE array.
+
+    A frame holds at most 65535 fixes, so larger uploads are several frames;
+    their bus tables are merged and the `bus` fields re-indexed to match.
+    """
+    index: Dict[str, int] = {}
+    parts = []
+    pos = 0
+    while pos < len(data):
+        _, bus_numbers, records, pos = _decode_fix_frame_at(data, pos)
+        # Out-of-range indexes map to UNKNOWN_U16, which the caller rejects
+        remap = np.array([index.setdefault(bus, len(index)) for bus in bus_numbers] + [UNKNOWN_U16], dtype=np.uint16)
+        records = records.copy()
+        records["bus"] = remap[np.minimum(records["bus"], len(bus_numbers))]
+        parts.append(records)
+    return list(index), np.concatenate(parts) if parts else np.zeros(0, dtype=FIX_DTYPE)
+
+
+def encode_ack(seq: int, accepted: int, rejected: int) -> bytes:
+    """Cumulative ack: every frame up to `seq` was processed."""
+    return _ACK.pack(_FIX_VERSION, ACK_FRAME, seq, accepted, rejected)
+
+
+def decode_ack(data: bytes) -> Tuple[int, int, int]:
+    version, kind, seq, accepted, rejected = _ACK.unpack(data)
+    if version != _FIX_VERSION or kind != ACK_FRAME:
+        raise ValueError(f"Unsupported frame version {version} type {kind}")
+    return seq, accepted, rejected
+
+
+def encode_rate(interval: float, deadband: float) -> bytes:
+    """Server-to-driver reporting advice: report at least every `interval` s, early after `deadband` m."""
+    return _RATE.pack(_FIX_VERSION, RATE_FRAME, min(round(interval * 10), 0xFFFF), min(round(deadband * 10), 0xFFFF))
+
+
+def decode_rate(data: bytes) -> Tuple[float, float]:
+    version, kind, interval, deadband = _RATE.unpack(data)
+    if version != _FIX_VERSION or kind != RATE_FRAME:
+        raise ValueError(f"Unsupported frame version {version} type {kind}")
+    return interval / 10, deadband / 10
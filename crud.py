@@ -1,10 +1,13 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
-from sqlalchemy import func
-from models import User, BusLocation, RouteInfo
+from sqlalchemy import func, or_, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from models import User, BusLocation, BusLocationHistory, RouteInfo
 from schemas import UserCreate, LocationUpdate, RouteDataSubmit
-from typing import List
+from typing import AsyncIterator, List, Optional, Tuple
+from datetime import datetime, timedelta
+from geometry import RouteGeometry
 
 
 async def create_bus_driver(db: AsyncSession, user: UserCreate) -> User:
@@ -34,6 +37,140 @@ async def update_bus_location(db: AsyncSession, location: LocationUpdate) -> Bus
     await db.refresh(db_location)
     return db_location
 
+
+async def bulk_upsert_bus_locations(db: AsyncSession, rows: List[dict]) -> int:
+    """Upserts many bus locations in one statement, keyed on bus_number."""
+    if not rows:
+        return 0
+    stmt = pg_insert(BusLocation).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[BusLocation.bus_number],
+        set_={
+            "current_lat": stmt.excluded.current_lat,
+            "current_lon": stmt.excluded.current_lon,
+            "last_updated": stmt.excluded.last_updated,
+        },
+    )
+    await db.execute(stmt)
+    await db.commit()
+    return len(rows)
+
+async def insert_location_history(db: AsyncSession, rows: List[dict]) -> int:
+    """Appends fixes to bus_location_history; a repeated (bus_number, ts) is skipped."""
+    if not rows:
+        return 0
+    # executemany: SQLAlchemy batches the rows into multi-row INSERTs
+    stmt = pg_insert(BusLocationHistory).on_conflict_do_nothing(
+        index_elements=[BusLocationHistory.bus_number, BusLocationHistory.ts]
+    )
+    await db.execute(stmt, rows)
+    await db.commit()
+    return len(rows)
+
+
+async def merge_location_history(db: AsyncSession, columns: dict) -> int:
+    """Merges column lists of fixes into bus_location_history in one statement.
+
+    Rows whose (bus_number, ts) is already stored are skipped; returns the
+    number actually inserted.
+    """
+    if not columns["ts"]:
+        return 0
+    result = await db.execute(text(
+        "INSERT INTO bus_location_history (bus_number, ts, lat, lon, speed, heading) "
+        "SELECT * FROM unnest(CAST(:bus_number AS varchar[]), CAST(:ts AS timestamp[]), "
+        "CAST(:lat AS float8[]), CAST(:lon AS float8[]), CAST(:speed AS float8[]), CAST(:heading AS float8[])) "
+        "ON CONFLICT (bus_number, ts) DO NOTHING"
+    ), columns)
+    await db.commit()
+    return result.rowcount
+
+
+async def get_bus_location_history(db: AsyncSession, bus_number: str, since: datetime,
+                                   until: Optional[datetime] = None) -> List[tuple]:
+    """Retrieves (ts, lat, lon, speed, heading) for one bus in a time window, oldest first."""
+    stmt = (
+        select(BusLocationHistory.ts, BusLocationHistory.lat, BusLocationHistory.lon,
+               BusLocationHistory.speed, BusLocationHistory.heading)
+        .filter(BusLocationHistory.bus_number == bus_number, BusLocationHistory.ts >= since)
+        .order_by(BusLocationHistory.ts)
+    )
+    if until is not None:
+        stmt = stmt.filter(BusLocationHistory.ts < until)
+    result = await db.execute(stmt)
+    return result.all()
+
+_HISTORY_COLUMNS = (BusLocationHistory.ts, BusLocationHistory.lat, BusLocationHistory.lon,
+                    BusLocationHistory.speed, BusLocationHistory.heading)
+_EPOCH = datetime(1970, 1, 1)
+
+def _history_bucket_start(ts: datetime, step: float) -> datetime:
+    """Start of the epoch-aligned `step`-second bucket holding ts."""
+    seconds = (ts - _EPOCH).total_seconds()
+    return _EPOCH + timedelta(seconds=seconds - seconds % step)
+
+async def stream_bus_location_history(db: AsyncSession, bus_number: str, since: datetime, until: datetime,
+                                      step: Optional[float] = None,
+                                      batch_size: int = 1000) -> AsyncIterator[List[tuple]]:
+    """Yields (ts, lat, lon, speed, heading) rows in batches through a server-side cursor.
+
+    With `step`, only the first fix of each epoch-aligned step-second bucket
+    is returned; the thinning happens in the database, in index order.
+    """
+    window = (BusLocationHistory.bus_number == bus_number,
+              BusLocationHistory.ts >= since, BusLocationHistory.ts < until)
+    if step:
+        bucket = func.floor(func.extract("epoch", BusLocationHistory.ts) / step)
+        inner = (
+            select(*_HISTORY_COLUMNS, bucket.label("bucket"),
+                   func.lag(bucket).over(order_by=BusLocationHistory.ts).label("previous"))
+            .filter(*window)
+            .subquery()
+        )
+        stmt = (
+            select(inner.c.ts, inner.c.lat, inner.c.lon, inner.c.speed, inner.c.heading)
+            .filter(or_(inner.c.previous.is_(None), inner.c.previous != inner.c.bucket))
+            .order_by(inner.c.ts)
+        )
+    else:
+        stmt = select(*_HISTORY_COLUMNS).filter(*window).order_by(BusLocationHistory.ts)
+    result = await db.stream(stmt.execution_options(yield_per=batch_size))
+    async for rows in result.partitions():
+        yield rows
+
+async def _seek_location_history(db: AsyncSession, bus_number: str, condition, descending: bool = False):
+    stmt = (
+        select(*_HISTORY_COLUMNS)
+        .filter(BusLocationHistory.bus_number == bus_number, condition)
+        .order_by(BusLocationHistory.ts.desc() if descending else BusLocationHistory.ts)
+        .limit(1)
+    )
+    return (await db.execute(stmt)).first()
+
+async def get_bus_location_bracket(db: AsyncSession, bus_number: str, at: datetime,
+                                   step: Optional[float] = None) -> Tuple[Optional[tuple], Optional[tuple]]:
+    """Returns the fixes at or before and after `at`, each found by a single index seek.
+
+    With `step`, only bucket-first fixes count, matching what
+    stream_bus_location_history returns for the same step.
+    """
+    ts = BusLocationHistory.ts
+    if not step:
+        before = await _seek_location_history(db, bus_number, ts <= at, descending=True)
+        after = await _seek_location_history(db, bus_number, ts > at)
+        return before, after
+    start = _history_bucket_start(at, step)
+    first = await _seek_location_history(db, bus_number, ts >= start)
+    if first is not None and first.ts <= at:
+        after = await _seek_location_history(db, bus_number, ts >= start + timedelta(seconds=step))
+        return first, after
+    # Nothing in at's bucket before at: step back to the first fix of the last earlier bucket
+    last = await _seek_location_history(db, bus_number, ts < start, descending=True)
+    if last is None:
+        return None, first
+    before = await _seek_location_history(db, bus_number, ts >= _history_bucket_start(last.ts, step))
+    return before, first
+
 async def create_route_data(db: AsyncSession, route_data: RouteDataSubmit) -> RouteInfo:
     """Creates or updates route data in the database."""
     result = await db.execute(select(RouteInfo).filter(RouteInfo.route_id == route_data.route_id))
@@ -64,15 +201,20 @@ async def create_route_data(db: AsyncSession, route_data: RouteDataSubmit) -> Ro
         await db.refresh(db_route)
         return db_route
 
+async def get_route_geometry(db: AsyncSession, route_id: str) -> Optional[RouteGeometry]:
+    """Retrieves a route's packed geometry from the database."""
+    result = await db.execute(
+        select(RouteInfo.geometry, RouteInfo.coordinates).filter(RouteInfo.route_id == route_id)
+    )
+    row = result.one_or_none()
+    if row is None:
+        return None
+    return RouteGeometry.from_row(row.geometry, row.coordinates)
+
 async def get_route_coordinates(db: AsyncSession, route_id: str) -> List[dict]:
     """Retrieves route coordinates from the database."""
-    result = await db.execute(select(RouteInfo).filter(RouteInfo.route_id == route_id))
-    route = result.scalar_one_or_none()
-    
-    if route:
-        return route.coordinates
-    else:
-        return []
+    geometry = await get_route_geometry(db, route_id)
+    return geometry.to_coordinates() if geometry else []
 
 async def get_route_info(db: AsyncSession, route_id: int) -> dict:
     """Retrieves route information including buses and route details."""
@@ -82,8 +224,15 @@ async def get_route_info(db: AsyncSession, route_id: int) -> dict:
     route = result.scalar_one_or_none()
 
     if route:
+        # route_cache imports crud, so it is resolved at call time
+        from route_cache import route_cache
+
         bus_numbers = [user.bus_number for user in route.users]
-        total_distance = 0.0  # Placeholder, calculate if needed
+        entry = route_cache.get(route.route_id)
+        if entry is None:
+            geometry = route.route_geometry()
+            entry = route_cache.put(route.route_id, geometry) if geometry else None
+        total_distance = entry.total_distance if entry else 0.0
 
         return {
             "route_id": route.route_id,
@@ -98,22 +247,50 @@ async def get_route_info(db: AsyncSession, route_id: int) -> dict:
 
 async def get_bus_locations_on_route(db: AsyncSession, route_id: str) -> List[dict]:
     """Retrieves bus locations for a given route."""
-    result = await db.execute(select(User).filter(User.route_id == route_id))
-    users = result.scalars().all()
-
-    bus_locations = []
-    for user in users:
-        location_result = await db.execute(
-            select(BusLocation)
-            .filter(BusLocation.bus_number == user.bus_number)
-            .order_by(BusLocation.last_updated.desc()) #Corrected to last_updated
-            .limit(1)
-        )
-        location = location_result.scalar_one_or_none()
-        if location:
-            bus_locations.append({
-                "bus_number": location.bus_number,
-                "current_lat": location.current_lat,
-                "current_lon": location.current_lon,
-            })
-    return bus_locations
\ No newline at end of file
+    # bus_locations holds one row per bus (unique bus_number), so a plain join
+    # yields each bus's latest position in a single query
+    result = await db.execute(
+        select(BusLocation.bus_number, BusLocation.current_lat, BusLocation.current_lon)
+        .join(User, User.bus_number == BusLocation.bus_number)
+        .filter(User.route_id == route_id)
+    )
+    return [
+        {"bus_number": bus_number, "current_lat": lat, "current_lon": lon}
+        for bus_number, lat, lon in result.all()
+    ]
+
+
+async def get_bus_locations_on_routes(db: AsyncSession, route_ids: List[str]) -> dict:
+    """Retrieves bus locations for many routes at once, grouped by route_id."""
+    result = await db.execute(
+        select(User.route_id, BusLocation.bus_number, BusLocation.current_lat, BusLocation.current_lon)
+        .join(User, User.bus_number == BusLocation.bus_number)
+        .filter(User.route_id.in_(route_ids))
+    )
+    snapshot = {route_id: [] for route_id in route_ids}
+    for route_id, bus_number, lat, lon in result.all():
+        snapshot[route_id].append({"bus_number": bus_number, "current_lat": lat, "current_lon": lon})
+    return snapshot
+
+
+async def get_bus_route_assignment(db: AsyncSession, bus_number: str) -> Optional[tuple]:
+    """Retrieves (bus_number, route_id) for one registered bus, or None."""
+    result = await db.execute(select(User.bus_number, User.route_id).filter(User.bus_number == bus_number))
+    return result.first()
+
+async def get_bus_route_assignments(db: AsyncSession) -> List[tuple]:
+    """Retrieves (bus_number, route_id) for every registered bus."""
+    result = await db.execute(select(User.bus_number, User.route_id))
+    return result.all()
+
+
+async def get_all_bus_locations(db: AsyncSession) -> List[BusLocation]:
+    """Retrieves the latest stored location of every bus."""
+    result = await db.execute(select(BusLocation))
+    return result.scalars().all()
+
+
+async def get_all_route_geometries(db: AsyncSession) -> List[tuple]:
+    """Retrieves (route_id, RouteGeometry) for every route."""
+    result = await db.execute(select(RouteInfo.route_id, RouteInfo.geometry, RouteInfo.coordinates))
+    return [(row.route_id, RouteGeometry.from_row(row.geometry, row.coordinates)) for row in result.all()]
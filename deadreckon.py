@@ -0,0 +1,311 @@
+# deadreckon.py
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+from broadcast import RouteHub, route_hub
+from config import (PREDICT_BLEND, PREDICT_HORIZON, PREDICT_MAX_CROSS_TRACK, PREDICT_SNAP_DISTANCE,
+                    PREDICT_TICK_INTERVAL)
+from fleet import BusState, FleetStore, fleet_store
+from route_cache import RouteCache, RouteEntry, route_cache
+
+logger = logging.getLogger(__name__)
+
+_FIELDS = ("along0", "speed", "t0", "offset", "lat0", "lon0", "heading0", "lat", "lon", "heading")
+
+
+def predicted_channel(route_id: str) -> str:
+    """route_hub channel carrying a route's predicted positions, apart from its raw fixes."""
+    return f"predicted:{route_id}"
+
+
+class DeadReckoner:
+    """Extrapolates every bus along its route polyline between fixes.
+
+    Each fix anchors the bus at its distance along the route with its last
+    speed. A tick then moves all buses at once: anchor plus speed times the
+    time since the fix, capped at `horizon` seconds, plus a correction that
+    fades out over `blend` seconds so the marker glides from where it was
+    predicted to where the bus reported instead of jumping. All route
+    polylines are concatenated, each shifted past the previous one's end, so
+    one searchsorted places the whole fleet. Buses without a route, or
+    more than `max_cross_track` metres off it, stay where they reported.
+    """
+
+    def __init__(self, fleet: FleetStore = fleet_store, routes: RouteCache = route_cache, hub: RouteHub = route_hub,
+                 horizon: float = PREDICT_HORIZON, blend: float = PREDICT_BLEND,
+                 snap_distance: float = PREDICT_SNAP_DISTANCE, max_cross_track: float = PREDICT_MAX_CROSS_TRACK,
+                 interval: float = PREDICT_TICK_INTERVAL, capacity: int = 1024):
+        self.fleet = fleet
+        self.routes = routes
+        self.hub = hub
+        self.horizon = horizon
+        self.blend = blend
+        self.snap_distance = snap_distance
+        self.max_cross_track = max_cross_track
+        self.interval = interval
+
+        self._slots: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._bus_numbers: List[Optional[str]] = [None] * capacity
+        self._state = {name: np.full(capacity, np.nan) for name in _FIELDS}
+        self._route = np.full(capacity, -1, dtype=np.int64)  # index into _route_ids; -1 holds the raw fix
+        self._by_route: Dict[str, Set[int]] = {}
+
+        # Concatenated polylines, rebuilt when the route cache changes
+        self._route_ids: List[str] = []
+        self._route_index: Dict[str, int] = {}
+        self._dirty = True
+        self._base = self._length = self._first = self._last = np.zeros(0)
+        self._cum = self._lats = self._lons = self._seg_heading = np.zeros(0)
+        routes.on_change(self._route_changed)
+
+        self._task: Optional[asyncio.Task] = None
+        self.last_tick = 0.0
+        self.ticks = 0
+        self.frames = 0
+        self.last_tick_ms = 0.0
+        self.max_tick_ms = 0.0
+
+    # --- route polylines --------------------------------------------------
+
+    def _route_changed(self, route_id: str, entry: Optional[RouteEntry]) -> None:
+        self._dirty = True
+
+    def _route_number(self, route_id: str) -> int:
+        number = self._route_index.get(route_id)
+        if number is None:
+            number = self._route_index[route_id] = len(self._route_ids)
+            self._route_ids.append(route_id)
+            self._dirty = True
+        return number
+
+    def _rebuild(self) -> None:
+        n = len(self._route_ids)
+        self._base = np.zeros(n)
+        self._length = np.zeros(n)
+        self._first = np.zeros(n, dtype=np.int64)
+        self._last = np.full(n, -1, dtype=np.int64)  # last segment index; -1 when the route isn't loaded
+        cums, lats, lons = [], [], []
+        offset, count = 0.0, 0
+        for number, route_id in enumerate(self._route_ids):
+            entry = self.routes.get(route_id)
+            if entry is None or len(entry.geometry) < 2:
+                continue
+            cum = entry.profile.cum
+            self._base[number] = offset
+            self._length[number] = cum[-1]
+            self._first[number] = count
+            self._last[number] = count + len(cum) - 2
+            cums.append(cum + offset)
+            lats.append(np.frombuffer(entry.geometry.lats))
+            lons.append(np.frombuffer(entry.geometry.lons))
+            # A 1 km gap keeps a clamped position from resolving into the next route
+            offset += float(cum[-1]) + 1000.0
+            count += len(cum)
+        self._cum = np.concatenate(cums) if cums else np.zeros(0)
+        self._lats = np.concatenate(lats) if lats else np.zeros(0)
+        self._lons = np.concatenate(lons) if lons else np.zeros(0)
+        # Bearing of each vertex to the next; the entry at a route's last vertex is never read
+        dlat = np.diff(self._lats, append=np.nan)
+        dlon = np.diff(self._lons, append=np.nan) * np.cos(np.radians(self._lats))
+        self._seg_heading = np.degrees(np.arctan2(dlon, dlat)) % 360.0
+        self._dirty = False
+
+    # --- per-bus anchors --------------------------------------------------
+
+    def _slot(self, bus_number: str) -> int:
+        slot = self._slots.get(bus_number)
+        if slot is not None:
+            return slot
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._slots)
+            capacity = len(self._route)
+            if slot >= capacity:
+                for name, column in self._state.items():
+                    self._state[name] = np.concatenate((column, np.full(capacity, np.nan)))
+                self._route = np.concatenate((self._route, np.full(capacity, -1, dtype=np.int64)))
+                self._bus_numbers += [None] * capacity
+        self._slots[bus_number] = slot
+        self._bus_numbers[slot] = bus_number
+        return slot
+
+    def forget(self, bus_number: str) -> None:
+        slot = self._slots.pop(bus_number, None)
+        if slot is None:
+            return
+        for column in self._state.values():
+            column[slot] = np.nan
+        self._route[slot] = -1
+        self._bus_numbers[slot] = None
+        for slots in self._by_route.values():
+            slots.discard(slot)
+        self._free.append(slot)
+
+    def _along_at(self, slot: int, t: float) -> float:
+        s = self._state
+        dt = t - s["t0"][slot]
+        fade = max(1.0 - dt / self.blend, 0.0) if self.blend > 0 else 0.0
+        return s["along0"][slot] + s["speed"][slot] * min(max(dt, 0.0), self.horizon) + s["offset"][slot] * fade
+
+    def observe(self, bus_state: BusState, speed: Optional[float], heading: Optional[float]) -> None:
+        """Re-anchors a bus at a published fix; the pipeline calls this after route matching."""
+        slot = self._slot(bus_state.bus_number)
+        s = self._state
+        t = bus_state.updated_at
+        on_route = (bus_state.route_id is not None and bus_state.along is not None
+                    and abs(bus_state.cross_track or 0.0) <= self.max_cross_track)
+        offset = 0.0
+        if on_route:
+            number = self._route_number(bus_state.route_id)
+            if self._route[slot] == number and not math.isnan(s["t0"][slot]):
+                offset = self._along_at(slot, t) - bus_state.along
+                if abs(offset) > self.snap_distance:
+                    offset = 0.0
+        else:
+            number = -1
+        previous = self._route[slot]
+        if previous != number:
+            if previous >= 0:
+                self._by_route[self._route_ids[previous]].discard(slot)
+            if number >= 0:
+                self._by_route.setdefault(bus_state.route_id, set()).add(slot)
+        self._route[slot] = number
+        s["along0"][slot] = bus_state.along if on_route else np.nan
+        s["speed"][slot] = speed or 0.0
+        s["t0"][slot] = t
+        s["offset"][slot] = offset
+        s["lat0"][slot] = bus_state.lat
+        s["lon0"][slot] = bus_state.lon
+        s["heading0"][slot] = np.nan if heading is None else heading
+
+    def hold(self, bus_number: str, t: float, speed: Optional[float]) -> None:
+        """A fix held back as unmoved: the bus is still near its anchor, going `speed`."""
+        slot = self._slots.get(bus_number)
+        if slot is None or self._route[slot] < 0:
+            return
+        s = self._state
+        offset = self._along_at(slot, t) - s["along0"][slot]
+        s["offset"][slot] = offset if abs(offset) <= self.snap_distance else 0.0
+        s["speed"][slot] = speed or 0.0
+        s["t0"][slot] = t
+
+    # --- tick -------------------------------------------------------------
+
+    def tick(self, now: Optional[float] = None) -> None:
+        """Moves every tracked bus to its predicted position at `now`."""
+        started = time.perf_counter()
+        now = time.time() if now is None else now
+        if self._dirty:
+            self._rebuild()
+        n = len(self._bus_numbers)
+        s = self._state
+        route = self._route[:n]
+        loaded = route >= 0
+        loaded[loaded] = self._last[route[loaded]] >= 0
+        rows = np.flatnonzero(loaded)
+        r = route[rows]
+
+        dt = now - s["t0"][rows]
+        fade = np.clip(1.0 - dt / self.blend, 0.0, 1.0) if self.blend > 0 else 0.0
+        along = s["along0"][rows] + s["speed"][rows] * np.clip(dt, 0.0, self.horizon) + s["offset"][rows] * fade
+        key = self._base[r] + np.clip(along, 0.0, self._length[r])
+        i = np.searchsorted(self._cum, key, side="right") - 1
+        i = np.clip(i, self._first[r], self._last[r])
+        span = self._cum[i + 1] - self._cum[i]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            f = np.where(span > 0, (key - self._cum[i]) / span, 0.0)
+
+        s["lat"][:n] = s["lat0"][:n]
+        s["lon"][:n] = s["lon0"][:n]
+        s["heading"][:n] = s["heading0"][:n]
+        s["lat"][rows] = self._lats[i] + f * (self._lats[i + 1] - self._lats[i])
+        s["lon"][rows] = self._lons[i] + f * (self._lons[i + 1] - self._lons[i])
+        s["heading"][rows] = self._seg_heading[i]
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.last_tick = now
+        self.ticks += 1
+        self.last_tick_ms = elapsed_ms
+        self.max_tick_ms = max(self.max_tick_ms, elapsed_ms)
+
+    def positions_on_route(self, route_id: str) -> List[dict]:
+        """Predicted positions of the fresh buses on a route, as of the last tick."""
+        if time.time() - self.last_tick > max(self.interval, 1.0):
+            self.tick()
+        s = self._state
+        positions = []
+        for bus_state in self.fleet.states_on_route(route_id):
+            slot = self._slots.get(bus_state.bus_number)
+            if slot is None or math.isnan(s["lat"][slot]):
+                positions.append(bus_state.as_dict())
+                continue
+            heading = s["heading"][slot]
+            positions.append({
+                "bus_number": bus_state.bus_number,
+                "current_lat": round(float(s["lat"][slot]), 6),
+                "current_lon": round(float(s["lon"][slot]), 6),
+                "heading": None if math.isnan(heading) else round(float(heading), 1),
+            })
+        return positions
+
+    def publish(self) -> int:
+        """Sends a predicted frame to every route with subscribers; returns frames sent."""
+        sent = 0
+        for route_id in list(self._by_route):
+            channel = predicted_channel(route_id)
+            if not self.hub.subscriber_count(channel):
+                continue
+            self.hub.publish(channel, {"type": "predicted", "t": round(self.last_tick, 3),
+                                       "bus_locations": self.positions_on_route(route_id)}, key="predicted")
+            sent += 1
+        self.frames += sent
+        return sent
+
+    # --- lifecycle --------------------------------------------------------
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                self.tick()
+                self.publish()
+            except Exception as e:
+                logger.error(f"Dead-reckoning tick failed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "buses": len(self._slots),
+            "on_route": int(np.count_nonzero(self._route >= 0)),
+            "routes": len(self._route_ids),
+            "ticks": self.ticks,
+            "frames": self.frames,
+            "last_tick_ms": round(self.last_tick_ms, 3),
+            "max_tick_ms": round(self.max_tick_ms, 3),
+            "horizon": self.horizon,
+            "blend": self.blend,
+            "interval": self.interval,
+        }
+
+
+dead_reckoner = DeadReckoner()
+fleet_store.on_remove(dead_reckoner.forget)
@@ -0,0 +1,105 @@
+# driver_session.py
+import logging
+import time
+from typing import Dict, Optional
+
+from fastapi import WebSocket
+
+from auth import decode_access_token
+from crud import get_bus_route_assignment
+from database import async_session_maker
+from fleet import FleetStore, fleet_store
+
+logger = logging.getLogger(__name__)
+
+
+class DriverSession:
+    """Identity and counters of one authenticated driver socket."""
+    __slots__ = ("bus_number", "route_id", "connected_at", "frames", "fixes", "rejected", "last_seq", "advice")
+
+    def __init__(self, bus_number: str, route_id: Optional[str]):
+        self.bus_number = bus_number
+        self.route_id = route_id
+        self.connected_at = time.time()
+        self.frames = 0
+        self.fixes = 0
+        self.rejected = 0
+        self.last_seq: Optional[int] = None
+        # Reporting advice last sent to the driver (reporting.Advice)
+        self.advice = None
+
+
+def bearer_token(websocket: WebSocket) -> Optional[str]:
+    """The JWT from `?token=` (browsers can't set WebSocket headers) or an Authorization header."""
+    token = websocket.query_params.get("token")
+    if token:
+        return token
+    scheme, _, value = websocket.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not value:
+        return None
+    return value
+
+
+class DriverSessions:
+    """Authenticates driver sockets at connect time and tracks the open ones.
+
+    The token is checked without touching the database and the route comes
+    from the fleet store's registry; only a bus the registry doesn't know
+    costs one short query. After that a socket holds no pool connection:
+    fixes go through the ingest buffer, which borrows one per flush.
+    """
+
+    def __init__(self, fleet: FleetStore = fleet_store, session_maker=async_session_maker):
+        self.fleet = fleet
+        self.session_maker = session_maker
+        self._active: Dict[str, DriverSession] = {}
+        self.connections = 0
+        self.peak = 0
+        self.opened = 0
+        self.auth_failures = 0
+
+    async def open(self, token: Optional[str]) -> Optional[DriverSession]:
+        """Returns a session for a valid token of a registered bus, else None."""
+        bus_number = decode_access_token(token) if token else None
+        if bus_number is None:
+            self.auth_failures += 1
+            return None
+        route_id = self.fleet.route_of(bus_number)
+        if route_id is None:
+            async with self.session_maker() as db:
+                row = await get_bus_route_assignment(db, bus_number)
+            if row is None:
+                self.auth_failures += 1
+                logger.warning(f"Driver token for unknown bus {bus_number}")
+                return None
+            route_id = row.route_id
+            self.fleet.register_bus(bus_number, route_id)
+        session = DriverSession(bus_number, route_id)
+        # A reconnect replaces the entry; the old socket just stops counting
+        self._active[bus_number] = session
+        self.connections += 1
+        self.peak = max(self.peak, self.connections)
+        self.opened += 1
+        return session
+
+    def close(self, session: Optional[DriverSession]) -> None:
+        if session is None:
+            return
+        self.connections -= 1
+        if self._active.get(session.bus_number) is session:
+            del self._active[session.bus_number]
+
+    def get(self, bus_number: str) -> Optional[DriverSession]:
+        return self._active.get(bus_number)
+
+    def stats(self) -> dict:
+        return {
+            "connections": self.connections,
+            "buses": len(self._active),
+            "peak": self.peak,
+            "opened": self.opened,
+            "auth_failures": self.auth_failures,
+        }
+
+
+driver_sessions = DriverSessions()
@@ -0,0 +1,174 @@
+# eta.py
+import math
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import ETA_DEFAULT_SPEED, ETA_MAX_SPEED, ETA_MIN_SPEED, ETA_SPEED_TAU
+from fleet import BusState, FleetStore, fleet_store
+
+
+class _RouteBuses:
+    """Distance along, speed and last-report time of the buses on one route, as parallel arrays."""
+    __slots__ = ("slots", "bus_numbers", "along", "speed", "t")
+
+    def __init__(self, capacity: int = 16):
+        self.slots: Dict[str, int] = {}
+        self.bus_numbers: List[str] = []
+        self.along = np.zeros(capacity)
+        self.speed = np.zeros(capacity)
+        self.t = np.zeros(capacity)
+
+    def set(self, bus_number: str, along: float, speed: float, t: float) -> None:
+        slot = self.slots.get(bus_number)
+        if slot is None:
+            slot = self.slots[bus_number] = len(self.bus_numbers)
+            self.bus_numbers.append(bus_number)
+            if slot >= len(self.along):
+                grow = np.zeros(len(self.along))
+                self.along = np.concatenate((self.along, grow))
+                self.speed = np.concatenate((self.speed, grow))
+                self.t = np.concatenate((self.t, grow))
+        self.along[slot] = along
+        self.speed[slot] = speed
+        self.t[slot] = t
+
+    def discard(self, bus_number: str) -> None:
+        slot = self.slots.pop(bus_number, None)
+        if slot is None:
+            return
+        # Move the last bus into the hole so rows stay packed
+        last = len(self.bus_numbers) - 1
+        moved = self.bus_numbers.pop()
+        if slot != last:
+            self.bus_numbers[slot] = moved
+            self.slots[moved] = slot
+            self.along[slot] = self.along[last]
+            self.speed[slot] = self.speed[last]
+            self.t[slot] = self.t[last]
+
+
+class EtaEngine:
+    """Predicts when buses reach a point on their route.
+
+    Each ingest updates the bus's distance along the route and an
+    exponentially weighted speed estimate on its BusState, and copies both
+    into per-route arrays, so a query only snaps the target point and
+    divides remaining distance by speed for the buses on that route. A fix
+    held back as unmoved counts as a report of no progress: the speed decays
+    and the bus's age restarts, so a bus waiting at a stop isn't predicted
+    to arrive early.
+    """
+
+    def __init__(self, fleet: FleetStore, default_speed: float = ETA_DEFAULT_SPEED,
+                 min_speed: float = ETA_MIN_SPEED, max_speed: float = ETA_MAX_SPEED,
+                 speed_tau: float = ETA_SPEED_TAU):
+        self.fleet = fleet
+        self.default_speed = default_speed
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.speed_tau = speed_tau
+        self._routes: Dict[str, _RouteBuses] = {}
+        self._bus_routes: Dict[str, str] = {}
+
+    def _store(self, bus_state: BusState, t: float) -> None:
+        route_id = bus_state.route_id if bus_state.along is not None else None
+        if self._bus_routes.get(bus_state.bus_number) != route_id:
+            self.forget(bus_state.bus_number)
+        if route_id is None:
+            return
+        self._bus_routes[bus_state.bus_number] = route_id
+        table = self._routes.get(route_id)
+        if table is None:
+            table = self._routes[route_id] = _RouteBuses()
+        speed = self.default_speed if bus_state.speed is None else bus_state.speed
+        table.set(bus_state.bus_number, bus_state.along, max(speed, self.min_speed), t)
+
+    def forget(self, bus_number: str) -> None:
+        route_id = self._bus_routes.pop(bus_number, None)
+        table = self._routes.get(route_id) if route_id is not None else None
+        if table is not None:
+            table.discard(bus_number)
+            if not table.bus_numbers:
+                del self._routes[route_id]
+
+    def _fold(self, bus_state: BusState, sample: float, dt: float) -> None:
+        if bus_state.speed is None:
+            bus_state.speed = sample
+        else:
+            alpha = 1.0 - math.exp(-dt / self.speed_tau)
+            bus_state.speed += alpha * (sample - bus_state.speed)
+
+    def observe(self, bus_state: BusState, prev_along: Optional[float], prev_time: Optional[float]) -> None:
+        """Folds the progress since the previous fix into the bus's speed estimate."""
+        if bus_state.along is not None and prev_along is not None and prev_time is not None:
+            dt = bus_state.updated_at - prev_time
+            progress = bus_state.along - prev_along
+            # Skip a jump along the route no bus could make; don't let it skew the average
+            if dt > 0 and abs(progress) <= self.max_speed * dt:
+                self._fold(bus_state, max(progress, 0.0) / dt, dt)
+        self._store(bus_state, bus_state.updated_at)
+
+    def hold(self, bus_state: BusState, t: float) -> None:
+        """Counts a fix held back as unmoved at `t`: no progress since the last report.
+
+        The pipeline calls this before FleetStore.touch moves updated_at to `t`.
+        """
+        dt = t - bus_state.updated_at
+        if dt <= 0 or bus_state.along is None:
+            return
+        if bus_state.speed is not None:
+            self._fold(bus_state, 0.0, dt)
+        self._store(bus_state, t)
+
+    def _bus_arrays(self, route_id: str, now: float):
+        table = self._routes.get(route_id)
+        if table is None:
+            return [], np.zeros(0), np.zeros(0), np.zeros(0)
+        n = len(table.bus_numbers)
+        age = now - table.t[:n]
+        fresh = np.flatnonzero(age <= self.fleet.stale_after)
+        bus_numbers = [table.bus_numbers[i] for i in fresh.tolist()]
+        return bus_numbers, table.along[fresh], table.speed[fresh], age[fresh]
+
+    def predict_many(self, route_id: str, matcher, lats, lons, now: Optional[float] = None) -> List[dict]:
+        """ETAs of every approaching bus for each of a batch of points."""
+        now = time.time() if now is None else now
+        snaps = matcher.snap_many(lats, lons)
+        bus_numbers, along, speed, age = self._bus_arrays(route_id, now)
+
+        # (points x buses): remaining distance, then seconds, less time since the fix
+        remaining = snaps["along"][:, None] - along[None, :]
+        eta = np.maximum(remaining / speed[None, :] - age[None, :], 0.0)
+        approaching = remaining >= 0
+
+        results = []
+        for i in range(len(snaps["along"])):
+            order = np.flatnonzero(approaching[i])
+            order = order[np.argsort(eta[i, order], kind="stable")]
+            arrivals = [
+                {
+                    "bus_number": bus_numbers[j],
+                    "eta_seconds": round(float(eta[i, j]), 1),
+                    "distance": round(float(remaining[i, j]), 1),
+                }
+                for j in order
+            ]
+            results.append({
+                "snapped_lat": float(snaps["lat"][i]),
+                "snapped_lon": float(snaps["lon"][i]),
+                "distance_along": float(snaps["along"][i]),
+                "cross_track": float(snaps["cross_track"][i]),
+                "next": arrivals[0] if arrivals else None,
+                "arrivals": arrivals,
+            })
+        return results
+
+    def predict(self, route_id: str, matcher, lat: float, lon: float, now: Optional[float] = None) -> dict:
+        """ETAs of every approaching bus for one point."""
+        return self.predict_many(route_id, matcher, [lat], [lon], now)[0]
+
+
+eta_engine = EtaEngine(fleet_store)
+fleet_store.on_remove(eta_engine.forget)
@@ -0,0 +1,221 @@
+# fleet.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Set
+
+from config import FLEET_MAX_BUSES, FLEET_STALE_AFTER
+from crud import get_all_bus_locations, get_bus_route_assignments
+
+logger = logging.getLogger(__name__)
+
+
+class BusState:
+    """Latest known position of one bus."""
+    __slots__ = ("bus_number", "route_id", "lat", "lon", "updated_at",
+                 "segment", "along", "cross_track", "speed")
+
+    def __init__(self, bus_number: str, route_id: Optional[str], lat: float, lon: float, updated_at: float):
+        self.bus_number = bus_number
+        self.route_id = route_id
+        self.lat = lat
+        self.lon = lon
+        self.updated_at = updated_at
+        # Position matched onto the route polyline, when the route is known
+        self.segment: Optional[int] = None
+        self.along: Optional[float] = None
+        self.cross_track: Optional[float] = None
+        # Smoothed speed along the route in m/s, maintained by the ETA engine
+        self.speed: Optional[float] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "bus_number": self.bus_number,
+            "current_lat": self.lat,
+            "current_lon": self.lon,
+        }
+
+
+def _epoch(dt: Optional[datetime]) -> float:
+    # bus_locations.last_updated is a naive UTC timestamp
+    if dt is None:
+        return time.time()
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class FleetStore:
+    """Process-local view of where every bus is right now.
+
+    Buses are keyed by bus_number and indexed by route_id. The store holds at
+    most `max_buses` entries (least recently updated are dropped first) and
+    buses that have not reported for `stale_after` seconds are evicted.
+    """
+
+    def __init__(self, max_buses: int = FLEET_MAX_BUSES, stale_after: float = FLEET_STALE_AFTER):
+        self.max_buses = max_buses
+        self.stale_after = stale_after
+        self._buses: "OrderedDict[str, BusState]" = OrderedDict()
+        self._by_route: Dict[str, Set[str]] = {}
+        self._bus_routes: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._remove_listeners: List[Callable[[str], None]] = []
+        self.evicted = 0
+
+    # --- bus registry -----------------------------------------------------
+
+    def register_bus(self, bus_number: str, route_id: Optional[str]) -> None:
+        """Records which route a bus belongs to."""
+        old_route = self._bus_routes.get(bus_number)
+        if route_id is None:
+            self._bus_routes.pop(bus_number, None)
+        else:
+            self._bus_routes[bus_number] = route_id
+        state = self._buses.get(bus_number)
+        if state is not None and old_route != route_id:
+            self._unindex(state)
+            state.route_id = route_id
+            self._index(state)
+
+    def route_of(self, bus_number: str) -> Optional[str]:
+        return self._bus_routes.get(bus_number)
+
+    # --- positions --------------------------------------------------------
+
+    def _index(self, state: BusState) -> None:
+        if state.route_id is not None:
+            self._by_route.setdefault(state.route_id, set()).add(state.bus_number)
+
+    def _unindex(self, state: BusState) -> None:
+        if state.route_id is None:
+            return
+        members = self._by_route.get(state.route_id)
+        if members is not None:
+            members.discard(state.bus_number)
+            if not members:
+                del self._by_route[state.route_id]
+
+    def on_remove(self, listener: Callable[[str], None]) -> None:
+        """Registers a callback run with the bus_number of every evicted bus."""
+        self._remove_listeners.append(listener)
+
+    def _remove(self, bus_number: str) -> None:
+        state = self._buses.pop(bus_number, None)
+        if state is not None:
+            self._unindex(state)
+            self.evicted += 1
+            for listener in self._remove_listeners:
+                listener(bus_number)
+
+    def update(self, bus_number: str, lat: float, lon: float, updated_at: Optional[float] = None) -> BusState:
+        """Stores the latest position of a bus."""
+        if updated_at is None:
+            updated_at = time.time()
+        state = self._buses.get(bus_number)
+        if state is None:
+            state = BusState(bus_number, self._bus_routes.get(bus_number), lat, lon, updated_at)
+            self._buses[bus_number] = state
+            self._index(state)
+            while len(self._buses) > self.max_buses:
+                self._remove(next(iter(self._buses)))
+        else:
+            state.lat = lat
+            state.lon = lon
+            state.updated_at = updated_at
+            self._buses.move_to_end(bus_number)
+        return state
+
+    def touch(self, bus_number: str, updated_at: Optional[float] = None) -> Optional[BusState]:
+        """Marks a bus as still reporting from where it was; returns its state, if any."""
+        state = self._buses.get(bus_number)
+        if state is not None:
+            if updated_at is None:
+                updated_at = time.time()
+            if updated_at > state.updated_at:
+                state.updated_at = updated_at
+                self._buses.move_to_end(bus_number)
+        return state
+
+    def get(self, bus_number: str) -> Optional[BusState]:
+        return self._buses.get(bus_number)
+
+    def states(self) -> List[BusState]:
+        return list(self._buses.values())
+
+    def states_on_route(self, route_id: str) -> List[BusState]:
+        """Returns the state of every fresh bus on a route."""
+        cutoff = time.time() - self.stale_after
+        buses = self._buses
+        return [
+            buses[bus_number]
+            for bus_number in self._by_route.get(route_id, ())
+            if buses[bus_number].updated_at >= cutoff
+        ]
+
+    def buses_on_route(self, route_id: str) -> List[dict]:
+        """Returns fresh positions for all buses on a route."""
+        return [state.as_dict() for state in self.states_on_route(route_id)]
+
+    def evict_stale(self, now: Optional[float] = None) -> int:
+        """Drops buses that have not reported within `stale_after` seconds."""
+        cutoff = (now if now is not None else time.time()) - self.stale_after
+        removed = 0
+        # Entries are ordered by last update, so stop at the first fresh one
+        while self._buses:
+            bus_number, state = next(iter(self._buses.items()))
+            if state.updated_at >= cutoff:
+                break
+            self._remove(bus_number)
+            removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._buses)
+
+    # --- lifecycle --------------------------------------------------------
+
+    async def seed(self, db) -> None:
+        """Loads bus assignments and last known positions."""
+        for bus_number, route_id in await get_bus_route_assignments(db):
+            self.register_bus(bus_number, route_id)
+        locations = sorted(await get_all_bus_locations(db), key=lambda loc: _epoch(loc.last_updated))
+        for loc in locations:
+            self.update(loc.bus_number, loc.current_lat, loc.current_lon, _epoch(loc.last_updated))
+        self.evict_stale()
+
+    async def _run(self) -> None:
+        interval = max(self.stale_after / 4, 1.0)
+        while True:
+            await asyncio.sleep(interval)
+            removed = self.evict_stale()
+            if removed:
+                logger.info(f"Evicted {removed} stale buses from fleet store")
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "buses": len(self._buses),
+            "routes": len(self._by_route),
+            "registered_buses": len(self._bus_routes),
+            "evicted": self.evicted,
+            "max_buses": self.max_buses,
+            "stale_after": self.stale_after,
+        }
+
+
+fleet_store = FleetStore()
@@ -0,0 +1,268 @@
+# gps_filter.py
+import math
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from config import (GPS_ACCURACY, GPS_FILTER_ALPHA, GPS_FILTER_BETA, GPS_HEARTBEAT, GPS_MAX_SPEED,
+                    GPS_MIN_MOVE, GPS_REACQUIRE_AFTER, GPS_RESET_AFTER)
+from fleet import fleet_store
+from geometry import M_PER_DEG
+
+# Verdicts, one per fix
+REJECT = 0  # impossible jump or out-of-order fix; dropped
+HOLD = 1  # accepted, but the bus hasn't moved enough to be worth writing or broadcasting
+PUBLISH = 2  # write and broadcast the filtered position
+
+# Waves narrower than this many buses cost more in ~40 array operations than
+# the scalar loop, so update_many falls back to update
+_VECTOR_MIN = 32
+_FIELDS = ("lat", "lon", "v_north", "v_east", "t", "pub_lat", "pub_lon", "pub_t")
+
+
+class Filtered(NamedTuple):
+    """Per-fix filter output, aligned with the input arrays."""
+    verdict: np.ndarray
+    lat: np.ndarray
+    lon: np.ndarray
+    speed: np.ndarray  # m/s, NaN right after a (re)start
+    heading: np.ndarray  # degrees clockwise from north, NaN when unknown
+
+
+class GpsFilter:
+    """Per-bus alpha-beta filter over incoming fixes.
+
+    State is a row of a few float64 columns per bus (position, velocity in
+    m/s north/east, last fix time, last published position and time), so a
+    batch of fixes is filtered with whole-array operations. A fix is
+    rejected when reaching it would need more than `max_speed` plus GPS
+    error; after `reacquire_after` rejects in a row the filter restarts at
+    the new position instead. Accepted fixes are held back until the
+    smoothed position has moved `min_move` metres from the last published
+    one, or `heartbeat` seconds have passed.
+    """
+
+    def __init__(self, max_speed: float = GPS_MAX_SPEED, accuracy: float = GPS_ACCURACY,
+                 alpha: float = GPS_FILTER_ALPHA, beta: float = GPS_FILTER_BETA,
+                 reacquire_after: int = GPS_REACQUIRE_AFTER, reset_after: float = GPS_RESET_AFTER,
+                 min_move: float = GPS_MIN_MOVE, heartbeat: float = GPS_HEARTBEAT, capacity: int = 1024):
+        self.max_speed = max_speed
+        self.accuracy = accuracy
+        self.alpha = alpha
+        self.beta = beta
+        self.reacquire_after = reacquire_after
+        self.reset_after = reset_after
+        self.min_move = min_move
+        self.heartbeat = heartbeat
+        self._slots: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._state = {name: np.full(capacity, np.nan) for name in _FIELDS}
+        self._rejects = np.zeros(capacity, dtype=np.int32)
+
+        self.fixes = 0
+        self.rejected = 0
+        self.held = 0
+        self.published = 0
+        self.reacquired = 0
+
+    def _slot(self, bus_number: str) -> int:
+        slot = self._slots.get(bus_number)
+        if slot is not None:
+            return slot
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._slots)
+            capacity = len(self._rejects)
+            if slot >= capacity:
+                for name, column in self._state.items():
+                    self._state[name] = np.concatenate((column, np.full(capacity, np.nan)))
+                self._rejects = np.concatenate((self._rejects, np.zeros(capacity, dtype=np.int32)))
+        self._slots[bus_number] = slot
+        return slot
+
+    def forget(self, bus_number: str) -> None:
+        """Drops a bus's state; its next fix starts the filter afresh."""
+        slot = self._slots.pop(bus_number, None)
+        if slot is not None:
+            for column in self._state.values():
+                column[slot] = np.nan
+            self._rejects[slot] = 0
+            self._free.append(slot)
+
+    def speed_of(self, bus_number: str) -> Optional[float]:
+        """Smoothed ground speed in m/s, None before the bus's first fix."""
+        slot = self._slots.get(bus_number)
+        if slot is None or math.isnan(self._state["t"][slot]):
+            return None
+        return math.hypot(self._state["v_north"][slot], self._state["v_east"][slot])
+
+    def update_many(self, bus_numbers: Sequence[str], lats, lons, times=None) -> Filtered:
+        """Filters a batch of fixes; repeated buses are applied in input order."""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        n = len(lats)
+        times = np.full(n, time.time()) if times is None else np.asarray(times, dtype=np.float64)
+        slots = np.fromiter((self._slot(bus) for bus in bus_numbers), dtype=np.int64, count=n)
+        if n < _VECTOR_MIN or len(np.unique(slots)) < _VECTOR_MIN:
+            rows = [self.update(bus, lat, lon, t)
+                    for bus, lat, lon, t in zip(bus_numbers, lats.tolist(), lons.tolist(), times.tolist())]
+            return Filtered(np.array([row[0] for row in rows], dtype=np.int8),
+                            *(np.array([np.nan if row[k] is None else row[k] for row in rows], dtype=np.float64)
+                              for k in range(1, 5)))
+        out = Filtered(np.zeros(n, dtype=np.int8), np.empty(n), np.empty(n), np.empty(n), np.empty(n))
+        # Each wave holds at most one fix per bus, so state updates can't collide
+        remaining = np.arange(n)
+        while remaining.size:
+            _, first = np.unique(slots[remaining], return_index=True)
+            wave = remaining[np.sort(first)]
+            self._step(wave, slots[wave], lats[wave], lons[wave], times[wave], out)
+            remaining = np.delete(remaining, first)
+        self.fixes += n
+        return out
+
+    def update(self, bus_number: str, lat: float, lon: float, t: Optional[float] = None):
+        """Filters one fix with scalar maths; same rules as update_many.
+
+        Returns (verdict, lat, lon, speed, heading); speed and heading are
+        None when unknown.
+        """
+        if t is None:
+            t = time.time()
+        slot = self._slot(bus_number)
+        state = self._state
+        s_lat, s_lon, v_north, v_east, s_t, pub_lat, pub_lon, pub_t = (float(state[name][slot]) for name in _FIELDS)
+        rejects = int(self._rejects[slot])
+        self.fixes += 1
+
+        dt = t - s_t
+        restart = math.isnan(dt) or dt > self.reset_after
+        if not restart:
+            if dt <= 0:
+                self.rejected += 1
+                return REJECT, s_lat, s_lon, None, None
+            ky = M_PER_DEG
+            kx = M_PER_DEG * math.cos(math.radians(s_lat))
+            north = (lat - s_lat) * ky
+            east = (lon - s_lon) * kx
+            if math.hypot(north, east) > self.max_speed * dt + self.accuracy:
+                if rejects + 1 < self.reacquire_after:
+                    self._rejects[slot] = rejects + 1
+                    self.rejected += 1
+                    return REJECT, s_lat, s_lon, None, None
+                self.reacquired += 1
+                restart = True
+
+        if restart:
+            f_lat, f_lon, v_n, v_e, speed, heading = lat, lon, 0.0, 0.0, None, None
+            publish = True
+        else:
+            res_n = north - v_north * dt
+            res_e = east - v_east * dt
+            v_n = v_north + self.beta * res_n / dt
+            v_e = v_east + self.beta * res_e / dt
+            speed = math.hypot(v_n, v_e)
+            if speed > self.max_speed:
+                v_n *= self.max_speed / speed
+                v_e *= self.max_speed / speed
+                speed = self.max_speed
+            heading = math.degrees(math.atan2(v_e, v_n)) % 360.0 if speed > 0 else None
+            f_lat = s_lat + (v_north * dt + self.alpha * res_n) / ky
+            f_lon = s_lon + (v_east * dt + self.alpha * res_e) / kx
+            moved = math.hypot((f_lat - pub_lat) * ky, (f_lon - pub_lon) * kx)
+            publish = moved >= self.min_move or t - pub_t >= self.heartbeat
+
+        state["lat"][slot] = f_lat
+        state["lon"][slot] = f_lon
+        state["v_north"][slot] = v_n
+        state["v_east"][slot] = v_e
+        state["t"][slot] = t
+        self._rejects[slot] = 0
+        if publish:
+            state["pub_lat"][slot] = f_lat
+            state["pub_lon"][slot] = f_lon
+            state["pub_t"][slot] = t
+            self.published += 1
+            return PUBLISH, f_lat, f_lon, speed, heading
+        self.held += 1
+        return HOLD, f_lat, f_lon, speed, heading
+
+    def _step(self, rows, slots, lat, lon, t, out: Filtered) -> None:
+        s = {name: column[slots] for name, column in self._state.items()}
+        rejects = self._rejects[slots]
+
+        dt = t - s["t"]
+        ky = M_PER_DEG
+        kx = M_PER_DEG * np.cos(np.radians(np.where(np.isnan(s["lat"]), lat, s["lat"])))
+        north = (lat - s["lat"]) * ky
+        east = (lon - s["lon"]) * kx
+        with np.errstate(invalid="ignore"):
+            restart = np.isnan(dt) | (dt > self.reset_after)
+            stale = ~restart & (dt <= 0)
+            outlier = ~restart & ~stale & (np.hypot(north, east) > self.max_speed * dt + self.accuracy)
+        reacquire = outlier & (rejects + 1 >= self.reacquire_after)
+        outlier &= ~reacquire
+        restart |= reacquire
+        accept = ~restart & ~stale & ~outlier
+
+        # Alpha-beta: predict along the current velocity, correct by a share of the residual
+        dt_safe = np.where(accept, dt, 1.0)
+        res_n = north - s["v_north"] * dt_safe
+        res_e = east - s["v_east"] * dt_safe
+        v_n = np.where(accept, s["v_north"] + self.beta * res_n / dt_safe, 0.0)
+        v_e = np.where(accept, s["v_east"] + self.beta * res_e / dt_safe, 0.0)
+        speed = np.hypot(v_n, v_e)
+        too_fast = speed > self.max_speed
+        v_n[too_fast] *= self.max_speed / speed[too_fast]
+        v_e[too_fast] *= self.max_speed / speed[too_fast]
+        np.minimum(speed, self.max_speed, out=speed)
+        f_lat = np.where(accept, s["lat"] + (s["v_north"] * dt_safe + self.alpha * res_n) / ky, lat)
+        f_lon = np.where(accept, s["lon"] + (s["v_east"] * dt_safe + self.alpha * res_e) / kx, lon)
+
+        moved = np.hypot((f_lat - s["pub_lat"]) * ky, (f_lon - s["pub_lon"]) * kx)
+        with np.errstate(invalid="ignore"):
+            publish = restart | (accept & ((moved >= self.min_move) | (t - s["pub_t"] >= self.heartbeat)))
+        hold = accept & ~publish
+        take = accept | restart
+
+        column = self._state
+        column["lat"][slots] = np.where(take, f_lat, s["lat"])
+        column["lon"][slots] = np.where(take, f_lon, s["lon"])
+        column["v_north"][slots] = np.where(take, v_n, s["v_north"])
+        column["v_east"][slots] = np.where(take, v_e, s["v_east"])
+        column["t"][slots] = np.where(take, t, s["t"])
+        column["pub_lat"][slots] = np.where(publish, f_lat, s["pub_lat"])
+        column["pub_lon"][slots] = np.where(publish, f_lon, s["pub_lon"])
+        column["pub_t"][slots] = np.where(publish, t, s["pub_t"])
+        self._rejects[slots] = np.where(outlier, rejects + 1, np.where(stale, rejects, 0))
+
+        out.verdict[rows] = np.where(publish, PUBLISH, np.where(hold, HOLD, REJECT))
+        out.lat[rows] = np.where(take, f_lat, s["lat"])
+        out.lon[rows] = np.where(take, f_lon, s["lon"])
+        out.speed[rows] = np.where(accept, speed, np.nan)
+        out.heading[rows] = np.where(accept & (speed > 0), np.degrees(np.arctan2(v_e, v_n)) % 360.0, np.nan)
+
+        self.rejected += int(np.count_nonzero(outlier | stale))
+        self.held += int(np.count_nonzero(hold))
+        self.published += int(np.count_nonzero(publish))
+        self.reacquired += int(np.count_nonzero(reacquire))
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def stats(self) -> dict:
+        return {
+            "buses": len(self._slots),
+            "fixes": self.fixes,
+            "published": self.published,
+            "held": self.held,
+            "rejected": self.rejected,
+            "reacquired": self.reacquired,
+            "max_speed": self.max_speed,
+            "min_move": self.min_move,
+        }
+
+
+gps_filter = GpsFilter()
+fleet_store.on_remove(gps_filter.forget)
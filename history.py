@@ -0,0 +1,91 @@
+# history.py
+import logging
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+from config import HISTORY_PARTITIONS_AHEAD
+
+logger = logging.getLogger(__name__)
+
+TABLE = "bus_location_history"
+
+
+def partition_name(day: date) -> str:
+    return f"{TABLE}_p{day:%Y%m%d}"
+
+
+def partition_bounds(day: date) -> str:
+    return f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+
+
+def partition_day(name: str) -> Optional[date]:
+    try:
+        return datetime.strptime(name[len(TABLE) + 2:], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+class HistoryPartitions:
+    """Creates and drops the daily range partitions of bus_location_history.
+
+    Days already created are remembered, so the ingest path only issues DDL
+    for the first batch that reaches a new day. Dropping a day is a DROP
+    TABLE of its partition: no row-by-row delete and no vacuum debt.
+    """
+
+    def __init__(self, ahead: int = HISTORY_PARTITIONS_AHEAD):
+        self.ahead = ahead
+        self._known: Set[date] = set()
+        self.created = 0
+        self.dropped = 0
+
+    async def ensure(self, db, days: Iterable[date]) -> None:
+        """Creates any missing partitions for the given UTC days."""
+        missing = sorted(set(days) - self._known)
+        if not missing:
+            return
+        for day in missing:
+            await db.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(day)} PARTITION OF {TABLE} {partition_bounds(day)}"
+            ))
+        await db.commit()
+        self._known.update(missing)
+        self.created += len(missing)
+
+    async def ensure_ahead(self, db, today: Optional[date] = None) -> None:
+        """Makes sure today's partition and the next `ahead` days' exist."""
+        today = today or datetime.utcnow().date()
+        await self.ensure(db, (today + timedelta(days=i) for i in range(self.ahead + 1)))
+
+    async def partitions(self, db) -> List[Tuple[str, date]]:
+        """(name, day) of every daily partition, oldest first."""
+        result = await db.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :table"
+        ), {"table": TABLE})
+        found = [(name, partition_day(name)) for (name,) in result.all()]
+        return sorted((name, day) for name, day in found if day is not None)
+
+    async def drop_before(self, db, cutoff: date) -> List[str]:
+        """Drops every partition holding only days before `cutoff`."""
+        dropped = []
+        for name, day in await self.partitions(db):
+            if day >= cutoff:
+                break
+            await db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            self._known.discard(day)
+            dropped.append(name)
+        await db.commit()
+        self.dropped += len(dropped)
+        if dropped:
+            logger.info(f"Dropped location history partitions: {', '.join(dropped)}")
+        return dropped
+
+    def stats(self) -> dict:
+        return {"known_days": len(self._known), "created": self.created, "dropped": self.dropped}
+
+
+history_partitions = HistoryPartitions()
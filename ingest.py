@@ -0,0 +1,282 @@
+# ingest.py
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.exc import DataError, IntegrityError, InterfaceError, OperationalError
+
+from config import HISTORY_MAX_BACKLOG, INGEST_FLUSH_INTERVAL, INGEST_MAX_PENDING
+from crud import bulk_upsert_bus_locations, insert_location_history
+from database import async_session_maker
+from history import history_partitions
+from schemas import LocationUpdate
+
+logger = logging.getLogger(__name__)
+
+# Rows the database refuses; the rest of their batch is retried row by row
+_BAD_ROW = (IntegrityError, DataError)
+# Failures worth retrying the same rows on the next flush
+_TRANSIENT = (OperationalError, InterfaceError, OSError, asyncio.TimeoutError)
+
+
+def _optional(values) -> list:
+    """Floats as a list, with NaN as None."""
+    return [None if v != v else v for v in np.asarray(values, dtype=np.float64).tolist()]
+
+
+class IngestBuffer:
+    """Write-behind buffer for bus location updates.
+
+    Updates are coalesced per bus_number (last write wins) and flushed as a
+    single bulk upsert every `flush_interval` seconds, or earlier once
+    `max_pending` buses are waiting. Every fix is also kept, uncoalesced,
+    for a batched append to bus_location_history in the same flush. A row
+    the database rejects is dropped and counted rather than re-queued.
+    """
+
+    def __init__(self, session_maker=async_session_maker,
+                 flush_interval: float = INGEST_FLUSH_INTERVAL,
+                 max_pending: int = INGEST_MAX_PENDING,
+                 max_backlog: int = HISTORY_MAX_BACKLOG):
+        self.session_maker = session_maker
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_backlog = max_backlog
+        self._pending: Dict[str, dict] = {}
+        self._history: List[dict] = []
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.enqueued = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.flush_errors = 0
+        self.rows_dropped = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+        self.history_rows_flushed = 0
+        self.history_errors = 0
+        self.history_dropped = 0
+        self.history_rejected = 0
+
+    def enqueue(self, location: LocationUpdate, speed: Optional[float] = None,
+                heading: Optional[float] = None, ts: Optional[datetime] = None) -> None:
+        """Queues a location update taken at `ts` (naive UTC, default now); returns immediately."""
+        now = ts or datetime.utcnow()
+        if location.bus_number in self._pending:
+            self.coalesced += 1
+        self._pending[location.bus_number] = {
+            "bus_number": location.bus_number,
+            "current_lat": location.lat,
+            "current_lon": location.lon,
+            "last_updated": now,
+        }
+        self._history.append({
+            "bus_number": location.bus_number,
+            "ts": now,
+            "lat": location.lat,
+            "lon": location.lon,
+            "speed": speed,
+            "heading": heading,
+        })
+        self.enqueued += 1
+        if len(self._pending) >= self.max_pending or len(self._history) >= self.max_pending:
+            self._wakeup.set()
+
+    def enqueue_many(self, bus_numbers: Sequence[str], lats, lons, speeds=None, headings=None, times=None) -> None:
+        """Queues a batch of fixes given as parallel arrays; times are epoch seconds (default now).
+
+        The bulk form of enqueue for already-validated fixes: no model per
+        fix, and NaN speed or heading is stored as unknown.
+        """
+        n = len(bus_numbers)
+        if times is None:
+            stamps = [datetime.utcnow()] * n
+        else:
+            stamps = [datetime.utcfromtimestamp(t) for t in np.asarray(times, dtype=np.float64).tolist()]
+        speeds = [None] * n if speeds is None else _optional(speeds)
+        headings = [None] * n if headings is None else _optional(headings)
+        lats = np.asarray(lats, dtype=np.float64).tolist()
+        lons = np.asarray(lons, dtype=np.float64).tolist()
+        pending = self._pending
+        history = self._history
+        before = len(pending)
+        for bus_number, lat, lon, speed, heading, now in zip(bus_numbers, lats, lons, speeds, headings, stamps):
+            pending[bus_number] = {"bus_number": bus_number, "current_lat": lat, "current_lon": lon, "last_updated": now}
+            history.append({"bus_number": bus_number, "ts": now, "lat": lat, "lon": lon,
+                            "speed": speed, "heading": heading})
+        self.coalesced += n - (len(pending) - before)
+        self.enqueued += n
+        if len(pending) >= self.max_pending or len(history) >= self.max_pending:
+            self._wakeup.set()
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    @property
+    def load(self) -> float:
+        """0 when idle, 1 when flushes take the whole interval or the history backlog is full."""
+        busy = self.last_flush_ms / (self.flush_interval * 1000) if self.flush_interval > 0 else 0.0
+        return min(max(busy, len(self._history) / self.max_backlog), 1.0)
+
+    async def flush(self) -> int:
+        """Writes all pending updates and history; returns the latest-position row count."""
+        async with self._flush_lock:
+            if not self._pending and not self._history:
+                return 0
+            batch, self._pending = self._pending, {}
+            history, self._history = self._history, []
+            started = time.perf_counter()
+            written = await self._flush_latest(batch) if batch else 0
+            await self._flush_history(history)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+            return written
+
+    async def _flush_latest(self, batch: Dict[str, dict]) -> int:
+        try:
+            async with self.session_maker() as session:
+                written = await bulk_upsert_bus_locations(session, list(batch.values()))
+        except _BAD_ROW as e:
+            # One row the database refuses (e.g. a bus_number with no user) fails the whole statement
+            self.flush_errors += 1
+            logger.warning(f"Ingest flush of {len(batch)} rows rejected, retrying row by row: {e}")
+            written = await self._flush_rows(batch)
+        except Exception as e:
+            self.flush_errors += 1
+            logger.error(f"Ingest flush of {len(batch)} rows failed: {e}", exc_info=True)
+            self._requeue(batch)
+            return 0
+        self.rows_flushed += written
+        return written
+
+    async def _flush_rows(self, batch: Dict[str, dict]) -> int:
+        """Writes rows one at a time, dropping the ones the database rejects."""
+        written = 0
+        remaining = dict(batch)
+        try:
+            async with self.session_maker() as session:
+                for bus_number, row in batch.items():
+                    try:
+                        written += await bulk_upsert_bus_locations(session, [row])
+                    except _BAD_ROW as e:
+                        await session.rollback()
+                        self.rows_dropped += 1
+                        logger.warning(f"Dropping location update for bus {bus_number}: {e.orig}")
+                    del remaining[bus_number]
+        except Exception as e:
+            logger.error(f"Ingest retry of {len(remaining)} rows failed: {e}", exc_info=True)
+            self._requeue(remaining)
+        return written
+
+    def _requeue(self, batch: Dict[str, dict]) -> None:
+        # Put the rows back unless a newer update arrived meanwhile
+        for bus_number, row in batch.items():
+            self._pending.setdefault(bus_number, row)
+
+    async def _flush_history(self, rows: List[dict]) -> None:
+        if not rows:
+            return
+        try:
+            async with self.session_maker() as session:
+                await history_partitions.ensure(session, {row["ts"].date() for row in rows})
+                self.history_rows_flushed += await insert_location_history(session, rows)
+        except _BAD_ROW as e:
+            self.history_errors += 1
+            logger.warning(f"History flush of {len(rows)} rows rejected, retrying row by row: {e}")
+            await self._flush_history_rows(rows)
+        except _TRANSIENT as e:
+            self.history_errors += 1
+            logger.error(f"History flush of {len(rows)} rows failed, will retry: {e}")
+            self._requeue_history(rows)
+        except Exception as e:
+            self.history_errors += 1
+            self.history_dropped += len(rows)
+            logger.error(f"History flush of {len(rows)} rows failed, dropping them: {e}", exc_info=True)
+
+    async def _flush_history_rows(self, rows: List[dict]) -> None:
+        """Writes history rows one at a time, dropping the ones the database rejects."""
+        done = 0
+        try:
+            async with self.session_maker() as session:
+                for row in rows:
+                    try:
+                        self.history_rows_flushed += await insert_location_history(session, [row])
+                    except _BAD_ROW as e:
+                        await session.rollback()
+                        self.history_rejected += 1
+                        logger.warning(f"Dropping history fix of bus {row['bus_number']} at {row['ts']}: {e.orig}")
+                    done += 1
+        except _TRANSIENT as e:
+            logger.error(f"History retry of {len(rows) - done} rows failed, will retry: {e}")
+            self._requeue_history(rows[done:])
+        except Exception as e:
+            self.history_dropped += len(rows) - done
+            logger.error(f"History retry of {len(rows) - done} rows failed, dropping them: {e}", exc_info=True)
+
+    def _requeue_history(self, rows: List[dict]) -> None:
+        # Retry with the next flush, oldest first, but don't grow without bound
+        self._history = rows + self._history
+        overflow = len(self._history) - self.max_backlog
+        if overflow > 0:
+            del self._history[:overflow]
+            self.history_dropped += overflow
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the flush loop and writes whatever is still pending."""
+        self._stopping = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.depth,
+            "load": round(self.load, 3),
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "rows_flushed": self.rows_flushed,
+            "flush_errors": self.flush_errors,
+            "rows_dropped": self.rows_dropped,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+            "flush_interval": self.flush_interval,
+            "max_pending": self.max_pending,
+            "history_backlog": len(self._history),
+            "history_rows_flushed": self.history_rows_flushed,
+            "history_errors": self.history_errors,
+            "history_dropped": self.history_dropped,
+            "history_rejected": self.history_rejected,
+        }
+
+
+ingest_buffer = IngestBuffer()
@@ -0,0 +1,122 @@
+# mapmatch.py
+import math
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from geometry import M_PER_DEG, DistanceProfile, RouteGeometry
+
+# Cap on the (points x segments) matrices built by snap_many, in elements
+_MAX_BATCH_CELLS = 250_000
+
+
+class Snap(NamedTuple):
+    lat: float
+    lon: float
+    segment: int  # index of the segment's first vertex
+    cross_track: float  # metres, positive when the point is left of the direction of travel
+    along: float  # metres from the first vertex to the snapped point
+
+
+class RouteMatcher:
+    """Projects positions onto a route polyline.
+
+    Vertices are projected once into a local equirectangular plane (metres)
+    centred on the route, and per-segment origin, direction and length
+    arrays are precomputed so each snap is a handful of NumPy ops. Distance
+    along the route is read from the route's geodesic DistanceProfile when
+    one is given, otherwise from the planar segment lengths.
+    """
+    __slots__ = ("lat0", "lon0", "kx", "ky", "ax", "ay", "dx", "dy", "len2", "cum", "seg_len", "n_segments")
+
+    def __init__(self, geometry: RouteGeometry, profile: Optional[DistanceProfile] = None):
+        if len(geometry) == 0:
+            raise ValueError("Cannot match against an empty route")
+        lats = np.frombuffer(geometry.lats, dtype=np.float64)
+        lons = np.frombuffer(geometry.lons, dtype=np.float64)
+        if len(lats) == 1:
+            lats = np.repeat(lats, 2)
+            lons = np.repeat(lons, 2)
+        self.lat0 = float(lats.mean())
+        self.lon0 = float(lons.mean())
+        self.ky = M_PER_DEG
+        self.kx = self.ky * math.cos(math.radians(self.lat0))
+        x = (lons - self.lon0) * self.kx
+        y = (lats - self.lat0) * self.ky
+        self.ax = x[:-1]
+        self.ay = y[:-1]
+        self.dx = np.diff(x)
+        self.dy = np.diff(y)
+        self.len2 = self.dx * self.dx + self.dy * self.dy
+        # Avoid 0/0 on repeated vertices; their projection parameter becomes 0
+        self.len2[self.len2 == 0] = np.inf
+        if profile is not None and len(profile.cum) == len(x):
+            self.cum = profile.cum
+        else:
+            self.cum = np.concatenate(([0.0], np.cumsum(np.hypot(self.dx, self.dy))))
+        self.seg_len = np.diff(self.cum)
+        self.n_segments = len(self.ax)
+
+    @property
+    def length(self) -> float:
+        """Route length in metres along the polyline."""
+        return float(self.cum[-1])
+
+    def _to_plane(self, lats, lons):
+        return (np.asarray(lons, dtype=np.float64) - self.lon0) * self.kx, \
+               (np.asarray(lats, dtype=np.float64) - self.lat0) * self.ky
+
+    def _from_plane(self, x, y):
+        return y / self.ky + self.lat0, x / self.kx + self.lon0
+
+    def snap(self, lat: float, lon: float) -> Snap:
+        """Snaps a single position to the nearest point on the route."""
+        px = (lon - self.lon0) * self.kx
+        py = (lat - self.lat0) * self.ky
+        t = ((px - self.ax) * self.dx + (py - self.ay) * self.dy) / self.len2
+        np.clip(t, 0.0, 1.0, out=t)
+        sx = self.ax + t * self.dx
+        sy = self.ay + t * self.dy
+        d2 = (px - sx) ** 2 + (py - sy) ** 2
+        i = int(d2.argmin())
+        return self._result(i, float(t[i]), float(sx[i]), float(sy[i]), px, py)
+
+    def _result(self, i, t, sx, sy, px, py) -> Snap:
+        dx, dy = float(self.dx[i]), float(self.dy[i])
+        offset = math.hypot(px - sx, py - sy)
+        if dx * (py - sy) - dy * (px - sx) < 0:
+            offset = -offset
+        lat, lon = self._from_plane(sx, sy)
+        return Snap(float(lat), float(lon), i, offset, float(self.cum[i] + t * self.seg_len[i]))
+
+    def snap_many(self, lats, lons) -> dict:
+        """Snaps a batch of positions; returns arrays keyed like Snap's fields."""
+        px, py = self._to_plane(lats, lons)
+        n = len(px)
+        segment = np.empty(n, dtype=np.int64)
+        t_best = np.empty(n)
+        chunk = max(1, _MAX_BATCH_CELLS // max(self.n_segments, 1))
+        for start in range(0, n, chunk):
+            cx = px[start:start + chunk, None]
+            cy = py[start:start + chunk, None]
+            t = ((cx - self.ax) * self.dx + (cy - self.ay) * self.dy) / self.len2
+            np.clip(t, 0.0, 1.0, out=t)
+            d2 = (cx - (self.ax + t * self.dx)) ** 2 + (cy - (self.ay + t * self.dy)) ** 2
+            best = d2.argmin(axis=1)
+            segment[start:start + chunk] = best
+            t_best[start:start + chunk] = t[np.arange(len(best)), best]
+
+        dx = self.dx[segment]
+        dy = self.dy[segment]
+        sx = self.ax[segment] + t_best * dx
+        sy = self.ay[segment] + t_best * dy
+        offset = np.hypot(px - sx, py - sy)
+        offset = np.where(dx * (py - sy) - dy * (px - sx) < 0, -offset, offset)
+        lat, lon = self._from_plane(sx, sy)
+        return {
+            "lat": lat,
+            "lon": lon,
+            "segment": segment,
+            "cross_track": offset,
+            "along": self.cum[segment] + t_best * self.seg_len[segment],
+        }
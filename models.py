@@ -1,8 +1,9 @@
 # models.py
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, JSON
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, JSON, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from base import Base  # Import Base from base.py
+from geometry import RouteGeometry
 
 class User(Base):
     __tablename__ = "users"
@@ -13,6 +14,9 @@ class User(Base):
     route_id = Column(String)
     password_hash = Column(String)
     status = Column(Boolean, default=True)
+
+    # Serves the route -> buses join used by rider snapshots
+    __table_args__ = (Index("ix_users_route_id_bus_number", "route_id", "bus_number"),)
     
     bus_info = relationship("BusLocation", back_populates="bus", uselist=False)
     def verify_password(self, password):
@@ -25,23 +29,50 @@ class BusLocation(Base):
     bus_number = Column(String, ForeignKey("users.bus_number"), unique=True, nullable=False)
     current_lat = Column(Float, nullable=False)
     current_lon = Column(Float, nullable=False)
-    last_5_sec_locations = Column(JSON, default=[])
-    last_15_sec_location = Column(JSON, nullable=True)
-    last_25_sec_location = Column(JSON, nullable=True)
     last_updated = Column(DateTime, default=datetime.utcnow)
     
     bus = relationship("User", back_populates="bus_info")
 
+class BusLocationHistory(Base):
+    """Every fix a bus reports, append-only; bus_locations keeps just the latest."""
+    __tablename__ = "bus_location_history"
+
+    bus_number = Column(String, primary_key=True)
+    ts = Column(DateTime, primary_key=True)  # naive UTC, like bus_locations.last_updated
+    lat = Column(Float, nullable=False)
+    lon = Column(Float, nullable=False)
+    speed = Column(Float, nullable=True)  # m/s over ground since the previous fix
+    heading = Column(Float, nullable=True)  # degrees clockwise from north
+
+    # Daily range partitions (see history.py) so old days drop as whole tables;
+    # the (bus_number, ts) key serves per-bus time-window scans
+    __table_args__ = (
+        Index("ix_bus_location_history_ts", "ts", postgresql_using="brin"),
+        {"postgresql_partition_by": "RANGE (ts)"},
+    )
+
 class RouteInfo(Base):
     __tablename__ = "route_info"
     
     id = Column(Integer, primary_key=True, index=True)
     route_id = Column(String, unique=True, nullable=False)
     route_name = Column(String, nullable=False)
-    coordinates = Column(JSON, default=[])
-    
+    coordinates = Column(JSON, default=[])  # legacy JSON shape, read only when geometry is empty
+    geometry = Column(LargeBinary, nullable=True)  # packed RouteGeometry
+
+    users = relationship("User", primaryjoin="foreign(User.route_id) == RouteInfo.route_id", viewonly=True)
+
+    def route_geometry(self) -> RouteGeometry:
+        return RouteGeometry.from_row(self.geometry, self.coordinates)
+
+    def set_route_geometry(self, geometry: RouteGeometry):
+        self.geometry = geometry.to_bytes()
+        self.coordinates = None
+
     def add_coordinates(self, new_coords):
-        self.coordinates.extend(new_coords)
+        geometry = self.route_geometry()
+        geometry.extend(new_coords)
+        self.set_route_geometry(geometry)
         
         
         
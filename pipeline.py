@@ -0,0 +1,213 @@
+# pipeline.py
+import math
+import time
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from broadcast import route_hub
+from codec import POSITION_SCALE, UNKNOWN_U16
+from config import DRIVER_MAX_FIX_AGE, DRIVER_MAX_FIX_AHEAD, HISTORY_RETENTION_DAYS
+from deadreckon import dead_reckoner
+from eta import eta_engine
+from fleet import BusState, fleet_store
+from gps_filter import HOLD, PUBLISH, REJECT, GpsFilter, gps_filter
+from ingest import ingest_buffer
+from route_cache import route_cache
+from schemas import LocationUpdate
+from spatial import bus_index
+
+
+def match_to_route(bus_state: BusState) -> None:
+    """Snaps the bus onto its route polyline, if the route geometry is loaded."""
+    entry = route_cache.get(bus_state.route_id) if bus_state.route_id is not None else None
+    if entry is None:
+        bus_state.segment = bus_state.along = bus_state.cross_track = None
+        return
+    snap = entry.matcher.snap(bus_state.lat, bus_state.lon)
+    bus_state.segment = snap.segment
+    bus_state.along = snap.along
+    bus_state.cross_track = snap.cross_track
+
+
+def _apply(bus_number: str, lat: float, lon: float, speed: Optional[float], heading: Optional[float],
+           t: Optional[float] = None) -> BusState:
+    ts = datetime.utcfromtimestamp(t) if t is not None else None
+    ingest_buffer.enqueue(LocationUpdate(bus_number=bus_number, lat=lat, lon=lon), speed, heading, ts)
+    return _update_state(bus_number, lat, lon, speed, heading, t)
+
+
+def _update_state(bus_number: str, lat: float, lon: float, speed: Optional[float], heading: Optional[float],
+                  t: Optional[float] = None) -> BusState:
+    """Every live-path step of a published fix but the DB queue."""
+    previous = fleet_store.get(bus_number)
+    prev_along, prev_time = (previous.along, previous.updated_at) if previous else (None, None)
+    bus_state = fleet_store.update(bus_number, lat, lon, t)
+    bus_index.update(bus_state.bus_number, bus_state.lat, bus_state.lon)
+    match_to_route(bus_state)
+    eta_engine.observe(bus_state, prev_along, prev_time)
+    dead_reckoner.observe(bus_state, speed, heading)
+    if bus_state.route_id is not None:
+        route_hub.publish(bus_state.route_id, {"type": "bus", **bus_state.as_dict()}, key=bus_state.bus_number)
+    return bus_state
+
+
+def _hold(bus_number: str, t: float, speed: Optional[float]) -> Optional[BusState]:
+    """A fix held back as unmoved: the bus is alive where it was, making no progress."""
+    dead_reckoner.hold(bus_number, t, speed)
+    bus_state = fleet_store.get(bus_number)
+    if bus_state is not None:
+        eta_engine.hold(bus_state, t)
+        fleet_store.touch(bus_number, t)
+    return bus_state
+
+
+def process_location(location: LocationUpdate) -> Tuple[int, Optional[BusState]]:
+    """Runs one driver fix through the live ingest path; returns (verdict, bus state).
+
+    The fix is first smoothed by the GPS filter; impossible jumps are
+    dropped (REJECT, no state) and a bus that hasn't meaningfully moved
+    (HOLD) is left where it was but counted as reporting no progress, so
+    its ETA speed decays; the filter's heartbeat publishes it again. Otherwise the
+    smoothed position is queued for the DB (latest position and history),
+    stored in the fleet state and spatial index, matched onto the route,
+    folded into the ETA speed estimate and pushed to subscribed riders.
+    """
+    now = time.time()
+    verdict, lat, lon, speed, heading = gps_filter.update(location.bus_number, location.lat, location.lon, now)
+    if verdict == REJECT:
+        return verdict, None
+    if verdict != PUBLISH:
+        return verdict, _hold(location.bus_number, now, speed)
+    return verdict, _apply(location.bus_number, lat, lon, speed, heading)
+
+
+def process_fixes(bus_numbers: Sequence[str], lats, lons, times, speeds=None, headings=None) -> Tuple[int, int]:
+    """Runs a batch of timestamped fixes through the ingest path; returns (accepted, rejected).
+
+    The GPS filter runs once over the whole batch; published fixes then take
+    the same per-bus steps as process_location. Device-reported speed and
+    heading (NaN when unknown) are preferred over the filter's estimates.
+    """
+    result = gps_filter.update_many(bus_numbers, lats, lons, times)
+    for i in np.flatnonzero(result.verdict == HOLD).tolist():
+        _hold(bus_numbers[i], float(times[i]), None if math.isnan(result.speed[i]) else float(result.speed[i]))
+    published = np.flatnonzero(result.verdict == PUBLISH)
+    if published.size:
+        speed = result.speed[published]
+        heading = result.heading[published]
+        if speeds is not None:
+            reported = np.asarray(speeds, dtype=np.float64)[published]
+            speed = np.where(np.isnan(reported), speed, reported)
+        if headings is not None:
+            reported = np.asarray(headings, dtype=np.float64)[published]
+            heading = np.where(np.isnan(reported), heading, reported)
+        buses = [bus_numbers[i] for i in published.tolist()]
+        lat = result.lat[published]
+        lon = result.lon[published]
+        t = np.asarray(times, dtype=np.float64)[published]
+        ingest_buffer.enqueue_many(buses, lat, lon, speed, heading, t)
+        for row in zip(buses, lat.tolist(), lon.tolist(), speed.tolist(), heading.tolist(), t.tolist()):
+            bus_number, fix_lat, fix_lon, fix_speed, fix_heading, fix_t = row
+            _update_state(bus_number, fix_lat, fix_lon, None if math.isnan(fix_speed) else fix_speed,
+                          None if math.isnan(fix_heading) else fix_heading, fix_t)
+    rejected = int(np.count_nonzero(result.verdict == REJECT))
+    return len(result.verdict) - rejected, rejected
+
+
+def _scale_records(bus_table: Sequence[str], records: np.ndarray, only_bus: Optional[str]):
+    """Unpacks codec.FIX_DTYPE records; returns (valid, t, lat, lon, speed, heading) arrays.
+
+    `valid` rules out unknown bus indexes, buses other than `only_bus` (when
+    given) and impossible coordinates. Unknown speed and heading are NaN.
+    """
+    t = records["ts_ms"] / 1000.0
+    lat = records["lat"] / POSITION_SCALE
+    lon = records["lon"] / POSITION_SCALE
+    # One extra False entry absorbs out-of-range indexes
+    allowed = np.array([only_bus is None or bus == only_bus for bus in bus_table] + [False])
+    valid = allowed[np.minimum(records["bus"], len(bus_table))] & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+    speed = np.where(records["speed"] == UNKNOWN_U16, np.nan, records["speed"] / 100.0)
+    heading = np.where(records["heading"] < 36000, records["heading"] / 100.0, np.nan)
+    return valid, t, lat, lon, speed, heading
+
+
+def process_fix_records(bus_table: Sequence[str], records: np.ndarray, now: Optional[float] = None,
+                        only_bus: Optional[str] = None) -> Tuple[int, int]:
+    """Validates a frame of codec.FIX_DTYPE records in bulk and ingests the valid ones.
+
+    Returns (accepted, rejected); records with an unknown bus index, a bus
+    other than `only_bus` (when given), an impossible coordinate or a
+    timestamp outside the accepted window count as rejected along with the
+    GPS filter's rejects.
+    """
+    now = now if now is not None else time.time()
+    valid, t, lat, lon, speed, heading = _scale_records(bus_table, records, only_bus)
+    valid &= (t >= now - DRIVER_MAX_FIX_AGE) & (t <= now + DRIVER_MAX_FIX_AHEAD)
+    keep = np.flatnonzero(valid)
+    if keep.size == 0:
+        return 0, len(records)
+    keep = keep[np.argsort(t[keep], kind="stable")]
+    bus_numbers = [bus_table[i] for i in records["bus"][keep].tolist()]
+    accepted, rejected = process_fixes(bus_numbers, lat[keep], lon[keep], t[keep], speed[keep], heading[keep])
+    return accepted, rejected + len(records) - len(keep)
+
+
+def backfill_fix_records(bus_table: Sequence[str], records: np.ndarray, now: Optional[float] = None,
+                         only_bus: Optional[str] = None) -> Tuple[dict, dict]:
+    """Splits offline-buffered fixes between the live path and history.
+
+    Fixes newer than the bus's live position, and recent enough for the live
+    window, go through process_fixes like any other fix. Older ones must not
+    move the live marker: they are cleaned by a throwaway GPS filter (jumps
+    dropped, jitter smoothed, live filter state untouched) and returned as
+    columns for crud.merge_location_history. A repeated (bus, timestamp)
+    keeps its first copy. Returns (history columns, counts).
+    """
+    now = now if now is not None else time.time()
+    valid, t, lat, lon, speed, heading = _scale_records(bus_table, records, only_bus)
+    valid &= (t >= now - HISTORY_RETENTION_DAYS * 86400) & (t <= now + DRIVER_MAX_FIX_AHEAD)
+    keep = np.flatnonzero(valid)
+    # Per bus, oldest first
+    keep = keep[np.lexsort((t[keep], records["bus"][keep]))]
+    bus_index, ts_ms = records["bus"][keep], records["ts_ms"][keep]
+    first = np.ones(len(keep), dtype=bool)
+    first[1:] = (bus_index[1:] != bus_index[:-1]) | (ts_ms[1:] != ts_ms[:-1])
+    duplicates = len(keep) - int(np.count_nonzero(first))
+    keep = keep[first]
+
+    bus_numbers = [bus_table[i] for i in records["bus"][keep].tolist()]
+    live_since = {}
+    for bus_number in set(bus_numbers):
+        state = fleet_store.get(bus_number)
+        live_since[bus_number] = state.updated_at if state is not None else -math.inf
+    live = (t[keep] > np.array([live_since[bus] for bus in bus_numbers])) & (t[keep] >= now - DRIVER_MAX_FIX_AGE)
+
+    rows = keep[live]
+    live_accepted, live_rejected = process_fixes([bus_table[i] for i in records["bus"][rows].tolist()],
+                                                 lat[rows], lon[rows], t[rows], speed[rows], heading[rows])
+
+    rows = keep[~live]
+    buses = [bus_table[i] for i in records["bus"][rows].tolist()]
+    cleaned = GpsFilter(min_move=0.0, heartbeat=0.0, capacity=max(len(set(buses)), 1)).update_many(
+        buses, lat[rows], lon[rows], t[rows])
+    ok = np.flatnonzero(cleaned.verdict != REJECT)
+    fix_speed = np.where(np.isnan(speed[rows]), cleaned.speed, speed[rows])[ok]
+    fix_heading = np.where(np.isnan(heading[rows]), cleaned.heading, heading[rows])[ok]
+    history = {
+        "bus_number": [buses[i] for i in ok.tolist()],
+        "ts": [datetime.utcfromtimestamp(ms / 1000.0) for ms in records["ts_ms"][rows][ok].tolist()],
+        "lat": cleaned.lat[ok].tolist(),
+        "lon": cleaned.lon[ok].tolist(),
+        "speed": [None if math.isnan(v) else v for v in fix_speed.tolist()],
+        "heading": [None if math.isnan(v) else v for v in fix_heading.tolist()],
+    }
+    counts = {
+        "received": len(records),
+        "live": live_accepted,
+        "history": len(ok),
+        "duplicates": duplicates,
+        "rejected": len(records) - len(keep) - duplicates + live_rejected + len(rows) - len(ok),
+    }
+    return history, counts
@@ -0,0 +1,216 @@
+# planner.py
+import heapq
+import itertools
+from typing import Dict, Optional, Set, Tuple
+
+from config import (
+    PLANNER_ACCESS_RADIUS,
+    PLANNER_BOARD_PENALTY,
+    PLANNER_BUS_SPEED,
+    PLANNER_TRANSFER_RADIUS,
+    PLANNER_WALK_SPEED,
+)
+from geometry import DistanceProfile, RouteGeometry, haversine_m
+from route_cache import RouteCache, RouteEntry, route_cache
+from spatial import GridIndex
+
+Node = Tuple[str, int]  # (route_id, vertex index)
+
+_ORIGIN = ("", -1)
+_DEST = ("", -2)
+
+
+class _RouteLine:
+    __slots__ = ("route_id", "lats", "lons", "cum")
+
+    def __init__(self, route_id: str, geometry: RouteGeometry, profile: DistanceProfile):
+        self.route_id = route_id
+        self.lats = geometry.lats.tolist()
+        self.lons = geometry.lons.tolist()
+        self.cum = profile.cum.tolist()
+
+
+class JourneyPlanner:
+    """Bus + walking journey planner over the route network.
+
+    Every route vertex is a graph node; riding moves to the next vertex in
+    the route's direction, and vertices of different routes within
+    `transfer_radius` are joined by walking transfers. Routes are added and
+    removed incrementally as the route cache changes. Queries run A* with a
+    straight-line / top-speed heuristic, charging `board_penalty` seconds of
+    expected wait each time a bus is boarded.
+    """
+
+    def __init__(self, bus_speed: float = PLANNER_BUS_SPEED, walk_speed: float = PLANNER_WALK_SPEED,
+                 board_penalty: float = PLANNER_BOARD_PENALTY, transfer_radius: float = PLANNER_TRANSFER_RADIUS,
+                 access_radius: float = PLANNER_ACCESS_RADIUS):
+        self.bus_speed = bus_speed
+        self.walk_speed = walk_speed
+        self.board_penalty = board_penalty
+        self.transfer_radius = transfer_radius
+        self.access_radius = access_radius
+        self._routes: Dict[str, _RouteLine] = {}
+        self._vertices = GridIndex()
+        self._transfers: Dict[Node, Dict[Node, float]] = {}
+        self._dirty: Set[str] = set()
+
+    # --- graph maintenance ------------------------------------------------
+
+    def on_route_change(self, route_id: str, entry: Optional[RouteEntry]) -> None:
+        if entry is None:
+            # Invalidated; reloaded lazily by refresh() before the next query
+            self._dirty.add(route_id)
+        else:
+            self._dirty.discard(route_id)
+            self.update_route(route_id, entry.geometry, entry.profile)
+
+    def remove_route(self, route_id: str) -> None:
+        line = self._routes.pop(route_id, None)
+        if line is None:
+            return
+        for i in range(len(line.lats)):
+            node = (route_id, i)
+            self._vertices.remove(node)
+            for other in self._transfers.pop(node, {}):
+                links = self._transfers.get(other)
+                if links is not None:
+                    links.pop(node, None)
+                    if not links:
+                        del self._transfers[other]
+
+    def update_route(self, route_id: str, geometry: RouteGeometry, profile: DistanceProfile) -> None:
+        """(Re)builds one route's nodes and its transfers to every other route."""
+        self.remove_route(route_id)
+        if len(geometry) == 0:
+            return
+        line = _RouteLine(route_id, geometry, profile)
+        for i, (lat, lon) in enumerate(zip(line.lats, line.lons)):
+            node = (route_id, i)
+            for distance, other in self._vertices.within(lat, lon, self.transfer_radius):
+                if other[0] != route_id:
+                    self._transfers.setdefault(node, {})[other] = distance
+                    self._transfers.setdefault(other, {})[node] = distance
+        for i, (lat, lon) in enumerate(zip(line.lats, line.lons)):
+            self._vertices.update((route_id, i), lat, lon)
+        self._routes[route_id] = line
+
+    async def refresh(self, db, cache: RouteCache) -> None:
+        """Reloads routes invalidated since the last query."""
+        for route_id in list(self._dirty):
+            entry = await cache.load(db, route_id)
+            if entry is None:
+                self._dirty.discard(route_id)
+                self.remove_route(route_id)
+
+    def stats(self) -> dict:
+        return {
+            "routes": len(self._routes),
+            "nodes": len(self._vertices),
+            "transfer_links": sum(len(links) for links in self._transfers.values()) // 2,
+            "dirty_routes": len(self._dirty),
+        }
+
+    # --- queries ----------------------------------------------------------
+
+    def _coords(self, node: Node) -> Tuple[float, float]:
+        line = self._routes[node[0]]
+        return line.lats[node[1]], line.lons[node[1]]
+
+    def plan(self, from_lat: float, from_lon: float, to_lat: float, to_lon: float) -> Optional[dict]:
+        """Fastest journey between two points, or None if none is walkable."""
+        top_speed = max(self.bus_speed, self.walk_speed)
+        egress = {node: d for d, node in self._vertices.within(to_lat, to_lon, self.access_radius)}
+        direct = haversine_m(from_lat, from_lon, to_lat, to_lon)
+
+        best: Dict[Node, float] = {_ORIGIN: 0.0}
+        previous: Dict[Node, Tuple[Node, str]] = {}
+        tie = itertools.count()
+        heap = [(direct / top_speed, next(tie), 0.0, _ORIGIN)]
+
+        def relax(node: Node, cost: float, via: Node, kind: str, lat: float, lon: float) -> None:
+            if cost < best.get(node, float("inf")):
+                best[node] = cost
+                previous[node] = (via, kind)
+                h = 0.0 if node == _DEST else haversine_m(lat, lon, to_lat, to_lon) / top_speed
+                heapq.heappush(heap, (cost + h, next(tie), cost, node))
+
+        while heap:
+            _, _, cost, node = heapq.heappop(heap)
+            if cost > best.get(node, float("inf")):
+                continue
+            if node == _DEST:
+                break
+            if node == _ORIGIN:
+                if direct <= self.access_radius:
+                    relax(_DEST, direct / self.walk_speed, node, "walk", to_lat, to_lon)
+                for d, first in self._vertices.within(from_lat, from_lon, self.access_radius):
+                    lat, lon = self._coords(first)
+                    relax(first, d / self.walk_speed + self.board_penalty, node, "walk", lat, lon)
+                continue
+
+            route_id, i = node
+            line = self._routes[route_id]
+            if i + 1 < len(line.lats):
+                ride = (line.cum[i + 1] - line.cum[i]) / self.bus_speed
+                relax((route_id, i + 1), cost + ride, node, "ride", line.lats[i + 1], line.lons[i + 1])
+            for other, d in self._transfers.get(node, {}).items():
+                lat, lon = self._coords(other)
+                relax(other, cost + d / self.walk_speed + self.board_penalty, node, "walk", lat, lon)
+            if node in egress:
+                relax(_DEST, cost + egress[node] / self.walk_speed, node, "walk", to_lat, to_lon)
+
+        if _DEST not in previous:
+            return None
+        return self._legs(previous, (from_lat, from_lon), (to_lat, to_lon), best[_DEST])
+
+    def _legs(self, previous, origin, destination, duration: float) -> dict:
+        steps = []
+        node = _DEST
+        while node != _ORIGIN:
+            via, kind = previous[node]
+            steps.append((via, node, kind))
+            node = via
+        steps.reverse()
+
+        def point(n: Node) -> dict:
+            if n == _ORIGIN:
+                return {"lat": origin[0], "lon": origin[1]}
+            if n == _DEST:
+                return {"lat": destination[0], "lon": destination[1]}
+            lat, lon = self._coords(n)
+            return {"lat": lat, "lon": lon}
+
+        legs = []
+        for via, node, kind in steps:
+            if kind == "ride" and legs and legs[-1]["type"] == "bus" and legs[-1]["route_id"] == via[0]:
+                leg = legs[-1]
+            elif kind == "ride":
+                leg = {"type": "bus", "route_id": via[0], "path": [point(via)], "distance": 0.0}
+                legs.append(leg)
+            else:
+                a, b = point(via), point(node)
+                d = haversine_m(a["lat"], a["lon"], b["lat"], b["lon"])
+                legs.append({"type": "walk", "from": a, "to": b, "distance": round(d, 1),
+                             "duration": round(d / self.walk_speed, 1)})
+                continue
+            line = self._routes[via[0]]
+            leg["path"].append(point(node))
+            leg["distance"] += line.cum[node[1]] - line.cum[via[1]]
+
+        for leg in legs:
+            if leg["type"] == "bus":
+                leg["board"] = leg["path"][0]
+                leg["alight"] = leg["path"][-1]
+                leg["duration"] = round(leg["distance"] / self.bus_speed, 1)
+                leg["distance"] = round(leg["distance"], 1)
+        # Walks of zero length (alighting where the next bus is boarded) add nothing
+        legs = [leg for leg in legs if leg["type"] != "walk" or leg["distance"] > 0]
+        return {
+            "duration": round(duration, 1),
+            "transfers": max(sum(1 for leg in legs if leg["type"] == "bus") - 1, 0),
+            "legs": legs,
+        }
+
+
+journey_planner = JourneyPlanner()
+route_cache.on_change(journey_planner.on_route_change)
@@ -0,0 +1,186 @@
+# reporting.py
+import math
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import (GPS_ACCURACY, REPORT_DEADBAND, REPORT_LOAD_FACTOR, REPORT_MAX_INTERVAL, REPORT_MIN_INTERVAL,
+                    REPORT_STATIONARY_SPEED, REPORT_STOP_DEADBAND, REPORT_STOP_MARGIN,
+                    REPORT_STOP_RADIUS)
+from fleet import BusState, fleet_store
+from geometry import M_PER_DEG, haversine_m
+from gps_filter import GpsFilter, gps_filter
+from ingest import IngestBuffer, ingest_buffer
+from route_cache import RouteCache, route_cache
+
+
+class Advice(NamedTuple):
+    """Send a fix at least every `interval` seconds, and early once `deadband` metres from the last one sent."""
+    interval: float
+    deadband: float
+
+    def as_dict(self) -> dict:
+        return {"type": "rate", "interval": self.interval, "deadband": self.deadband}
+
+
+def _step(value: float, per_octave: int, rounding=round) -> float:
+    # Snap to a geometric ladder so a noisy speed doesn't re-advise the driver on every fix
+    return round(2 ** (rounding(per_octave * math.log2(value)) / per_octave), 1)
+
+
+class ReportingPolicy:
+    """Tells each driver how often its bus needs to report.
+
+    A moving bus may travel `deadband` metres between fixes, never so far
+    that it skips the start of a stop's reach (`stop_radius` plus
+    `stop_margin`, so the GPS filter has settled by the time it is inside
+    the radius). Within that reach it reports every `min_interval` with
+    `stop_deadband`, whatever its speed or the load: slowing in, dwelling
+    and pulling out are all tracked at full rate. A bus standing still
+    clear of any stop only sends a heartbeat every `max_interval` and keeps
+    a dead-band of at least `gps_accuracy` so fix noise alone can't trip
+    it; the dead-band catches it pulling away, and it counts as moving from
+    then on while the smoothed speed catches up. Away from stops the
+    dead-band and interval are stretched by up to `load_factor` as the
+    ingest buffer falls behind.
+
+    Stops are the route's termini unless set_stops gives a finer list; the
+    schema has no stop table yet.
+    """
+
+    def __init__(self, routes: RouteCache = route_cache, ingest: IngestBuffer = ingest_buffer,
+                 gps: GpsFilter = gps_filter,
+                 min_interval: float = REPORT_MIN_INTERVAL, max_interval: float = REPORT_MAX_INTERVAL,
+                 deadband: float = REPORT_DEADBAND, stop_deadband: float = REPORT_STOP_DEADBAND,
+                 stop_radius: float = REPORT_STOP_RADIUS, stop_margin: float = REPORT_STOP_MARGIN,
+                 stationary_speed: float = REPORT_STATIONARY_SPEED,
+                 load_factor: float = REPORT_LOAD_FACTOR, gps_accuracy: float = GPS_ACCURACY):
+        self.routes = routes
+        self.ingest = ingest
+        self.gps = gps
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.deadband = deadband
+        self.stop_deadband = stop_deadband
+        self.stop_radius = stop_radius
+        self.stop_margin = stop_margin
+        self.stationary_speed = stationary_speed
+        self.load_factor = load_factor
+        self.gps_accuracy = gps_accuracy
+        self._stops: Dict[str, np.ndarray] = {}
+        # route_id -> (geometry version, stop lats, stop lons)
+        self._stop_points: Dict[str, Tuple[str, np.ndarray, np.ndarray]] = {}
+        self._parked_at: Dict[str, Tuple[float, float]] = {}
+
+        self.advised = {"stop": 0, "moving": 0, "parked": 0, "unknown": 0}
+        self.changes = 0
+
+    def set_stops(self, route_id: str, along: Optional[Sequence[float]]) -> None:
+        """Stop positions as metres along the route; None reverts to the termini."""
+        self._stop_points.pop(route_id, None)
+        if along is None:
+            self._stops.pop(route_id, None)
+        else:
+            self._stops[route_id] = np.sort(np.asarray(along, dtype=np.float64))
+
+    def _stop_distance(self, state: BusState) -> Optional[float]:
+        """Straight-line metres to the nearest stop, coming or going.
+
+        Measured from the position rather than the matched `along`: a route
+        that doubles back on itself can snap a bus onto the other pass.
+        """
+        if state.route_id is None:
+            return None
+        entry = self.routes.get(state.route_id)
+        if entry is None:
+            return None
+        points = self._stop_points.get(state.route_id)
+        if points is None or points[0] != entry.version:
+            stops = self._stops.get(state.route_id)
+            if stops is None:
+                stops = np.array([0.0, entry.total_distance])
+            cum = entry.profile.cum
+            lats = np.frombuffer(entry.geometry.lats, dtype=np.float64)
+            lons = np.frombuffer(entry.geometry.lons, dtype=np.float64)
+            points = (entry.version, np.interp(stops, cum, lats), np.interp(stops, cum, lons))
+            self._stop_points[state.route_id] = points
+        _, lats, lons = points
+        if lats.size == 0:
+            return math.inf
+        dy = (lats - state.lat) * M_PER_DEG
+        dx = (lons - state.lon) * M_PER_DEG * math.cos(math.radians(state.lat))
+        return float(np.sqrt(dx * dx + dy * dy).min())
+
+    def _moved_off(self, bus_number: str, state: BusState) -> bool:
+        """True on the fix that takes a bus off the spot it was standing on."""
+        anchor = self._parked_at.get(bus_number)
+        # The filter only moves the position part way towards the fix that tripped the dead-band
+        if anchor is not None and haversine_m(anchor[0], anchor[1], state.lat, state.lon) <= self.gps_accuracy / 2:
+            return False
+        self._parked_at[bus_number] = (state.lat, state.lon)
+        return anchor is not None
+
+    def forget(self, bus_number: str) -> None:
+        self._parked_at.pop(bus_number, None)
+
+    def advise(self, bus_number: str, state: Optional[BusState]) -> Advice:
+        # The filter's velocity follows every accepted fix, including the ones held back as unmoved
+        speed = self.gps.speed_of(bus_number)
+        distance = self._stop_distance(state) if state is not None else None
+        # Sparse fixes leave the filter's velocity stale; give it a few at full rate before the radius
+        reach = self.stop_radius + self.stop_margin
+        near_stop = distance is not None and distance <= reach
+        # The smoothed speed lags a departure; the position having moved off the spot doesn't
+        moved_off = state is not None and self._moved_off(bus_number, state)
+        stationary = speed is not None and speed < self.stationary_speed and not moved_off
+        scale = 1.0 + (self.load_factor - 1.0) * self.ingest.load
+        parked_deadband = max(_step(self.deadband * scale, 2), self.gps_accuracy)
+        # Pulling away must not carry it into a stop's radius before the dead-band trips
+        clear = distance is None or distance - reach > parked_deadband
+        if stationary and clear:
+            self.advised["parked"] += 1
+            return Advice(self.max_interval, parked_deadband)
+        if near_stop or stationary:
+            # Arrivals and departures are what riders watch for: full rate, whatever the speed,
+            # and for a bus stopped just short of a stop's reach too
+            self.advised["stop"] += 1
+            return Advice(self.min_interval, self.stop_deadband)
+        deadband = self.deadband * scale
+        if distance is not None:
+            # Close in on the edge of the stop's reach rather than overshoot it
+            deadband = max(min(deadband, (distance - reach) / 2), self.stop_deadband)
+        if speed is None:
+            kind, interval = "unknown", round(self.min_interval * scale, 1)
+        else:
+            # The dead-band normally triggers first; the interval is the backstop
+            kind, interval = "moving", _step(2 * deadband / max(speed, self.stationary_speed), 1)
+        self.advised[kind] += 1
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        # Stepping down, so never past the edge of the next stop's reach
+        return Advice(interval, max(_step(deadband, 2, math.floor), self.stop_deadband))
+
+    def revise(self, current: Optional[Advice], bus_number: str, state: Optional[BusState]) -> Optional[Advice]:
+        """The new advice for a driver told `current`, or None if it still holds."""
+        advice = self.advise(bus_number, state)
+        if advice == current:
+            return None
+        self.changes += 1
+        return advice
+
+    def stats(self) -> dict:
+        return {
+            "advised": dict(self.advised),
+            "changes": self.changes,
+            "load": round(self.ingest.load, 3),
+            "routes_with_stops": len(self._stops),
+            "parked": len(self._parked_at),
+            "min_interval": self.min_interval,
+            "max_interval": self.max_interval,
+            "deadband": self.deadband,
+            "stop_radius": self.stop_radius,
+            "stop_margin": self.stop_margin,
+        }
+
+
+reporting_policy = ReportingPolicy()
+fleet_store.on_remove(reporting_policy.forget)
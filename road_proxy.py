@@ -0,0 +1,157 @@
+# road_proxy.py
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from config import (
+    ROAD_ROUTE_CACHE_SIZE,
+    ROAD_ROUTE_CACHE_TTL,
+    ROAD_ROUTE_MAX_CONNECTIONS,
+    ROAD_ROUTE_PRECISION,
+    ROAD_ROUTE_TIMEOUT,
+    ROAD_ROUTE_UPSTREAM,
+)
+
+Key = Tuple[float, float, float, float]
+
+
+class UpstreamError(Exception):
+    """The routing server could not produce a route."""
+
+
+class RoadRouteProxy:
+    """Caching, coalescing client for an OSRM-compatible routing server.
+
+    Coordinates are rounded to `precision` decimals to form the cache key
+    (and the upstream request), results live in an LRU with a TTL, and
+    concurrent requests for the same key share a single upstream call.
+    """
+
+    def __init__(self, upstream: str = ROAD_ROUTE_UPSTREAM, precision: int = ROAD_ROUTE_PRECISION,
+                 max_entries: int = ROAD_ROUTE_CACHE_SIZE, ttl: float = ROAD_ROUTE_CACHE_TTL,
+                 timeout: float = ROAD_ROUTE_TIMEOUT, max_connections: int = ROAD_ROUTE_MAX_CONNECTIONS):
+        self.upstream = upstream.rstrip("/")
+        self.precision = precision
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+        self._cache: "OrderedDict[Key, Tuple[float, dict]]" = OrderedDict()
+        self._inflight: Dict[Key, asyncio.Task] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_requests = 0
+        self.upstream_errors = 0
+        self._upstream_total = 0.0
+        self.upstream_max = 0.0
+
+    def key(self, from_lat: float, from_lon: float, to_lat: float, to_lon: float) -> Key:
+        p = self.precision
+        return round(from_lat, p), round(from_lon, p), round(to_lat, p), round(to_lon, p)
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+
+    async def stop(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _cached(self, key: Key) -> Optional[dict]:
+        item = self._cache.get(key)
+        if item is None:
+            return None
+        expires, payload = item
+        if expires < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return payload
+
+    def _store(self, key: Key, payload: dict) -> None:
+        self._cache[key] = (time.monotonic() + self.ttl, payload)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def _fetch(self, key: Key) -> dict:
+        await self.start()
+        from_lat, from_lon, to_lat, to_lon = key
+        url = f"{self.upstream}/route/v1/driving/{from_lon},{from_lat};{to_lon},{to_lat}"
+        self.upstream_requests += 1
+        started = time.perf_counter()
+        try:
+            response = await self._client.get(url, params={"overview": "full", "geometries": "polyline"})
+            response.raise_for_status()
+            payload = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            self.upstream_errors += 1
+            raise UpstreamError(str(e)) from e
+        finally:
+            elapsed = time.perf_counter() - started
+            self._upstream_total += elapsed
+            self.upstream_max = max(self.upstream_max, elapsed)
+        if payload.get("code") not in (None, "Ok"):
+            # OSRM answers "NoRoute" and friends with a 200; don't cache those
+            raise UpstreamError(payload.get("message") or payload.get("code"))
+        return payload
+
+    async def _fetch_and_store(self, key: Key) -> dict:
+        payload = await self._fetch(key)
+        self._store(key, payload)
+        return payload
+
+    def _finished(self, key: Key, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            # Mark the exception retrieved even if every waiter has gone away
+            task.exception()
+
+    async def route(self, from_lat: float, from_lon: float, to_lat: float, to_lon: float) -> dict:
+        key = self.key(from_lat, from_lon, to_lat, to_lon)
+        payload = self._cached(key)
+        if payload is not None:
+            self.hits += 1
+            return payload
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            # The upstream call runs as its own task so a disconnecting caller
+            # does not cancel it for the others waiting on the same key
+            task = asyncio.create_task(self._fetch_and_store(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "upstream": self.upstream,
+            "cache_entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "in_flight": len(self._inflight),
+            "upstream_requests": self.upstream_requests,
+            "upstream_errors": self.upstream_errors,
+            "avg_upstream_ms": round(self._upstream_total / self.upstream_requests * 1000, 3) if self.upstream_requests else 0.0,
+            "max_upstream_ms": round(self.upstream_max * 1000, 3),
+        }
+
+
+road_route_proxy = RoadRouteProxy()
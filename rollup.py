@@ -0,0 +1,257 @@
+# rollup.py
+"""Rolls old location history down to trajectory-preserving samples and drops expired days.
+
+Run it inside the app (HISTORY_ROLLUP_INTERVAL > 0) or from cron with
+`python rollup.py run`, not both: the two would race on the same staging table.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from config import (HISTORY_RETENTION_DAYS, HISTORY_ROLLUP_AFTER_DAYS, HISTORY_ROLLUP_BATCH,
+                    HISTORY_ROLLUP_INTERVAL, HISTORY_ROLLUP_PAUSE, HISTORY_ROLLUP_TOLERANCE)
+from database import async_session_maker
+from history import TABLE, history_partitions, partition_bounds
+from simplify import dp_importance
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COMMENT = "rollup"
+_COLUMNS = "bus_number, ts, lat, lon, speed, heading"
+_EPOCH = datetime(1970, 1, 1)
+
+
+def compress(rows: List[tuple], anchor: Optional[tuple], tolerance: float) -> List[tuple]:
+    """Keeps the fixes a time-aware Douglas-Peucker pass needs, per bus.
+
+    `rows` are (bus_number, ts, lat, lon, speed, heading) ordered by bus then
+    time. `anchor` is the last row of the previous batch, already kept; a run
+    of the same bus is simplified from it so batch edges don't add vertices
+    beyond the batch's own last row.
+    """
+    kept = []
+    for bus_number, group in groupby(rows, key=lambda row: row[0]):
+        run = list(group)
+        offset = 0
+        if anchor is not None and anchor[0] == bus_number:
+            run.insert(0, anchor)
+            offset = 1
+        times = [(row[1] - _EPOCH).total_seconds() for row in run]
+        importance = dp_importance([row[2] for row in run], [row[3] for row in run], times)
+        kept += [run[i] for i in np.flatnonzero(importance > tolerance) if i >= offset]
+    return kept
+
+
+async def _relation_size(db, name: str) -> int:
+    result = await db.execute(text("SELECT coalesce(pg_total_relation_size(to_regclass(:name)), 0)"), {"name": name})
+    return int(result.scalar())
+
+
+async def _is_rolled_up(db, name: str) -> bool:
+    result = await db.execute(text("SELECT obj_description(to_regclass(:name), 'pg_class')"), {"name": name})
+    return result.scalar() == ROLLUP_COMMENT
+
+
+class HistoryRollup:
+    """Background job that compacts cold days of bus_location_history.
+
+    A day older than `after_days` is read in keyset batches of (bus_number,
+    ts), each batch simplified per bus with synchronized Douglas-Peucker and
+    written to a staging table, which then replaces the day's partition in
+    one short transaction. Days older than `retention_days` are dropped. The
+    job only touches days the ingest path no longer writes to, commits every
+    batch, and sleeps between batches, so live traffic keeps the pool and
+    the event loop.
+    """
+
+    def __init__(self, session_maker=async_session_maker, after_days: int = HISTORY_ROLLUP_AFTER_DAYS,
+                 retention_days: int = HISTORY_RETENTION_DAYS, tolerance: float = HISTORY_ROLLUP_TOLERANCE,
+                 batch_size: int = HISTORY_ROLLUP_BATCH, pause: float = HISTORY_ROLLUP_PAUSE,
+                 interval: float = HISTORY_ROLLUP_INTERVAL):
+        self.session_maker = session_maker
+        self.after_days = after_days
+        self.retention_days = retention_days
+        self.tolerance = tolerance
+        self.batch_size = batch_size
+        self.pause = pause
+        self.interval = interval
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.runs = 0
+        self.errors = 0
+        self.partitions_rolled_up = 0
+        self.partitions_skipped = 0
+        self.partitions_dropped = 0
+        self.rows_read = 0
+        self.rows_kept = 0
+        self.bytes_reclaimed = 0
+        self._busy_seconds = 0.0
+        self.last_run: Optional[datetime] = None
+        self.last_duration = 0.0
+
+    async def _read_batch(self, name: str, after: Tuple[str, datetime]) -> List[tuple]:
+        async with self.session_maker() as db:
+            result = await db.execute(text(
+                f"SELECT {_COLUMNS} FROM {name} WHERE (bus_number, ts) > (:bus_number, :ts) "
+                f"ORDER BY bus_number, ts LIMIT :limit"
+            ), {"bus_number": after[0], "ts": after[1], "limit": self.batch_size})
+            return [tuple(row) for row in result.all()]
+
+    async def _write_batch(self, staging: str, rows: List[tuple]) -> None:
+        async with self.session_maker() as db:
+            await db.execute(
+                text(f"INSERT INTO {staging} ({_COLUMNS}) VALUES (:bus_number, :ts, :lat, :lon, :speed, :heading)"),
+                [dict(zip(("bus_number", "ts", "lat", "lon", "speed", "heading"), row)) for row in rows],
+            )
+            await db.commit()
+
+    async def rollup_partition(self, name: str, day: date) -> bool:
+        """Replaces one day's partition with its compressed copy; False if it changed meanwhile."""
+        staging = f"{name}_rollup"
+        async with self.session_maker() as db:
+            size_before = await _relation_size(db, name)
+            await db.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+            await db.execute(text(f"CREATE TABLE {staging} (LIKE {TABLE} INCLUDING ALL)"))
+            await db.commit()
+
+        read = kept = 0
+        after, anchor = ("", datetime.min), None
+        while True:
+            started = time.perf_counter()
+            rows = await self._read_batch(name, after)
+            if not rows:
+                break
+            survivors = compress(rows, anchor, self.tolerance)
+            if survivors:
+                await self._write_batch(staging, survivors)
+            read += len(rows)
+            kept += len(survivors)
+            anchor = rows[-1]
+            after = anchor[:2]
+            self._busy_seconds += time.perf_counter() - started
+            self.rows_read += len(rows)
+            self.rows_kept += len(survivors)
+            await asyncio.sleep(self.pause)
+
+        async with self.session_maker() as db:
+            # Block writers to this day only while checking and swapping
+            await db.execute(text(f"LOCK TABLE {name} IN EXCLUSIVE MODE"))
+            current = (await db.execute(text(f"SELECT count(*) FROM {name}"))).scalar()
+            if current != read:
+                await db.rollback()
+                await db.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+                await db.commit()
+                self.partitions_skipped += 1
+                logger.warning(f"{name} gained {current - read} rows during rollup; retrying next run")
+                return False
+            await db.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+            await db.execute(text(f"DROP TABLE {name}"))
+            await db.execute(text(f"ALTER TABLE {staging} RENAME TO {name}"))
+            await db.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} {partition_bounds(day)}"))
+            await db.execute(text(f"COMMENT ON TABLE {name} IS '{ROLLUP_COMMENT}'"))
+            await db.commit()
+            size_after = await _relation_size(db, name)
+
+        self.partitions_rolled_up += 1
+        self.bytes_reclaimed += max(size_before - size_after, 0)
+        logger.info(f"Rolled up {name}: {read} -> {kept} fixes, {size_before} -> {size_after} bytes")
+        return True
+
+    async def drop_expired(self, today: date) -> List[str]:
+        cutoff = today - timedelta(days=self.retention_days)
+        async with self.session_maker() as db:
+            expired = [name for name, day in await history_partitions.partitions(db) if day < cutoff]
+            size = 0
+            for name in expired:
+                size += await _relation_size(db, name)
+            dropped = await history_partitions.drop_before(db, cutoff)
+        self.partitions_dropped += len(dropped)
+        self.bytes_reclaimed += size
+        return dropped
+
+    async def run_once(self, today: Optional[date] = None) -> dict:
+        """Drops expired days, then rolls up every cold day not yet compacted."""
+        today = today or datetime.utcnow().date()
+        async with self._lock:
+            started = time.perf_counter()
+            dropped = await self.drop_expired(today)
+            cold = today - timedelta(days=self.after_days)
+            async with self.session_maker() as db:
+                candidates = [(name, day) for name, day in await history_partitions.partitions(db)
+                              if day < cold and not await _is_rolled_up(db, name)]
+            rolled = [name for name, day in candidates if await self.rollup_partition(name, day)]
+            self.runs += 1
+            self.last_run = datetime.utcnow()
+            self.last_duration = time.perf_counter() - started
+        return {"dropped": dropped, "rolled_up": rolled, "seconds": round(self.last_duration, 2)}
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"History rollup failed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "errors": self.errors,
+            "partitions_rolled_up": self.partitions_rolled_up,
+            "partitions_skipped": self.partitions_skipped,
+            "partitions_dropped": self.partitions_dropped,
+            "rows_read": self.rows_read,
+            "rows_kept": self.rows_kept,
+            "rows_per_sec": round(self.rows_read / self._busy_seconds, 1) if self._busy_seconds else 0.0,
+            "bytes_reclaimed": self.bytes_reclaimed,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_duration": round(self.last_duration, 2),
+            "after_days": self.after_days,
+            "retention_days": self.retention_days,
+            "tolerance": self.tolerance,
+        }
+
+
+history_rollup = HistoryRollup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("run", help="drop expired days and roll up cold ones, once")
+    p.add_argument("--after-days", type=int, default=HISTORY_ROLLUP_AFTER_DAYS)
+    p.add_argument("--retention-days", type=int, default=HISTORY_RETENTION_DAYS)
+    p.add_argument("--tolerance", type=float, default=HISTORY_ROLLUP_TOLERANCE, help="metres")
+    p.add_argument("--batch", type=int, default=HISTORY_ROLLUP_BATCH)
+    args = parser.parse_args()
+
+    rollup = HistoryRollup(after_days=args.after_days, retention_days=args.retention_days,
+                           tolerance=args.tolerance, batch_size=args.batch, pause=0)
+    print(asyncio.run(rollup.run_once()))
+    print(rollup.stats())
+
+
+if __name__ == "__main__":
+    main()
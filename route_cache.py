@@ -0,0 +1,171 @@
+# route_cache.py
+import hashlib
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+
+from codec import encode_polyline
+from config import ROUTE_LOD_MAX_ZOOM
+from crud import get_all_route_geometries, get_route_geometry
+from geometry import DistanceProfile, RouteGeometry
+from mapmatch import RouteMatcher
+from simplify import RouteLod
+
+
+class RouteEntry:
+    """One version of a route's geometry plus artifacts derived from it."""
+    __slots__ = ("route_id", "geometry", "version", "profile", "_matcher", "_lod", "_encoded")
+
+    def __init__(self, route_id: str, geometry: RouteGeometry):
+        self.route_id = route_id
+        self.geometry = geometry
+        # Content hash of the packed geometry; changes whenever the coordinates do
+        self.version = hashlib.sha256(geometry.to_bytes()).hexdigest()[:16]
+        # Built once per version: O(1) route length, O(log n) distance lookups
+        self.profile = DistanceProfile.from_geometry(geometry)
+        self._matcher: Optional[RouteMatcher] = None
+        self._lod: Optional[RouteLod] = None
+        # Serialized forms keyed by (format, zoom); zoom None is full resolution
+        self._encoded: Dict[Tuple[str, Optional[int]], bytes] = {}
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.version}"'
+
+    def etag_for(self, zoom: Optional[int] = None, tolerance: Optional[float] = None, fmt: str = "json") -> str:
+        """ETag of one level-of-detail variant and format of this version."""
+        tag = self.version
+        if tolerance is not None:
+            tag += f"-t{tolerance:g}"
+        elif zoom is not None:
+            tag += f"-z{zoom}"
+        if fmt != "json":
+            tag += f"-{fmt}"
+        return f'"{tag}"'
+
+    @property
+    def coordinates(self) -> List[dict]:
+        """Geometry in the JSON `[{"lat", "lon"}]` shape; built on each call."""
+        return self.geometry.to_coordinates()
+
+    @property
+    def matcher(self) -> RouteMatcher:
+        """Segment arrays for snapping positions to this route, built on first use."""
+        if self._matcher is None:
+            self._matcher = RouteMatcher(self.geometry, self.profile)
+        return self._matcher
+
+    @property
+    def lod(self) -> RouteLod:
+        """Simplified per-zoom variants of this route, built on first use."""
+        if self._lod is None:
+            self._lod = RouteLod(self.geometry)
+        return self._lod
+
+    @property
+    def total_distance(self) -> float:
+        """Route length in metres."""
+        return self.profile.total
+
+    def level(self, zoom: Optional[int] = None, tolerance: Optional[float] = None) -> RouteGeometry:
+        """The geometry simplified for a zoom level or tolerance in metres; full by default."""
+        if tolerance is not None:
+            return self.lod.simplify(tolerance)
+        zoom = _lod_zoom(zoom)
+        return self.geometry if zoom is None else self.lod.for_zoom(zoom)
+
+    def _encode(self, kind: str, zoom: Optional[int], tolerance: Optional[float], build) -> bytes:
+        # The full geometry and each zoom level are built once per version; an
+        # explicit tolerance is simplified on every call
+        if tolerance is not None:
+            return build(self.level(tolerance=tolerance))
+        key = (kind, _lod_zoom(zoom))
+        encoded = self._encoded.get(key)
+        if encoded is None:
+            encoded = self._encoded[key] = build(self.level(zoom))
+        return encoded
+
+    def coordinates_json(self, zoom: Optional[int] = None, tolerance: Optional[float] = None) -> bytes:
+        """Serialized `[{"lat", "lon"}]` list, optionally simplified."""
+        return self._encode("coordinates", zoom, tolerance, lambda g: _dump(g.to_coordinates()))
+
+    def json_bytes(self, zoom: Optional[int] = None, tolerance: Optional[float] = None) -> bytes:
+        """Serialized geometry payload, optionally simplified."""
+        return self._encode("json", zoom, tolerance, lambda g: (
+            b'{"route_id":' + json.dumps(self.route_id).encode()
+            + b',"route_coordinates":' + self.coordinates_json(zoom, tolerance) + b"}"
+        ))
+
+    def polyline(self, zoom: Optional[int] = None, tolerance: Optional[float] = None) -> bytes:
+        """Google encoded polyline of the geometry, optionally simplified."""
+        return self._encode("polyline", zoom, tolerance, lambda g: encode_polyline(g.lats, g.lons))
+
+
+def _lod_zoom(zoom: Optional[int]) -> Optional[int]:
+    """Clamps a requested zoom; None means full resolution."""
+    if zoom is None or zoom > ROUTE_LOD_MAX_ZOOM:
+        return None
+    return max(zoom, 0)
+
+
+def _dump(coordinates: List[dict]) -> bytes:
+    return json.dumps(coordinates, separators=(",", ":")).encode()
+
+
+class RouteCache:
+    """Process-local cache of route geometry keyed by route_id."""
+
+    def __init__(self):
+        self._entries: Dict[str, RouteEntry] = {}
+        self._listeners: List[Callable[[str, Optional[RouteEntry]], None]] = []
+
+    def on_change(self, listener: Callable[[str, Optional[RouteEntry]], None]) -> None:
+        """Registers a callback run with (route_id, new entry or None on invalidation)."""
+        self._listeners.append(listener)
+
+    def _notify(self, route_id: str, entry: Optional[RouteEntry]) -> None:
+        for listener in self._listeners:
+            listener(route_id, entry)
+
+    def get(self, route_id: str) -> Optional[RouteEntry]:
+        return self._entries.get(route_id)
+
+    def put(self, route_id: str, geometry: RouteGeometry) -> RouteEntry:
+        entry = self._entries.get(route_id)
+        if entry is None or entry.geometry != geometry:
+            entry = RouteEntry(route_id, geometry)
+            self._entries[route_id] = entry
+            self._notify(route_id, entry)
+        return entry
+
+    def invalidate(self, route_id: str) -> None:
+        """Drops a route so the next read reloads it from the database."""
+        if self._entries.pop(route_id, None) is not None:
+            self._notify(route_id, None)
+
+    async def load(self, db, route_id: str) -> Optional[RouteEntry]:
+        """Returns the cached route, loading it from the database on a miss."""
+        entry = self._entries.get(route_id)
+        if entry is None:
+            geometry = await get_route_geometry(db, route_id)
+            if geometry:
+                entry = self.put(route_id, geometry)
+        return entry
+
+    async def reload(self, db, route_id: str) -> Optional[RouteEntry]:
+        """Re-reads a route after a write; an unchanged geometry keeps its entry and listeners stay quiet."""
+        geometry = await get_route_geometry(db, route_id)
+        if not geometry:
+            self.invalidate(route_id)
+            return None
+        return self.put(route_id, geometry)
+
+    async def seed(self, db) -> None:
+        for route_id, geometry in await get_all_route_geometries(db):
+            if geometry:
+                self.put(route_id, geometry)
+
+    def route_ids(self) -> List[str]:
+        return list(self._entries)
+
+
+route_cache = RouteCache()
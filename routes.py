@@ -1,13 +1,37 @@
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Depends, status
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Depends, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from schemas import UserCreate, UserResponse, LocationUpdate, RouteDataSubmit
-from database import get_db
+from database import get_db, async_session_maker
 from models import User, RouteInfo
 from auth import get_current_user, authenticate_user, create_access_token
-from schemas import BusLogin
+from schemas import BusLogin, EtaBatchRequest
 import json
-from crud import create_bus_driver, update_bus_location, create_route_data, get_route_coordinates, get_route_info, get_bus_locations_on_route
+import asyncio
+import zlib
+from typing import Optional
+from datetime import datetime, timedelta, timezone
+from ingest import ingest_buffer
+from fleet import fleet_store
+from broadcast import route_hub
+from route_cache import route_cache
+from pipeline import backfill_fix_records, process_location, process_fix_records
+from driver_session import DriverSession, bearer_token, driver_sessions
+from gps_filter import REJECT, gps_filter
+from reporting import reporting_policy
+from deadreckon import dead_reckoner, predicted_channel
+from eta import eta_engine
+from spatial import bus_index, bearing_deg
+from geometry import haversine_m
+from planner import journey_planner
+from road_proxy import road_route_proxy, UpstreamError
+from tiles import MVT_MEDIA_TYPE, route_tiles
+from history import history_partitions
+from rollup import history_rollup
+from crud import create_bus_driver, create_route_data, get_route_info, get_bus_locations_on_route, get_bus_locations_on_routes, get_bus_location_history, stream_bus_location_history, get_bus_location_bracket, merge_location_history
+from codec import FIX_MEDIA_TYPE, FIX_SUBPROTOCOL, POLYLINE_MEDIA_TYPE, POSITIONS_MEDIA_TYPE, decode_fix_frame, decode_fix_frames, encode_ack, encode_rate, encode_positions
+from config import DRIVER_ACK_EVERY, DRIVER_ACK_INTERVAL, DRIVER_WS_ALLOW_ANONYMOUS, INGEST_BATCH_MAX_BYTES, INGEST_BATCH_MAX_FIXES, HISTORY_RECENT_MAX_SECONDS, HISTORY_STREAM_BATCH, FLEET_SNAPSHOT_MAX_ROUTES, ROUTE_GEOMETRY_MAX_AGE, ROUTE_TILE_MAX_AGE, ETA_MAX_BATCH, NEARBY_MAX_RADIUS, NEARBY_MAX_K
 
 router = APIRouter()
 
@@ -46,6 +70,7 @@ async def create_bus_driver_handler(user: UserCreate, db: AsyncSession = Depends
     if existing_user:
         raise HTTPException(status_code=400, detail="Bus number already registered")
     new_user = await create_bus_driver(db, user)
+    fleet_store.register_bus(new_user.bus_number, new_user.route_id)
     return new_user
 
 @router.post("/submit_route_data/")
@@ -55,23 +80,109 @@ async def submit_route_data_handler(route_data: RouteDataSubmit, db: AsyncSessio
     if not route:
         raise HTTPException(status_code=404, detail="Route not found")
     processed_route_data = await create_route_data(db, route_data)
+    # Status updates carry no geometry, so keep the route matched for live fixes
+    await route_cache.reload(db, route_data.route_id)
     return {"message": "Route data successfully received and processed", "route_data": processed_route_data}
 
+async def _send_rate_advice(websocket: WebSocket, session: DriverSession, binary: bool):
+    """Sends the driver a new reporting interval and dead-band when its advice changes."""
+    advice = reporting_policy.revise(session.advice, session.bus_number, fleet_store.get(session.bus_number))
+    if advice is None:
+        return
+    session.advice = advice
+    if binary:
+        await websocket.send_bytes(encode_rate(*advice))
+    else:
+        await websocket.send_text(json.dumps(advice.as_dict()))
+
+async def _receive_fix_frames(websocket: WebSocket, session: Optional[DriverSession]):
+    """bus-fix.v1: binary frames of many fixes, answered by cumulative acks.
+
+    An ack goes out after DRIVER_ACK_EVERY frames, or once the oldest
+    unacked frame has waited DRIVER_ACK_INTERVAL with nothing following it.
+    Frames whose sequence number isn't above the last one are only re-acked.
+    With a session, fixes for any other bus are rejected, and a rate frame
+    follows any frame that changes the bus's reporting advice.
+    """
+    last_seq = None
+    unacked = accepted = rejected = 0
+    only_bus = session.bus_number if session is not None else None
+    while True:
+        try:
+            message = await asyncio.wait_for(websocket.receive(), DRIVER_ACK_INTERVAL if unacked else None)
+        except asyncio.TimeoutError:
+            message = None
+        if message is not None:
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes") is None:
+                await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA, reason="bus-fix.v1 frames are binary")
+                return
+            try:
+                seq, bus_table, records = decode_fix_frame(message["bytes"])
+            except ValueError as e:
+                await websocket.close(code=status.WS_1007_INVALID_FRAME_PAYLOAD_DATA, reason=str(e)[:120])
+                return
+            if last_seq is None or seq > last_seq:
+                frame_accepted, frame_rejected = process_fix_records(bus_table, records, only_bus=only_bus)
+                accepted += frame_accepted
+                rejected += frame_rejected
+                last_seq = seq
+                if session is not None:
+                    session.frames += 1
+                    session.fixes += frame_accepted
+                    session.rejected += frame_rejected
+                    session.last_seq = seq
+                    await _send_rate_advice(websocket, session, binary=True)
+            unacked += 1
+            if unacked < DRIVER_ACK_EVERY:
+                continue
+        await websocket.send_bytes(encode_ack(last_seq, accepted, rejected))
+        unacked = accepted = rejected = 0
+
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, db: AsyncSession = Depends(get_db)):
-    await websocket.accept()
+async def websocket_endpoint(websocket: WebSocket):
+    # Authenticate once at connect; the socket then holds no DB connection
+    token = bearer_token(websocket)
+    session = None
+    if token is not None or not DRIVER_WS_ALLOW_ANONYMOUS:
+        session = await driver_sessions.open(token)
+        if session is None:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+    try:
+        if FIX_SUBPROTOCOL in websocket.scope.get("subprotocols", []):
+            await websocket.accept(subprotocol=FIX_SUBPROTOCOL)
+            try:
+                await _receive_fix_frames(websocket, session)
+            except WebSocketDisconnect:
+                print("Driver disconnected from binary location WebSocket")
+            return
+        await websocket.accept()
+        await _receive_json_fixes(websocket, session)
+    finally:
+        driver_sessions.close(session)
+
+async def _receive_json_fixes(websocket: WebSocket, session: Optional[DriverSession]):
     try:
         while True:
             data = await websocket.receive_text()
             try:
                 location_data = json.loads(data)
+                if session is not None:
+                    # The socket's identity is the token's; the field is optional and must agree
+                    if location_data.setdefault("bus_number", session.bus_number) != session.bus_number:
+                        raise ValueError(f"bus_number does not match the authenticated bus {session.bus_number}")
                 location = LocationUpdate(**location_data)
-                try:
-                    await update_bus_location(db, location)
-                    await websocket.send_text(f"Location updated for bus {location.bus_number}")
-                except Exception as db_error:
-                    await websocket.send_text(f"Database Error: {str(db_error)}")
-                    print(f"Database error during update_bus_location: {db_error}")
+                # Buffered write-behind; the driver is acked as soon as the fix is queued
+                verdict, _ = process_location(location)
+                if session is not None and verdict == REJECT:
+                    session.rejected += 1
+                elif session is not None:
+                    session.fixes += 1
+                await websocket.send_text(f"Location updated for bus {location.bus_number}")
+                if session is not None:
+                    await _send_rate_advice(websocket, session, binary=False)
             except json.JSONDecodeError as json_error:
                 await websocket.send_text(f"Invalid JSON: {str(json_error)}")
                 print(f"JSON decode error: {json_error}")
@@ -89,7 +200,7 @@ async def websocket_endpoint(websocket: WebSocket, db: AsyncSession = Depends(ge
         print("WebSocket connection closed.")
 
 @router.websocket("/ws/route")
-async def websocket_route_endpoint(websocket: WebSocket, db: AsyncSession = Depends(get_db)):
+async def websocket_route_endpoint(websocket: WebSocket):
     await websocket.accept()
     try:
         while True:
@@ -97,27 +208,30 @@ async def websocket_route_endpoint(websocket: WebSocket, db: AsyncSession = Depe
             try:
                 route_data = json.loads(data)
                 route_data_obj = RouteDataSubmit(**route_data)
-                result = await db.execute(select(RouteInfo).filter(RouteInfo.route_id == route_data_obj.route_id))
-                existing_route = result.scalar_one_or_none()
-                if existing_route:
-                    existing_route.current_lat = route_data_obj.current_lat
-                    existing_route.current_lon = route_data_obj.current_lon
-                    existing_route.final_lat = route_data_obj.final_lat
-                    existing_route.final_lon = route_data_obj.final_lon
-                    existing_route.final_destination = route_data_obj.final_destination
-                    existing_route.timestamp = route_data_obj.timestamp
-                else:
-                    new_route = RouteInfo(
-                        route_id=route_data_obj.route_id,
-                        current_lat=route_data_obj.current_lat,
-                        current_lon=route_data_obj.current_lon,
-                        final_lat=route_data_obj.final_lat,
-                        final_lon=route_data_obj.final_lon,
-                        final_destination=route_data_obj.final_destination,
-                        timestamp=route_data_obj.timestamp
-                    )
-                    db.add(new_route)
-                await db.commit()
+                # Borrow a connection per update rather than pinning one for the socket's lifetime
+                async with async_session_maker() as db:
+                    result = await db.execute(select(RouteInfo).filter(RouteInfo.route_id == route_data_obj.route_id))
+                    existing_route = result.scalar_one_or_none()
+                    if existing_route:
+                        existing_route.current_lat = route_data_obj.current_lat
+                        existing_route.current_lon = route_data_obj.current_lon
+                        existing_route.final_lat = route_data_obj.final_lat
+                        existing_route.final_lon = route_data_obj.final_lon
+                        existing_route.final_destination = route_data_obj.final_destination
+                        existing_route.timestamp = route_data_obj.timestamp
+                    else:
+                        new_route = RouteInfo(
+                            route_id=route_data_obj.route_id,
+                            current_lat=route_data_obj.current_lat,
+                            current_lon=route_data_obj.current_lon,
+                            final_lat=route_data_obj.final_lat,
+                            final_lon=route_data_obj.final_lon,
+                            final_destination=route_data_obj.final_destination,
+                            timestamp=route_data_obj.timestamp
+                        )
+                        db.add(new_route)
+                    await db.commit()
+                    await route_cache.reload(db, route_data_obj.route_id)
                 await websocket.send_text(f"Route data for route {route_data_obj.route_id} updated successfully!")
             except Exception as e:
                 await websocket.send_text(f"Error: {str(e)}")
@@ -136,19 +250,431 @@ async def get_route_info_handler(route_id: int, db: AsyncSession = Depends(get_d
 import logging
 
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag == etag or tag == f"W/{etag}":
+            return True
+    return False
+
+
+def _negotiate(request: Request, fmt: str, offers: dict) -> str:
+    """Picks a format name from ?format= or else the Accept header.
+
+    `offers` maps format names to media types; the first is the default,
+    also used when nothing in Accept matches.
+    """
+    if fmt is not None:
+        if fmt not in offers:
+            raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(offers)}")
+        return fmt
+    ranked = []
+    for i, part in enumerate(request.headers.get("accept", "").split(",")):
+        media, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media and q > 0:
+            ranked.append((-q, i, media.lower()))
+    for _, _, media in sorted(ranked):
+        for name, offered in offers.items():
+            if media in (offered, "*/*", offered.split("/")[0] + "/*"):
+                return name
+    return next(iter(offers))
+
+
 # Configure logging
 logging.basicConfig(level=logging.ERROR)  # Set logging level to ERROR
 
 @router.get("/route_path/{route_id}/")
-async def get_route_path_handler(route_id: str, db: AsyncSession = Depends(get_db)):
+async def get_route_path_handler(route_id: str, zoom: int = Query(None, ge=0, le=30),
+                                 tolerance: float = Query(None, ge=0), format: str = Query(None, pattern="^(json|polyline)$"),
+                                 predict: bool = False, db: AsyncSession = Depends(get_db)):
     try:
-        route_coordinates = await get_route_coordinates(db, route_id)
-        bus_locations = await get_bus_locations_on_route(db, route_id)
-        return {"route_coordinates": route_coordinates, "bus_locations": bus_locations}
+        # Served from the in-memory fleet store; the DB is only hit for a route not loaded yet
+        entry = await route_cache.load(db, route_id)
+        # predict=1: positions dead-reckoned along the route as of the last tick, not the last fixes
+        bus_locations = dead_reckoner.positions_on_route(route_id) if predict else fleet_store.buses_on_route(route_id)
+        # Splice the pre-serialized coordinates in rather than re-encoding them per poll
+        if format == "polyline":
+            # Polylines can contain backslashes, so they still need JSON escaping
+            geometry = b'{"route_polyline":' + json.dumps(entry.polyline(zoom, tolerance).decode() if entry else "").encode()
+        else:
+            geometry = b'{"route_coordinates":' + (entry.coordinates_json(zoom, tolerance) if entry else b"[]")
+        body = (
+            geometry
+            + b',"route_version":' + json.dumps(entry.version if entry else None).encode()
+            + b',"bus_locations":' + json.dumps(bus_locations).encode() + b"}"
+        )
+        return Response(content=body, media_type="application/json")
     except Exception as e:
         print(e)
         logging.error(f"Error fetching route path data for route_id {route_id}: {e}", exc_info=True)  # Log detailed error
         raise HTTPException(
           status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to fetch route path data. Please check server logs.",
-        )
\ No newline at end of file
+        )
+
+@router.get("/ingest/stats")
+async def ingest_stats_handler():
+    return ingest_buffer.stats()
+
+@router.get("/drivers/stats")
+async def driver_stats_handler():
+    return driver_sessions.stats()
+
+@router.get("/drivers/reporting/stats")
+async def driver_reporting_stats_handler():
+    return reporting_policy.stats()
+
+@router.get("/ingest/filter/stats")
+async def ingest_filter_stats_handler():
+    return gps_filter.stats()
+
+_BATCH_ENCODINGS = {"identity", "gzip", "deflate"}
+
+async def _read_batch_body(request: Request) -> bytes:
+    """The request body, inflated if gzip/deflate, capped at INGEST_BATCH_MAX_BYTES either way."""
+    media_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if media_type not in (FIX_MEDIA_TYPE, "application/octet-stream"):
+        raise HTTPException(status_code=415, detail=f"Content-Type must be {FIX_MEDIA_TYPE}")
+    encoding = request.headers.get("content-encoding", "identity").strip().lower()
+    if encoding not in _BATCH_ENCODINGS:
+        raise HTTPException(status_code=415, detail="Content-Encoding must be gzip, deflate or identity")
+    if int(request.headers.get("content-length") or 0) > INGEST_BATCH_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Batch too large")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > INGEST_BATCH_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Batch too large")
+    if encoding == "identity":
+        return bytes(body)
+    # wbits=47 accepts both zlib and gzip headers; max_length bounds a decompression bomb
+    inflater = zlib.decompressobj(wbits=47)
+    try:
+        data = inflater.decompress(bytes(body), INGEST_BATCH_MAX_BYTES + 1)
+    except zlib.error as e:
+        raise HTTPException(status_code=400, detail=f"Bad {encoding} body: {e}")
+    if len(data) > INGEST_BATCH_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Batch too large once decompressed")
+    if not inflater.eof:
+        raise HTTPException(status_code=400, detail=f"Truncated {encoding} body")
+    return data
+
+@router.post("/ingest/batch")
+async def ingest_batch_handler(request: Request, current_user: User = Depends(get_current_user),
+                               db: AsyncSession = Depends(get_db)):
+    """Backfills fixes a driver app buffered while offline.
+
+    The body is one or more bus-fix.v1 fix frames, optionally gzip/deflate
+    compressed. Fixes newer than the bus's live position update it as usual;
+    older ones only go to history, merged in one statement that skips any
+    (bus, timestamp) already stored, so a retried upload is harmless.
+    """
+    data = await _read_batch_body(request)
+    try:
+        bus_table, records = decode_fix_frames(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(records) > INGEST_BATCH_MAX_FIXES:
+        raise HTTPException(status_code=413, detail=f"At most {INGEST_BATCH_MAX_FIXES} fixes per batch")
+    history, counts = backfill_fix_records(bus_table, records, only_bus=current_user.bus_number)
+    inserted = 0
+    if history["ts"]:
+        await history_partitions.ensure(db, {ts.date() for ts in history["ts"]})
+        inserted = await merge_location_history(db, history)
+    return {**counts, "inserted": inserted, "already_stored": len(history["ts"]) - inserted}
+
+_GEOMETRY_FORMATS = {"json": "application/json", "polyline": POLYLINE_MEDIA_TYPE}
+
+@router.get("/route_geometry/{route_id}")
+async def get_route_geometry_handler(route_id: str, request: Request, v: str = None,
+                                     zoom: int = Query(None, ge=0, le=30),
+                                     tolerance: float = Query(None, ge=0), format: str = None,
+                                     db: AsyncSession = Depends(get_db)):
+    fmt = _negotiate(request, format, _GEOMETRY_FORMATS)
+    entry = await route_cache.load(db, route_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Route not found")
+    if v is not None and v == entry.version:
+        # A URL pinned to the current version never changes
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = f"public, max-age={ROUTE_GEOMETRY_MAX_AGE}, must-revalidate"
+    etag = entry.etag_for(zoom, tolerance, fmt)
+    headers = {"ETag": etag, "Cache-Control": cache_control, "X-Route-Version": entry.version, "Vary": "Accept"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if fmt == "polyline":
+        return Response(content=entry.polyline(zoom, tolerance), media_type=POLYLINE_MEDIA_TYPE, headers=headers)
+    return Response(content=entry.json_bytes(zoom, tolerance), media_type="application/json", headers=headers)
+
+@router.get("/tiles/routes/{z}/{x}/{y}.mvt")
+async def route_tile_handler(z: int, x: int, y: int, db: AsyncSession = Depends(get_db)):
+    if not route_tiles.min_zoom <= z <= route_tiles.max_zoom or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+    data = await route_tiles.tile(db, z, x, y)
+    return Response(content=data, media_type=MVT_MEDIA_TYPE,
+                    headers={"Cache-Control": f"public, max-age={ROUTE_TILE_MAX_AGE}"})
+
+@router.get("/tiles/stats")
+async def route_tile_stats_handler():
+    return route_tiles.stats()
+
+@router.get("/history/rollup/stats")
+async def history_rollup_stats_handler():
+    return {**history_rollup.stats(), "partitions": history_partitions.stats()}
+
+def _naive_utc(value: datetime) -> datetime:
+    # History timestamps are stored as naive UTC
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+def _fix(row) -> dict:
+    ts, lat, lon, speed, heading = row
+    return {"ts": ts.isoformat(), "lat": lat, "lon": lon, "speed": speed, "heading": heading}
+
+@router.get("/history/{bus_number}/recent")
+async def recent_history_handler(bus_number: str, seconds: float = Query(60, gt=0, le=HISTORY_RECENT_MAX_SECONDS),
+                                 db: AsyncSession = Depends(get_db)):
+    # Served by the (bus_number, ts) key of the current partitions
+    rows = await get_bus_location_history(db, bus_number, datetime.utcnow() - timedelta(seconds=seconds))
+    return {
+        "bus_number": bus_number,
+        "locations": [_fix(row) for row in rows],
+    }
+
+@router.get("/history/{bus_number}")
+async def history_stream_handler(bus_number: str, from_: datetime = Query(..., alias="from"), to: datetime = Query(...),
+                                 step: float = Query(None, gt=0)):
+    """Streams a trajectory as NDJSON, one fix per line, oldest first.
+
+    `step` keeps one fix per step-second bucket for long replays.
+    """
+    since, until = _naive_utc(from_), _naive_utc(to)
+    if until <= since:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+
+    async def lines():
+        # Own session: the request's would be closed before the body is streamed
+        async with async_session_maker() as db:
+            async for rows in stream_bus_location_history(db, bus_number, since, until, step, HISTORY_STREAM_BATCH):
+                yield "".join(json.dumps(_fix(row)) + "\n" for row in rows)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@router.get("/history/{bus_number}/at")
+async def history_at_handler(bus_number: str, ts: datetime, step: float = Query(None, gt=0),
+                             db: AsyncSession = Depends(get_db)):
+    """Position at `ts`, interpolated between the two bracketing fixes."""
+    at = _naive_utc(ts)
+    before, after = await get_bus_location_bracket(db, bus_number, at, step)
+    if before is not None and before.ts == at:
+        after = before
+    if before is None or after is None:
+        raise HTTPException(status_code=404, detail="No fixes on both sides of ts")
+    span = (after.ts - before.ts).total_seconds()
+    fraction = (at - before.ts).total_seconds() / span if span else 0.0
+    moved = haversine_m(before.lat, before.lon, after.lat, after.lon)
+    return {
+        "bus_number": bus_number,
+        "ts": at.isoformat(),
+        "lat": before.lat + (after.lat - before.lat) * fraction,
+        "lon": before.lon + (after.lon - before.lon) * fraction,
+        "speed": moved / span if span else before.speed,
+        "heading": bearing_deg(before.lat, before.lon, after.lat, after.lon) if moved > 0 else before.heading,
+        "before": _fix(before),
+        "after": _fix(after),
+    }
+
+@router.get("/route_progress/{route_id}")
+async def get_route_progress_handler(route_id: str, lat: float, lon: float, db: AsyncSession = Depends(get_db)):
+    entry = await route_cache.load(db, route_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Route not found")
+    snap = entry.matcher.snap(lat, lon)
+    return {
+        "route_id": route_id,
+        "snapped_lat": snap.lat,
+        "snapped_lon": snap.lon,
+        "segment": snap.segment,
+        "cross_track": snap.cross_track,
+        "distance_along": snap.along,
+        "distance_remaining": entry.total_distance - snap.along,
+        "total_distance": entry.total_distance,
+    }
+
+@router.get("/eta/{route_id}")
+async def get_eta_handler(route_id: str, lat: float, lon: float, db: AsyncSession = Depends(get_db)):
+    entry = await route_cache.load(db, route_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Route not found")
+    return {"route_id": route_id, **eta_engine.predict(route_id, entry.matcher, lat, lon)}
+
+@router.post("/eta/{route_id}")
+async def batch_eta_handler(route_id: str, request: EtaBatchRequest, db: AsyncSession = Depends(get_db)):
+    if not request.points:
+        raise HTTPException(status_code=400, detail="points must not be empty")
+    if len(request.points) > ETA_MAX_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {ETA_MAX_BATCH} points per request")
+    entry = await route_cache.load(db, route_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Route not found")
+    predictions = eta_engine.predict_many(
+        route_id, entry.matcher, [p.lat for p in request.points], [p.lon for p in request.points]
+    )
+    return {"route_id": route_id, "predictions": predictions}
+
+@router.get("/nearby")
+async def nearby_buses_handler(lat: float, lon: float, radius: float = 1000.0, k: int = 10):
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise HTTPException(status_code=400, detail="lat/lon out of range")
+    if not (0 < radius <= NEARBY_MAX_RADIUS):
+        raise HTTPException(status_code=400, detail=f"radius must be in (0, {NEARBY_MAX_RADIUS}] metres")
+    if not (0 < k <= NEARBY_MAX_K):
+        raise HTTPException(status_code=400, detail=f"k must be in [1, {NEARBY_MAX_K}]")
+    buses = []
+    for distance, bus_number in bus_index.nearest(lat, lon, radius, k):
+        bus_state = fleet_store.get(bus_number)
+        if bus_state is None:
+            continue
+        buses.append({
+            "bus_number": bus_number,
+            "route_id": bus_state.route_id,
+            "current_lat": bus_state.lat,
+            "current_lon": bus_state.lon,
+            "distance": round(distance, 1),
+        })
+    return {"buses": buses}
+
+def _parse_point(value: str, name: str) -> tuple:
+    try:
+        lat, lon = (float(part) for part in value.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be 'lat,lon'")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise HTTPException(status_code=400, detail=f"{name} is out of range")
+    return lat, lon
+
+@router.get("/plan")
+async def plan_journey_handler(
+    from_: str = Query(..., alias="from"),
+    to: str = Query(...),
+    db: AsyncSession = Depends(get_db),
+):
+    from_lat, from_lon = _parse_point(from_, "from")
+    to_lat, to_lon = _parse_point(to, "to")
+    await journey_planner.refresh(db, route_cache)
+    journey = journey_planner.plan(from_lat, from_lon, to_lat, to_lon)
+    if journey is None:
+        raise HTTPException(status_code=404, detail="No journey found")
+    return journey
+
+@router.get("/road_route")
+async def road_route_handler(from_: str = Query(..., alias="from"), to: str = Query(...)):
+    from_lat, from_lon = _parse_point(from_, "from")
+    to_lat, to_lon = _parse_point(to, "to")
+    try:
+        return await road_route_proxy.route(from_lat, from_lon, to_lat, to_lon)
+    except UpstreamError as e:
+        logging.error(f"Road routing failed for {from_} -> {to}: {e}")
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Road routing service unavailable")
+
+@router.get("/road_route/stats")
+async def road_route_stats_handler():
+    return road_route_proxy.stats()
+
+_POSITION_FORMATS = {"json": "application/json", "binary": POSITIONS_MEDIA_TYPE}
+
+@router.get("/fleet_snapshot")
+async def fleet_snapshot_handler(routes: str, request: Request, format: str = None, db: AsyncSession = Depends(get_db)):
+    fmt = _negotiate(request, format, _POSITION_FORMATS)
+    route_ids = list(dict.fromkeys(r.strip() for r in routes.split(",") if r.strip()))
+    if not route_ids:
+        raise HTTPException(status_code=400, detail="routes must list at least one route_id")
+    if len(route_ids) > FLEET_SNAPSHOT_MAX_ROUTES:
+        raise HTTPException(status_code=400, detail=f"At most {FLEET_SNAPSHOT_MAX_ROUTES} routes per snapshot")
+    try:
+        bus_locations = await get_bus_locations_on_routes(db, route_ids)
+    except Exception as e:
+        logging.error(f"Error fetching fleet snapshot for routes {route_ids}: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch fleet snapshot. Please check server logs.",
+        )
+    if fmt == "binary":
+        return Response(content=encode_positions(bus_locations), media_type=POSITIONS_MEDIA_TYPE,
+                        headers={"Vary": "Accept"})
+    return JSONResponse({"routes": bus_locations}, headers={"Vary": "Accept"})
+
+@router.get("/fleet/stats")
+async def fleet_stats_handler():
+    return fleet_store.stats()
+
+@router.get("/fleet/predicted/stats")
+async def fleet_predicted_stats_handler():
+    return dead_reckoner.stats()
+
+async def _wait_for_rider_disconnect(websocket: WebSocket):
+    # Riders never send anything; receiving only serves to notice the disconnect
+    while True:
+        await websocket.receive_text()
+
+@router.websocket("/ws/subscribe/{route_id}")
+async def websocket_subscribe_endpoint(websocket: WebSocket, route_id: str, zoom: int = Query(None, ge=0, le=30),
+                                       format: str = Query("json", pattern="^(json|polyline)$"), predict: bool = False):
+    await websocket.accept()
+    subscriber = None
+    try:
+        # Short-lived session so an idle rider socket never pins a pool connection
+        async with async_session_maker() as db:
+            entry = await route_cache.load(db, route_id)
+        if format == "polyline":
+            geometry = ',"route_polyline":' + json.dumps(entry.polyline(zoom).decode() if entry else "")
+        else:
+            geometry = ',"route_coordinates":' + (entry.coordinates_json(zoom).decode() if entry else "[]")
+        await websocket.send_text(
+            '{"type":"route","route_id":' + json.dumps(route_id)
+            + ',"version":' + json.dumps(entry.version if entry else None) + geometry + "}"
+        )
+
+        # Subscribe before the snapshot so no update falls between the two. With predict=1 the
+        # rider gets a "predicted" frame of every bus each tick instead of a "bus" frame per fix
+        if predict:
+            subscriber = route_hub.subscribe(predicted_channel(route_id))
+            bus_locations = dead_reckoner.positions_on_route(route_id)
+        else:
+            subscriber = route_hub.subscribe(route_id)
+            bus_locations = fleet_store.buses_on_route(route_id)
+        await websocket.send_json({"type": "snapshot", "bus_locations": bus_locations})
+
+        sender = asyncio.create_task(route_hub.pump(subscriber, websocket.send_text))
+        receiver = asyncio.create_task(_wait_for_rider_disconnect(websocket))
+        done, pending = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        if sender in done and subscriber.closed:
+            print(f"Dropping slow rider on route {route_id}")
+            # The close frame queues behind whatever the rider stopped reading
+            try:
+                await asyncio.wait_for(websocket.close(code=status.WS_1013_TRY_AGAIN_LATER), subscriber.max_lag)
+            except asyncio.TimeoutError:
+                pass
+        for task in done:
+            task.result()
+    except WebSocketDisconnect:
+        print(f"Rider disconnected from route {route_id} subscription")
+    except Exception as e:
+        logging.error(f"Route subscription error for route_id {route_id}: {e}", exc_info=True)
+    finally:
+        if subscriber is not None:
+            route_hub.unsubscribe(subscriber)
+
+@router.get("/broadcast/stats")
+async def broadcast_stats_handler():
+    return route_hub.stats()
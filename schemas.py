@@ -31,4 +31,11 @@ class RouteDataSubmit(BaseModel):
     final_lat: float
     final_lon: float
     final_destination: str
-    timestamp: datetime
\ No newline at end of file
+    timestamp: datetime
+
+class EtaPoint(BaseModel):
+    lat: float
+    lon: float
+
+class EtaBatchRequest(BaseModel):
+    points: List[EtaPoint]
@@ -0,0 +1,119 @@
+# simplify.py
+import math
+from array import array
+from typing import Dict
+
+import numpy as np
+
+from config import ROUTE_LOD_MAX_ZOOM, ROUTE_LOD_PIXEL_TOLERANCE
+from geometry import M_PER_DEG, RouteGeometry
+
+# Web Mercator ground resolution of one 256 px tile pixel at zoom 0, at the equator
+_MERCATOR_M_PER_PX = 2 * math.pi * 6378137.0 / 256
+
+
+def zoom_tolerance(zoom: int, lat: float, pixels: float = ROUTE_LOD_PIXEL_TOLERANCE) -> float:
+    """Ground distance in metres spanned by `pixels` screen pixels at a zoom level."""
+    return pixels * _MERCATOR_M_PER_PX * math.cos(math.radians(lat)) / (2 ** zoom)
+
+
+def dp_importance(lats, lons, times=None) -> np.ndarray:
+    """Douglas-Peucker tolerance (metres) each vertex survives up to.
+
+    A vertex is kept by a Douglas-Peucker pass with tolerance t exactly when
+    its value here is greater than t, so one run prices every level of
+    detail. Ranges are split breadth-first, with each level's point-to-segment
+    distances computed in a single vectorized pass. Endpoints are infinite.
+
+    With `times` (seconds, increasing) the distance is synchronized instead:
+    from each vertex to where the range's chord puts the bus at that time, so
+    stops and speed changes are kept along with turns.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    n = len(lats)
+    importance = np.zeros(n)
+    if n == 0:
+        return importance
+    importance[0] = importance[-1] = np.inf
+    lat0 = float(lats.mean())
+    ky = M_PER_DEG
+    kx = ky * math.cos(math.radians(lat0))
+    x = (lons - lons.mean()) * kx
+    y = (lats - lat0) * ky
+    if times is not None:
+        times = np.asarray(times, dtype=np.float64)
+
+    starts = np.array([0])
+    ends = np.array([n - 1])
+    caps = np.array([np.inf])
+    while True:
+        open_ = ends - starts >= 2
+        starts, ends, caps = starts[open_], ends[open_], caps[open_]
+        if len(starts) == 0:
+            break
+        counts = ends - starts - 1
+        owner = np.repeat(np.arange(len(starts)), counts)
+        first = np.cumsum(counts) - counts
+        idx = starts[owner] + 1 + (np.arange(len(owner)) - first[owner])
+
+        ax, ay = x[starts][owner], y[starts][owner]
+        dx, dy = x[ends][owner] - ax, y[ends][owner] - ay
+        px, py = x[idx] - ax, y[idx] - ay
+        if times is not None:
+            ta = times[starts][owner]
+            span = times[ends][owner] - ta
+            t = np.divide(times[idx] - ta, span, out=np.zeros_like(span), where=span > 0)
+        else:
+            len2 = dx * dx + dy * dy
+            # Closed loops have coincident endpoints; measure from the point instead
+            t = np.divide(px * dx + py * dy, len2, out=np.zeros_like(len2), where=len2 > 0)
+            np.clip(t, 0.0, 1.0, out=t)
+        dist = np.hypot(px - t * dx, py - t * dy)
+
+        # Farthest vertex per range (first one on ties, like a sequential pass)
+        peak = np.maximum.reduceat(dist, first)
+        at_peak = np.flatnonzero(dist == peak[owner])
+        _, pick = np.unique(owner[at_peak], return_index=True)
+        split = idx[at_peak[pick]]
+        # A vertex can't outlive the range split that exposed it
+        value = np.minimum(peak, caps)
+        importance[split] = value
+
+        starts, ends, caps = (np.concatenate((starts, split)), np.concatenate((split, ends)),
+                              np.concatenate((value, value)))
+    return importance
+
+
+class RouteLod:
+    """Per-zoom simplified variants of one route geometry.
+
+    Vertex importances are computed once; each zoom level is then a mask
+    over them, built on first request and kept for the life of the route
+    version.
+    """
+    __slots__ = ("geometry", "importance", "lat", "_levels")
+
+    def __init__(self, geometry: RouteGeometry):
+        self.geometry = geometry
+        self.importance = dp_importance(geometry.lats, geometry.lons)
+        self.lat = float(np.mean(geometry.lats)) if len(geometry) else 0.0
+        self._levels: Dict[int, RouteGeometry] = {}
+
+    def simplify(self, tolerance: float) -> RouteGeometry:
+        """Geometry with no vertex dropped that deviates more than `tolerance` metres."""
+        if tolerance <= 0:
+            return self.geometry
+        keep = np.flatnonzero(self.importance > tolerance)
+        lats = np.frombuffer(self.geometry.lats, dtype=np.float64)[keep]
+        lons = np.frombuffer(self.geometry.lons, dtype=np.float64)[keep]
+        return RouteGeometry(array("d", lats.tobytes()), array("d", lons.tobytes()))
+
+    def for_zoom(self, zoom: int) -> RouteGeometry:
+        if zoom > ROUTE_LOD_MAX_ZOOM:
+            return self.geometry
+        zoom = max(zoom, 0)
+        level = self._levels.get(zoom)
+        if level is None:
+            level = self._levels[zoom] = self.simplify(zoom_tolerance(zoom, self.lat))
+        return level
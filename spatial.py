@@ -0,0 +1,123 @@
+# spatial.py
+import heapq
+import math
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import SPATIAL_CELL_DEG
+from fleet import fleet_store
+from geometry import M_PER_DEG, haversine_m
+
+
+def bearing_deg(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Initial great-circle bearing from point 1 to point 2, degrees clockwise from north."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dlam = math.radians(lon2 - lon1)
+    y = math.sin(dlam) * math.cos(phi2)
+    x = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(dlam)
+    return math.degrees(math.atan2(y, x)) % 360.0
+
+
+class GridIndex:
+    """Buckets live bus positions into a uniform lat/lon grid.
+
+    Updates move a bus between cells in O(1). Nearest-neighbour queries scan
+    rings of cells outward from the query point and stop as soon as no
+    unscanned cell can hold anything closer, so query cost depends on local
+    bus density rather than fleet size.
+    """
+
+    def __init__(self, cell_deg: float = SPATIAL_CELL_DEG):
+        self.cell_deg = cell_deg
+        self._cells: Dict[Tuple[int, int], Set[str]] = {}
+        self._positions: Dict[str, Tuple[float, float, Tuple[int, int]]] = {}
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def update(self, key: str, lat: float, lon: float) -> None:
+        cell = self._cell(lat, lon)
+        old = self._positions.get(key)
+        if old is not None and old[2] != cell:
+            self._discard(key, old[2])
+        if old is None or old[2] != cell:
+            self._cells.setdefault(cell, set()).add(key)
+        self._positions[key] = (lat, lon, cell)
+
+    def _discard(self, key: str, cell: Tuple[int, int]) -> None:
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(key)
+            if not members:
+                del self._cells[cell]
+
+    def remove(self, key: str) -> None:
+        old = self._positions.pop(key, None)
+        if old is not None:
+            self._discard(key, old[2])
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def _ring(self, ci: int, cj: int, r: int):
+        if r == 0:
+            yield ci, cj
+            return
+        for j in range(cj - r, cj + r + 1):
+            yield ci - r, j
+            yield ci + r, j
+        for i in range(ci - r + 1, ci + r):
+            yield i, cj - r
+            yield i, cj + r
+
+    def nearest(self, lat: float, lon: float, radius_m: float, k: int) -> List[Tuple[float, str]]:
+        """Returns up to k (distance_m, key) pairs within radius_m, closest first."""
+        ci, cj = self._cell(lat, lon)
+        # Every cell in ring r+1 is at least r cell-widths from the query point;
+        # a cell is narrowest east-west at the pole-ward edge of the search area
+        extent_deg = radius_m / M_PER_DEG
+        edge_lat = min(abs(lat) + extent_deg + self.cell_deg, 89.9)
+        cell_m = self.cell_deg * M_PER_DEG * math.cos(math.radians(edge_lat))
+        max_ring = int(radius_m // cell_m) + 1 if cell_m > 0 else 0
+
+        best: List[Tuple[float, str]] = []  # max-heap via negated distance
+        positions = self._positions
+        cells = self._cells
+        for r in range(max_ring + 1):
+            for cell in self._ring(ci, cj, r):
+                members = cells.get(cell)
+                if not members:
+                    continue
+                for key in members:
+                    blat, blon, _ = positions[key]
+                    d = haversine_m(lat, lon, blat, blon)
+                    if d > radius_m:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, key))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, key))
+            if len(best) >= k and -best[0][0] <= r * cell_m:
+                break
+        return sorted((-d, key) for d, key in best)
+
+    def within(self, lat: float, lon: float, radius_m: float) -> List[Tuple[float, str]]:
+        """Returns every (distance_m, key) within radius_m, closest first."""
+        return self.nearest(lat, lon, radius_m, max(len(self._positions), 1))
+
+    def nearest_linear(self, lat: float, lon: float, radius_m: float, k: int) -> List[Tuple[float, str]]:
+        """Reference full scan, used to check and benchmark `nearest`."""
+        hits = []
+        for key, (blat, blon, _) in self._positions.items():
+            d = haversine_m(lat, lon, blat, blon)
+            if d <= radius_m:
+                hits.append((d, key))
+        return heapq.nsmallest(k, hits)
+
+    def position(self, key: str) -> Optional[Tuple[float, float]]:
+        entry = self._positions.get(key)
+        return (entry[0], entry[1]) if entry else None
+
+
+bus_index = GridIndex()
+fleet_store.on_remove(bus_index.remove)
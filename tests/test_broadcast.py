@@ -0,0 +1,134 @@
+import asyncio
+import json
+
+from broadcast import ChannelStats, RouteHub, Subscriber
+
+
+def _subscriber(max_pending=3, max_lag=2.0):
+    return Subscriber("r", ChannelStats(), max_pending=max_pending, max_lag=max_lag)
+
+
+def _take(subscriber):
+    return [frame for frame, _ in asyncio.run(subscriber.next_frames())]
+
+
+def test_newer_frame_for_a_bus_replaces_the_waiting_one():
+    subscriber = _subscriber()
+    assert subscriber.offer("A", "a1", 0.0)
+    assert subscriber.offer("B", "b1", 0.0)
+    assert subscriber.offer("A", "a2", 0.1)
+    assert _take(subscriber) == ["b1", "a2"]
+    assert subscriber.stats.dropped == 1
+
+
+def test_full_mailbox_drops_the_oldest_frame():
+    subscriber = _subscriber(max_pending=2)
+    for key in ("A", "B", "C"):
+        subscriber.offer(key, key, 0.0)
+    assert _take(subscriber) == ["B", "C"]
+    assert subscriber.stats.dropped == 1
+
+
+def test_unkeyed_frames_are_never_coalesced():
+    subscriber = _subscriber()
+    subscriber.offer(None, "x", 0.0)
+    subscriber.offer(None, "y", 0.0)
+    assert _take(subscriber) == ["x", "y"]
+
+
+def test_lagging_past_max_lag_asks_for_a_disconnect():
+    subscriber = _subscriber(max_pending=1, max_lag=2.0)
+    subscriber.offer("A", "a", 0.0)
+    assert subscriber.offer("B", "b", 1.0)  # first loss starts the clock
+    assert subscriber.offer("C", "c", 2.5)
+    assert not subscriber.offer("D", "d", 3.5)
+
+
+def test_catching_up_resets_the_lag_clock():
+    subscriber = _subscriber(max_pending=1, max_lag=2.0)
+    subscriber.offer("A", "a", 0.0)
+    subscriber.offer("B", "b", 1.0)
+    _take(subscriber)
+    subscriber.offer("C", "c", 5.0)
+    assert subscriber.offer("D", "d", 6.0)
+
+
+def test_publish_closes_slow_subscribers():
+    hub = RouteHub(max_pending=1, max_lag=0.0)
+    slow = hub.subscribe("r")
+    # Every publish after the first overflows the never-read mailbox
+    fan_out = [hub.publish("r", {"n": n}, key=str(n)) for n in range(100)]
+    assert fan_out[:2] == [1, 1]
+    assert fan_out[-1] == 0
+    assert slow.closed
+    assert hub.subscriber_count("r") == 0
+    assert hub.stats()["channels"]["r"]["slow_disconnects"] == 1
+
+
+def test_pump_delivers_published_frames_until_closed():
+    async def run():
+        hub = RouteHub()
+        subscriber = hub.subscribe("r")
+        sent = []
+        delivered = asyncio.Event()
+
+        async def send(frame):
+            sent.append(json.loads(frame))
+            if len(sent) == 2:
+                delivered.set()
+
+        pump = asyncio.create_task(hub.pump(subscriber, send))
+        hub.publish("r", {"n": 1}, key="A")
+        hub.publish("r", {"n": 2}, key="B")
+        await asyncio.wait_for(delivered.wait(), 1.0)
+        subscriber.close()
+        await asyncio.wait_for(pump, 1.0)
+        return sent, subscriber.stats.delivered
+
+    assert asyncio.run(run()) == ([{"n": 1}, {"n": 2}], 2)
+
+
+def test_close_cancels_a_send_stuck_behind_the_rider():
+    async def run():
+        hub = RouteHub(max_pending=1, max_lag=0.0)
+        subscriber = hub.subscribe("r")
+        stuck = asyncio.Event()
+
+        async def send(frame):
+            stuck.set()
+            await asyncio.sleep(3600)  # a rider that stopped reading
+
+        hub.publish("r", {"n": 1}, key="A")
+        pump = asyncio.create_task(hub.pump(subscriber, send))
+        await stuck.wait()
+        # The mailbox overflows while the send is stuck; publish drops the rider
+        for n in range(2, 100):
+            hub.publish("r", {"n": n}, key=str(n))
+        await asyncio.wait_for(pump, 1.0)
+        return subscriber.closed, pump.cancelled()
+
+    assert asyncio.run(run()) == (True, False)
+
+
+def test_cancelling_the_pump_itself_still_propagates():
+    async def run():
+        hub = RouteHub()
+        subscriber = hub.subscribe("r")
+        stuck = asyncio.Event()
+
+        async def send(frame):
+            stuck.set()
+            await asyncio.sleep(3600)
+
+        hub.publish("r", {"n": 1}, key="A")
+        pump = asyncio.create_task(hub.pump(subscriber, send))
+        await stuck.wait()
+        pump.cancel()
+        try:
+            await pump
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    assert asyncio.run(run())
+
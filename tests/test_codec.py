@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from codec import (FIX_DTYPE, decode_ack, decode_fix_frame, decode_fix_frames, decode_polyline, decode_positions,
+                   decode_rate, encode_ack, encode_fix_frame, encode_polyline, encode_positions, encode_rate)
+
+
+def _records(n, bus=0):
+    records = np.zeros(n, dtype=FIX_DTYPE)
+    records["bus"] = bus
+    records["ts_ms"] = 1_700_000_000_000 + np.arange(n) * 1000
+    records["lat"] = 27_700_000 + np.arange(n)
+    records["lon"] = 85_300_000 - np.arange(n)
+    records["speed"] = 800
+    records["heading"] = 9000
+    return records
+
+
+def test_fix_frame_round_trip():
+    records = _records(3)
+    records["bus"] = [0, 1, 0]
+    seq, buses, decoded = decode_fix_frame(encode_fix_frame(7, ["BA 1", "BA 2"], records))
+    assert seq == 7
+    assert buses == ["BA 1", "BA 2"]
+    assert decoded.tobytes() == records.tobytes()
+
+
+def test_fix_frame_truncated_header():
+    with pytest.raises(ValueError, match="Truncated fix frame"):
+        decode_fix_frame(b"\x01\x01")
+
+
+def test_fix_frame_truncated_records():
+    frame = encode_fix_frame(1, ["BA 1"], _records(2))
+    with pytest.raises(ValueError, match="Expected 2 fixes"):
+        decode_fix_frame(frame[:-1])
+
+
+def test_fix_frame_trailing_bytes():
+    frame = encode_fix_frame(1, ["BA 1"], _records(2))
+    with pytest.raises(ValueError, match="trailing bytes"):
+        decode_fix_frame(frame + b"\x00")
+
+
+def test_fix_frame_truncated_bus_table():
+    frame = encode_fix_frame(1, ["BA 1", "BA 2"], _records(0))
+    with pytest.raises(ValueError, match="Truncated bus table"):
+        decode_fix_frame(frame[:frame.index(b"BA 2") - 1])
+
+
+def test_fix_frame_wrong_version():
+    frame = bytearray(encode_fix_frame(1, ["BA 1"], _records(1)))
+    frame[0] = 2
+    with pytest.raises(ValueError, match="Unsupported frame version"):
+        decode_fix_frame(bytes(frame))
+
+
+def test_fix_frames_merge_bus_tables():
+    first = encode_fix_frame(1, ["A", "B"], _records(2, bus=1))
+    second = _records(2)
+    second["bus"] = [0, 1]
+    buses, records = decode_fix_frames(first + encode_fix_frame(2, ["B", "C"], second))
+    assert buses == ["A", "B", "C"]
+    assert [buses[i] for i in records["bus"].tolist()] == ["B", "B", "B", "C"]
+
+
+def test_fix_frames_unknown_bus_index_is_out_of_range():
+    records = _records(1, bus=5)
+    buses, decoded = decode_fix_frames(encode_fix_frame(1, ["A"], records))
+    assert buses == ["A"]
+    assert decoded["bus"][0] >= len(buses)
+
+
+def test_ack_and_rate_round_trip():
+    assert decode_ack(encode_ack(42, 30, 2)) == (42, 30, 2)
+    assert decode_rate(encode_rate(2.5, 12.3)) == (2.5, 12.3)
+    with pytest.raises(ValueError):
+        decode_ack(encode_rate(1, 1) + b"\x00" * 8)
+
+
+def test_polyline_round_trip():
+    lats = [27.70001, 27.71234, 27.69999]
+    lons = [85.30001, 85.31234, 85.29999]
+    points = decode_polyline(encode_polyline(lats, lons))
+    assert points == pytest.approx(list(zip(lats, lons)), abs=1e-5)
+    # The reference example from the format's documentation
+    assert encode_polyline([38.5, 40.7, 43.252], [-120.2, -120.95, -126.453]) == b"_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def test_positions_round_trip():
+    snapshot = {
+        "route_1": [{"bus_number": "BA 1", "current_lat": 27.7, "current_lon": 85.3},
+                    {"bus_number": "BA 2", "current_lat": 27.71, "current_lon": 85.31}],
+        "route_2": [],
+    }
+    assert decode_positions(encode_positions(snapshot)) == snapshot
+
+
+def test_positions_bad_magic():
+    with pytest.raises(ValueError, match="Not a bus position snapshot"):
+        decode_positions(b"nope")
@@ -0,0 +1,105 @@
+import numpy as np
+
+from geometry import M_PER_DEG
+from gps_filter import HOLD, PUBLISH, REJECT, GpsFilter
+
+LAT, LON = 27.7, 85.3
+
+
+def _north(metres):
+    return LAT + metres / M_PER_DEG
+
+
+def _filter(**kwargs):
+    options = dict(max_speed=40.0, accuracy=25.0, reacquire_after=3, reset_after=30.0, min_move=5.0, heartbeat=60.0)
+    options.update(kwargs)
+    return GpsFilter(**options)
+
+
+def test_first_fix_is_published_as_is():
+    verdict, lat, lon, speed, heading = _filter().update("B", LAT, LON, 0.0)
+    assert (verdict, lat, lon, speed, heading) == (PUBLISH, LAT, LON, None, None)
+
+
+def test_jitter_is_held():
+    gps = _filter()
+    gps.update("B", LAT, LON, 0.0)
+    verdict, *_ = gps.update("B", _north(1.0), LON, 1.0)
+    assert verdict == HOLD
+    assert gps.held == 1
+
+
+def test_heartbeat_publishes_an_unmoved_bus():
+    gps = _filter(heartbeat=10.0)
+    gps.update("B", LAT, LON, 0.0)
+    assert gps.update("B", LAT, LON, 5.0)[0] == HOLD
+    assert gps.update("B", LAT, LON, 10.0)[0] == PUBLISH
+
+
+def test_movement_is_published():
+    gps = _filter()
+    gps.update("B", LAT, LON, 0.0)
+    verdict, lat, _, speed, heading = gps.update("B", _north(20.0), LON, 2.0)
+    assert verdict == PUBLISH
+    assert LAT < lat < _north(20.0)
+    assert speed > 0
+    assert heading == 0.0
+
+
+def test_impossible_jump_is_rejected():
+    gps = _filter()
+    gps.update("B", LAT, LON, 0.0)
+    verdict, lat, lon, speed, heading = gps.update("B", _north(1000.0), LON, 1.0)
+    assert (verdict, lat, lon, speed, heading) == (REJECT, LAT, LON, None, None)
+
+
+def test_out_of_order_fix_is_rejected():
+    gps = _filter()
+    gps.update("B", LAT, LON, 10.0)
+    assert gps.update("B", LAT, LON, 9.0)[0] == REJECT
+
+
+def test_reacquires_after_repeated_rejects():
+    gps = _filter(reacquire_after=3)
+    gps.update("B", LAT, LON, 0.0)
+    far = _north(5000.0)
+    assert gps.update("B", far, LON, 1.0)[0] == REJECT
+    assert gps.update("B", far, LON, 2.0)[0] == REJECT
+    verdict, lat, *_ = gps.update("B", far, LON, 3.0)
+    assert (verdict, lat) == (PUBLISH, far)
+    assert gps.reacquired == 1
+
+
+def test_restarts_after_silence():
+    gps = _filter(reset_after=30.0)
+    gps.update("B", LAT, LON, 0.0)
+    verdict, lat, *_ = gps.update("B", _north(5000.0), LON, 100.0)
+    assert (verdict, lat) == (PUBLISH, _north(5000.0))
+
+
+def test_update_many_matches_scalar_updates():
+    rng = np.random.default_rng(0)
+    buses = [f"B{i}" for i in range(40)]
+    steps = 5
+    bus_numbers = buses * steps
+    lats = np.concatenate([_north(np.arange(40) * 100.0 + step * rng.uniform(0, 12, 40)) for step in range(steps)])
+    lons = np.full(len(lats), LON)
+    lats[45] = _north(100_000.0)  # one impossible jump
+    times = np.repeat(np.arange(steps, dtype=np.float64), 40)
+
+    batch = _filter().update_many(bus_numbers, lats, lons, times)
+    scalar = _filter()
+    rows = [scalar.update(bus, lat, lon, t) for bus, lat, lon, t in zip(bus_numbers, lats, lons, times)]
+
+    assert batch.verdict.tolist() == [row[0] for row in rows]
+    assert REJECT in batch.verdict and HOLD in batch.verdict and PUBLISH in batch.verdict
+    np.testing.assert_allclose(batch.lat, [row[1] for row in rows])
+    np.testing.assert_allclose(batch.speed, [np.nan if row[3] is None else row[3] for row in rows])
+
+
+def test_forget_starts_afresh():
+    gps = _filter()
+    gps.update("B", LAT, LON, 0.0)
+    gps.forget("B")
+    assert gps.speed_of("B") is None
+    assert gps.update("B", _north(5000.0), LON, 1.0)[0] == PUBLISH
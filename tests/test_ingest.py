@@ -0,0 +1,142 @@
+import asyncio
+from datetime import datetime
+
+import numpy as np
+import pytest
+from sqlalchemy.exc import DataError, OperationalError
+
+import ingest
+from ingest import IngestBuffer
+from schemas import LocationUpdate
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def rollback(self):
+        pass
+
+
+class FakeDatabase:
+    """Records what the buffer writes; `fail` raises from the next writes."""
+
+    def __init__(self, monkeypatch):
+        self.latest = []
+        self.history = []
+        self.fail = None
+        monkeypatch.setattr(ingest, "bulk_upsert_bus_locations", self.upsert)
+        monkeypatch.setattr(ingest, "insert_location_history", self.insert_history)
+        monkeypatch.setattr(ingest.history_partitions, "ensure", self.ensure)
+
+    async def upsert(self, session, rows):
+        if self.fail is not None:
+            raise self.fail
+        self.latest += rows
+        return len(rows)
+
+    async def insert_history(self, session, rows):
+        if self.fail is not None:
+            raise self.fail
+        if any(row["lat"] > 90 for row in rows):
+            raise DataError("INSERT", {}, Exception("latitude out of range"))
+        self.history += rows
+        return len(rows)
+
+    async def ensure(self, session, days):
+        pass
+
+
+@pytest.fixture
+def db(monkeypatch):
+    return FakeDatabase(monkeypatch)
+
+
+def _buffer(**kwargs):
+    return IngestBuffer(session_maker=FakeSession, flush_interval=60.0, **kwargs)
+
+
+def test_enqueue_coalesces_latest_but_keeps_history():
+    buffer = _buffer()
+    buffer.enqueue(LocationUpdate(bus_number="A", lat=1.0, lon=1.0))
+    buffer.enqueue(LocationUpdate(bus_number="B", lat=2.0, lon=2.0))
+    buffer.enqueue(LocationUpdate(bus_number="A", lat=3.0, lon=3.0))
+    assert buffer.depth == 2
+    assert buffer.coalesced == 1
+    assert buffer._pending["A"]["current_lat"] == 3.0
+    assert len(buffer._history) == 3
+
+
+def test_enqueue_many_coalesces_within_and_across_batches():
+    buffer = _buffer()
+    buffer.enqueue(LocationUpdate(bus_number="A", lat=1.0, lon=1.0))
+    buffer.enqueue_many(["A", "B", "B"], [2.0, 3.0, 4.0], [2.0, 3.0, 4.0],
+                        speeds=[1.0, np.nan, 2.0], times=[100.0, 100.0, 101.0])
+    assert buffer.depth == 2
+    assert buffer.coalesced == 2
+    assert buffer.enqueued == 4
+    assert buffer._pending["B"]["current_lat"] == 4.0
+    assert buffer._pending["B"]["last_updated"] == datetime.utcfromtimestamp(101.0)
+    assert [row["speed"] for row in buffer._history[1:]] == [1.0, None, 2.0]
+
+
+def test_max_pending_wakes_the_flusher():
+    buffer = _buffer(max_pending=2)
+    buffer.enqueue(LocationUpdate(bus_number="A", lat=1.0, lon=1.0))
+    assert not buffer._wakeup.is_set()
+    buffer.enqueue(LocationUpdate(bus_number="B", lat=1.0, lon=1.0))
+    assert buffer._wakeup.is_set()
+
+
+def test_stop_flushes_pending_updates(db):
+    async def run():
+        buffer = _buffer()
+        await buffer.start()
+        buffer.enqueue(LocationUpdate(bus_number="A", lat=1.0, lon=1.0))
+        buffer.enqueue(LocationUpdate(bus_number="A", lat=2.0, lon=2.0))
+        await buffer.stop()
+        return buffer
+
+    buffer = asyncio.run(run())
+    assert [row["current_lat"] for row in db.latest] == [2.0]
+    assert [row["lat"] for row in db.history] == [1.0, 2.0]
+    assert buffer.depth == 0
+    assert buffer.rows_flushed == 1
+
+
+def test_failed_latest_flush_is_requeued_behind_newer_updates(db):
+    buffer = _buffer()
+    buffer.enqueue(LocationUpdate(bus_number="A", lat=1.0, lon=1.0))
+    db.fail = OperationalError("UPSERT", {}, Exception("connection lost"))
+    asyncio.run(buffer.flush())
+    assert buffer.depth == 1
+    db.fail = None
+    buffer.enqueue(LocationUpdate(bus_number="A", lat=2.0, lon=2.0))
+    asyncio.run(buffer.flush())
+    assert [row["current_lat"] for row in db.latest] == [2.0]
+
+
+def test_bad_history_row_is_dropped_alone(db):
+    buffer = _buffer()
+    buffer._history = [{"bus_number": "A", "ts": datetime(2024, 1, 1, 0, 0, i), "lat": lat, "lon": 1.0,
+                        "speed": None, "heading": None} for i, lat in enumerate((1.0, 999.0, 2.0))]
+    asyncio.run(buffer.flush())
+    assert [row["lat"] for row in db.history] == [1.0, 2.0]
+    assert buffer.history_rejected == 1
+    assert buffer._history == []
+
+
+def test_history_is_requeued_on_connection_errors(db):
+    buffer = _buffer(max_backlog=3)
+    buffer.enqueue_many(["A", "B"], [1.0, 2.0], [1.0, 2.0])
+    db.fail = OperationalError("INSERT", {}, Exception("connection lost"))
+    asyncio.run(buffer.flush())
+    assert len(buffer._history) == 2
+    buffer.enqueue_many(["A", "B"], [3.0, 4.0], [3.0, 4.0])
+    asyncio.run(buffer.flush())
+    # The backlog is capped, oldest first out
+    assert [row["lat"] for row in buffer._history] == [2.0, 3.0, 4.0]
+    assert buffer.history_dropped == 1
@@ -0,0 +1,63 @@
+import math
+
+import pytest
+
+from geometry import M_PER_DEG, DistanceProfile, RouteGeometry
+from planner import JourneyPlanner
+
+LAT, LON = 27.7, 85.3
+
+
+def _east(metres):
+    return metres / (M_PER_DEG * math.cos(math.radians(LAT)))
+
+
+def _north(metres):
+    return metres / M_PER_DEG
+
+
+def _route(points):
+    geometry = RouteGeometry.from_coordinates([{"lat": lat, "lon": lon} for lat, lon in points])
+    return geometry, DistanceProfile.from_geometry(geometry)
+
+
+@pytest.fixture
+def planner():
+    # An east-bound line, then a north-bound line starting 50 m past its end
+    planner = JourneyPlanner(bus_speed=10.0, walk_speed=1.0, board_penalty=60.0,
+                             transfer_radius=100.0, access_radius=300.0)
+    planner.update_route("east", *_route([(LAT, LON + _east(x)) for x in range(0, 3001, 500)]))
+    planner.update_route("north", *_route([(LAT + _north(y), LON + _east(3050)) for y in range(0, 3001, 500)]))
+    return planner
+
+
+def test_rides_one_route(planner):
+    journey = planner.plan(LAT, LON, LAT, LON + _east(3000))
+    assert [leg["type"] for leg in journey["legs"]] == ["bus"]
+    assert journey["legs"][0]["route_id"] == "east"
+    assert journey["legs"][0]["distance"] == pytest.approx(3000, rel=0.01)
+
+
+def test_transfers_between_routes(planner):
+    journey = planner.plan(LAT, LON, LAT + _north(3000), LON + _east(3050))
+    legs = journey["legs"]
+    assert [leg.get("route_id") for leg in legs if leg["type"] == "bus"] == ["east", "north"]
+    assert journey["transfers"] == 1
+    transfer = [leg for leg in legs if leg["type"] == "walk" and leg["distance"] > 0]
+    assert [round(leg["distance"]) for leg in transfer] == [50]
+
+
+def test_does_not_ride_against_the_route(planner):
+    # Only walking gets from the end of "east" back to its start; it's too far
+    assert planner.plan(LAT, LON + _east(3000), LAT, LON) is None
+
+
+def test_walks_when_it_beats_waiting_for_a_bus(planner):
+    journey = planner.plan(LAT, LON, LAT, LON + _east(40))
+    assert [leg["type"] for leg in journey["legs"]] == ["walk"]
+
+
+def test_removed_route_is_not_used(planner):
+    planner.remove_route("north")
+    assert planner.plan(LAT, LON, LAT + _north(3000), LON + _east(3050)) is None
+    assert planner.stats()["transfer_links"] == 0
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+from geometry import M_PER_DEG
+from rollup import compress
+
+T0 = datetime(2024, 1, 1, 8, 0, 0)
+
+
+def _row(bus, second, north_m, east_m=0.0):
+    return (bus, T0 + timedelta(seconds=second), 27.7 + north_m / M_PER_DEG, 85.3 + east_m / M_PER_DEG, None, None)
+
+
+def _straight(bus, seconds):
+    # 10 m/s due north: every middle fix lies on the chord, in space and time
+    return [_row(bus, s, 10.0 * s) for s in seconds]
+
+
+def test_keeps_only_endpoints_of_steady_motion():
+    rows = _straight("A", range(10))
+    assert compress(rows, None, tolerance=1.0) == [rows[0], rows[-1]]
+
+
+def test_keeps_a_turn_and_a_stop():
+    north = _straight("A", range(5))
+    east = [_row("A", 5 + s, 40.0, 10.0 * (s + 1)) for s in range(5)]
+    parked = [_row("A", 10 + s, 40.0, 50.0) for s in range(11)]
+    rows = north + east + parked
+    # The corner, and the arrival where the bus then waits: in space alone
+    # the arrival sits on the last fix and would be dropped
+    assert compress(rows, None, tolerance=1.0) == [north[0], north[-1], east[-1], parked[-1]]
+
+
+def test_each_bus_is_simplified_separately():
+    a, b = _straight("A", range(5)), _straight("B", range(5))
+    assert compress(a + b, None, tolerance=1.0) == [a[0], a[-1], b[0], b[-1]]
+
+
+def test_anchor_continues_the_run_without_being_repeated():
+    previous = _straight("A", range(5))
+    anchor = previous[-1]
+    rows = _straight("A", range(5, 10))
+    kept = compress(rows, anchor, tolerance=1.0)
+    # The batch's first fix lies between the anchor and the end; only the end stays
+    assert kept == [rows[-1]]
+    assert anchor not in kept
+
+
+def test_anchor_of_another_bus_is_ignored():
+    anchor = _straight("A", [4])[0]
+    rows = _straight("B", range(5))
+    assert compress(rows, anchor, tolerance=1.0) == [rows[0], rows[-1]]
@@ -0,0 +1,625 @@
+# tiles.py
+"""Mapbox Vector Tiles of the route network, cached on disk.
+
+Pre-seed a zoom range with: python tiles.py seed --min-zoom 10 --max-zoom 16
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from codec import decode_polyline, encode_polyline, encode_varint
+from config import ROUTE_TILE_CACHE_BYTES, ROUTE_TILE_DIR, ROUTE_TILE_MAX_ZOOM, ROUTE_TILE_MIN_ZOOM
+from geometry import RouteGeometry
+from route_cache import RouteCache, RouteEntry, route_cache
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+LAYER_NAME = "routes"
+EXTENT = 4096  # tile coordinate units per side
+BUFFER = 64  # units drawn past each edge so strokes join up across tiles
+_MAX_LAT = 85.05112878  # Web Mercator cut-off
+
+TileKey = Tuple[int, int, int]  # (z, x, y)
+Line = List[Tuple[int, int]]
+
+
+def _world(lats, lons):
+    """Web Mercator position as fractions of the world, y growing southwards."""
+    lat = np.radians(np.clip(np.asarray(lats, dtype=np.float64), -_MAX_LAT, _MAX_LAT))
+    wx = (np.asarray(lons, dtype=np.float64) + 180.0) / 360.0
+    wy = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0
+    return wx, wy
+
+
+def tiles_touched(geometry: RouteGeometry, zoom: int) -> Set[Tuple[int, int]]:
+    """(x, y) of every tile at `zoom` that a route can appear in, buffer included."""
+    if len(geometry) == 0:
+        return set()
+    n = 1 << zoom
+    wx, wy = _world(geometry.lats, geometry.lons)
+    wx, wy = wx * n, wy * n
+    if len(wx) == 1:
+        wx, wy = np.repeat(wx, 2), np.repeat(wy, 2)
+    # Twice the render buffer also covers the simplified line's deviation
+    margin = 2 * BUFFER / EXTENT
+    x0 = np.clip(np.floor(np.minimum(wx[:-1], wx[1:]) - margin), 0, n - 1).astype(int).tolist()
+    x1 = np.clip(np.floor(np.maximum(wx[:-1], wx[1:]) + margin), 0, n - 1).astype(int).tolist()
+    y0 = np.clip(np.floor(np.minimum(wy[:-1], wy[1:]) - margin), 0, n - 1).astype(int).tolist()
+    y1 = np.clip(np.floor(np.maximum(wy[:-1], wy[1:]) + margin), 0, n - 1).astype(int).tolist()
+    tiles = set()
+    for ax, bx, ay, by in zip(x0, x1, y0, y1):
+        for x in range(ax, bx + 1):
+            for y in range(ay, by + 1):
+                tiles.add((x, y))
+    return tiles
+
+
+# --- clipping ----------------------------------------------------------------
+
+def _liang_barsky(ax: float, ay: float, bx: float, by: float, lo: float, hi: float):
+    """Parameter range of segment a-b inside the square [lo, hi]^2, or None."""
+    t0, t1 = 0.0, 1.0
+    dx, dy = bx - ax, by - ay
+    for p, q in ((-dx, ax - lo), (dx, hi - ax), (-dy, ay - lo), (dy, hi - ay)):
+        if p == 0:
+            if q < 0:
+                return None
+        else:
+            r = q / p
+            if p < 0:
+                if r > t1:
+                    return None
+                t0 = max(t0, r)
+            else:
+                if r < t0:
+                    return None
+                t1 = min(t1, r)
+    return t0, t1
+
+
+def _clip(px: np.ndarray, py: np.ndarray) -> List[Line]:
+    """Clips a polyline in tile units to the buffered tile, snapped to the grid."""
+    lo, hi = -BUFFER, EXTENT + BUFFER
+    if len(px) < 2:
+        return []
+    x0, y0, x1, y1 = px[:-1], py[:-1], px[1:], py[1:]
+    near = np.flatnonzero(
+        (np.maximum(x0, x1) >= lo) & (np.minimum(x0, x1) <= hi)
+        & (np.maximum(y0, y1) >= lo) & (np.minimum(y0, y1) <= hi)
+    )
+    lines: List[Line] = []
+    current: Optional[Line] = None
+    previous = -2
+    for i in near.tolist():
+        ax, ay, bx, by = float(px[i]), float(py[i]), float(px[i + 1]), float(py[i + 1])
+        span = _liang_barsky(ax, ay, bx, by, lo, hi)
+        if span is None:
+            continue
+        t0, t1 = span
+        start = (math.floor(ax + t0 * (bx - ax) + 0.5), math.floor(ay + t0 * (by - ay) + 0.5))
+        end = (math.floor(ax + t1 * (bx - ax) + 0.5), math.floor(ay + t1 * (by - ay) + 0.5))
+        # Carry on the current line only if the previous segment ran right up to this one
+        if current is None or i != previous + 1 or t0 > 0:
+            current = [start]
+            lines.append(current)
+        if end != current[-1]:
+            current.append(end)
+        previous = i if t1 == 1 else -2
+    return [line for line in lines if len(line) >= 2]
+
+
+# --- MVT encoding ------------------------------------------------------------
+
+def _field(number: int, wire_type: int) -> bytes:
+    return encode_varint((number << 3) | wire_type)
+
+
+def _uint(number: int, value: int) -> bytes:
+    return _field(number, 0) + encode_varint(value)
+
+
+def _message(number: int, data: bytes) -> bytes:
+    return _field(number, 2) + encode_varint(len(data)) + data
+
+
+def _packed(number: int, values: Iterable[int]) -> bytes:
+    return _message(number, b"".join(encode_varint(v) for v in values))
+
+
+def _zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _line_geometry(lines: List[Line]) -> List[int]:
+    """MVT command stream for a (multi)linestring: MoveTo, LineTo, cursor-relative."""
+    commands: List[int] = []
+    cx = cy = 0
+    for line in lines:
+        x, y = line[0]
+        commands += [1 | (1 << 3), _zigzag(x - cx), _zigzag(y - cy)]
+        cx, cy = x, y
+        commands.append(2 | ((len(line) - 1) << 3))
+        for x, y in line[1:]:
+            commands += [_zigzag(x - cx), _zigzag(y - cy)]
+            cx, cy = x, y
+    return commands
+
+
+def encode_tile(features: List[Tuple[str, List[Line]]]) -> bytes:
+    """One-layer MVT tile with a LineString feature per (route_id, lines)."""
+    layer = [_uint(15, 2), _message(1, LAYER_NAME.encode())]
+    for i, (_, lines) in enumerate(features):
+        # tags: key 0 ("route_id"), value i; geometry type 2 = LINESTRING
+        feature = _packed(2, (0, i)) + _uint(3, 2) + _packed(4, _line_geometry(lines))
+        layer.append(_message(2, feature))
+    layer.append(_message(3, b"route_id"))
+    for route_id, _ in features:
+        layer.append(_message(4, _message(1, route_id.encode())))
+    layer.append(_uint(5, EXTENT))
+    return _message(3, b"".join(layer))
+
+
+class RouteTileRenderer:
+    """Clips and encodes route geometry into tiles.
+
+    Each route is projected to Web Mercator once per zoom level (using the
+    route's simplified geometry for that zoom) and kept until the route
+    version changes, so rendering a tile is a bounding-box test per route
+    plus clipping of the few segments near the tile.
+    """
+
+    def __init__(self):
+        self._projected: Dict[Tuple[str, int], tuple] = {}
+
+    def forget(self, route_id: str) -> None:
+        for key in [key for key in self._projected if key[0] == route_id]:
+            del self._projected[key]
+
+    def _project(self, entry: RouteEntry, zoom: int) -> tuple:
+        key = (entry.route_id, zoom)
+        projected = self._projected.get(key)
+        if projected is None or projected[0] != entry.version:
+            level = entry.level(zoom)
+            wx, wy = _world(level.lats, level.lons)
+            bounds = (wx.min(), wy.min(), wx.max(), wy.max()) if len(wx) else (1.0, 1.0, 0.0, 0.0)
+            projected = self._projected[key] = (entry.version, wx, wy, bounds)
+        return projected
+
+    def render(self, entries: Iterable[RouteEntry], z: int, x: int, y: int) -> bytes:
+        """Encoded tile, or b"" when no route crosses it."""
+        n = 1 << z
+        margin = BUFFER / EXTENT
+        left, top, right, bottom = (x - margin) / n, (y - margin) / n, (x + 1 + margin) / n, (y + 1 + margin) / n
+        features = []
+        for entry in entries:
+            _, wx, wy, (min_x, min_y, max_x, max_y) = self._project(entry, z)
+            if max_x < left or min_x > right or max_y < top or min_y > bottom:
+                continue
+            lines = _clip((wx * n - x) * EXTENT, (wy * n - y) * EXTENT)
+            if lines:
+                features.append((entry.route_id, lines))
+        return encode_tile(features) if features else b""
+
+
+# --- disk cache --------------------------------------------------------------
+
+class TileCache:
+    """Size-bounded LRU of encoded tiles stored as `directory/z/x/y.mvt`.
+
+    The recency order lives in memory and is rebuilt from file mtimes on
+    start. Tiles written by another process (the seeder, another worker)
+    are adopted when first read, and a tile deleted elsewhere is simply a
+    miss. get/put/discard block on the disk; the server uses fetch/store/
+    discard_many, which keep the index on the event loop and do the file
+    work in a thread.
+    """
+
+    def __init__(self, directory: str = ROUTE_TILE_DIR, max_bytes: int = ROUTE_TILE_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index: "OrderedDict[TileKey, int]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def path(self, key: TileKey) -> str:
+        z, x, y = key
+        return os.path.join(self.directory, str(z), str(x), f"{y}.mvt")
+
+    def scan(self) -> None:
+        """Indexes the tiles already on disk, oldest first, and trims to budget."""
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".mvt"):
+                    continue
+                try:
+                    z, x = (int(part) for part in os.path.relpath(root, self.directory).split(os.sep))
+                    key = (z, x, int(name[:-4]))
+                    stat = os.stat(os.path.join(root, name))
+                except (ValueError, OSError):
+                    continue
+                found.append((stat.st_mtime, key, stat.st_size))
+        self._index.clear()
+        self._bytes = 0
+        for _, key, size in sorted(found):
+            self._index[key] = size
+            self._bytes += size
+        self._evict()
+
+    def _forget(self, key: TileKey) -> None:
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._bytes -= size
+
+    def _over_budget(self) -> List[TileKey]:
+        """Drops least recently used tiles from the index until under budget; returns them."""
+        evicted = []
+        while self._bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            evicted.append(key)
+        return evicted
+
+    def _remove(self, keys: Iterable[TileKey]) -> int:
+        """Deletes tile files; returns how many existed."""
+        removed = 0
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def _evict(self) -> None:
+        self._remove(self._over_budget())
+
+    def _read(self, key: TileKey) -> Optional[bytes]:
+        try:
+            with open(self.path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key: TileKey, data: bytes) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a partial tile
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _found(self, key: TileKey, data: Optional[bytes]) -> List[TileKey]:
+        """Index bookkeeping after a read; returns the tiles to evict."""
+        if data is None:
+            self._forget(key)
+            self.misses += 1
+            return []
+        self.hits += 1
+        if key in self._index:
+            self._index.move_to_end(key)
+            return []
+        self._index[key] = len(data)
+        self._bytes += len(data)
+        return self._over_budget()
+
+    def _stored(self, key: TileKey, data: bytes) -> List[TileKey]:
+        """Index bookkeeping after a write; returns the tiles to evict."""
+        self._forget(key)
+        self._index[key] = len(data)
+        self._bytes += len(data)
+        return self._over_budget()
+
+    def get(self, key: TileKey) -> Optional[bytes]:
+        data = self._read(key)
+        self._remove(self._found(key, data))
+        return data
+
+    def put(self, key: TileKey, data: bytes) -> None:
+        self._write(key, data)
+        self._remove(self._stored(key, data))
+
+    def discard(self, key: TileKey) -> None:
+        self._forget(key)
+        self.invalidations += self._remove([key])
+
+    async def fetch(self, key: TileKey) -> Optional[bytes]:
+        data = await asyncio.to_thread(self._read, key)
+        evicted = self._found(key, data)
+        if evicted:
+            await asyncio.to_thread(self._remove, evicted)
+        return data
+
+    async def store(self, key: TileKey, data: bytes) -> None:
+        await asyncio.to_thread(self._write, key, data)
+        evicted = self._stored(key, data)
+        if evicted:
+            await asyncio.to_thread(self._remove, evicted)
+
+    async def discard_many(self, keys: List[TileKey]) -> None:
+        for key in keys:
+            self._forget(key)
+        self.invalidations += await asyncio.to_thread(self._remove, keys)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "directory": self.directory,
+            "tiles": len(self._index),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidated": self.invalidations,
+        }
+
+
+# --- service -----------------------------------------------------------------
+
+def _read_manifest(directory: str) -> Dict[str, dict]:
+    try:
+        with open(os.path.join(directory, "routes.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_manifest(directory: str, manifest: Dict[str, dict]) -> None:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "routes.json")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def _manifest_entry(entry: RouteEntry) -> dict:
+    return {"version": entry.version, "footprint": encode_polyline(entry.geometry.lats, entry.geometry.lons).decode()}
+
+
+class RouteTileService:
+    """Serves route network tiles, keeping the disk cache in step with routes.
+
+    The cache directory holds a manifest of the route versions its tiles
+    were drawn from, with each route's footprint. When a route changes -
+    live or while the server was down - only the tiles its old and new
+    footprints touch are deleted; they are redrawn on the next request.
+    Route changes arrive on a sync route_cache listener, so the deletes
+    (and the manifest write) are queued to a background task; a tile
+    request waits for queued deletes before reading the disk.
+    """
+
+    def __init__(self, routes: RouteCache, disk: TileCache,
+                 min_zoom: int = ROUTE_TILE_MIN_ZOOM, max_zoom: int = ROUTE_TILE_MAX_ZOOM):
+        self.routes = routes
+        self.disk = disk
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.renderer = RouteTileRenderer()
+        self._manifest: Optional[Dict[str, dict]] = None
+        self._dirty: Set[str] = set()
+        self._stale: List[RouteGeometry] = []
+        self._manifest_changed = False
+        self._invalidation: Optional[asyncio.Task] = None
+        self.rendered = 0
+        self._render_total = 0.0
+
+    @property
+    def manifest(self) -> Dict[str, dict]:
+        if self._manifest is None:
+            self._manifest = _read_manifest(self.disk.directory)
+        return self._manifest
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self.disk.scan)
+
+    async def stop(self) -> None:
+        await self.settle()
+
+    def _footprint_keys(self, geometries: List[RouteGeometry]) -> List[TileKey]:
+        keys = []
+        for geometry in geometries:
+            for z in range(self.min_zoom, self.max_zoom + 1):
+                keys += [(z, x, y) for x, y in tiles_touched(geometry, z)]
+        return keys
+
+    async def _drain(self) -> None:
+        while self._stale or self._manifest_changed:
+            geometries, self._stale = self._stale, []
+            if geometries:
+                keys = await asyncio.to_thread(self._footprint_keys, geometries)
+                await self.disk.discard_many(keys)
+            if self._manifest_changed:
+                self._manifest_changed = False
+                await asyncio.to_thread(_write_manifest, self.disk.directory, dict(self.manifest))
+
+    def _schedule(self) -> None:
+        if self._invalidation is not None and not self._invalidation.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (a script): nothing to block, do it now
+            asyncio.run(self._drain())
+            return
+        self._invalidation = loop.create_task(self._drain())
+
+    async def settle(self) -> None:
+        """Waits for queued tile deletes and manifest writes."""
+        while self._invalidation is not None and not self._invalidation.done():
+            # Shielded: a cancelled tile request must not cancel the deletes
+            await asyncio.shield(self._invalidation)
+
+    def invalidate_footprint(self, geometry: RouteGeometry) -> None:
+        """Queues deletion of every tile the geometry touches."""
+        self._stale.append(geometry)
+        self._schedule()
+
+    def _save_manifest(self) -> None:
+        self._manifest_changed = True
+        self._schedule()
+
+    def _forget_route(self, route_id: str) -> None:
+        """Deletes the tiles drawn from the route's last recorded footprint."""
+        known = self.manifest.get(route_id)
+        if known is not None:
+            geometry = RouteGeometry()
+            for lat, lon in decode_polyline(known["footprint"]):
+                geometry.append(lat, lon)
+            self.invalidate_footprint(geometry)
+
+    def on_route_change(self, route_id: str, entry: Optional[RouteEntry]) -> None:
+        self.renderer.forget(route_id)
+        known = self.manifest.get(route_id)
+        if entry is None:
+            # Reloaded by refresh() before the next tile is drawn
+            self._dirty.add(route_id)
+            self._forget_route(route_id)
+            return
+        self._dirty.discard(route_id)
+        if known is not None and known["version"] == entry.version:
+            return
+        self._forget_route(route_id)
+        self.invalidate_footprint(entry.geometry)
+        self.manifest[route_id] = _manifest_entry(entry)
+        self._save_manifest()
+
+    async def refresh(self, db) -> None:
+        """Reloads routes invalidated since the last tile was drawn."""
+        for route_id in list(self._dirty):
+            if await self.routes.load(db, route_id) is None:
+                self._dirty.discard(route_id)
+                self._forget_route(route_id)
+                self.manifest.pop(route_id, None)
+                self._save_manifest()
+
+    def _entries(self) -> List[RouteEntry]:
+        return [entry for entry in map(self.routes.get, self.routes.route_ids()) if entry is not None]
+
+    async def tile(self, db, z: int, x: int, y: int) -> bytes:
+        key = (z, x, y)
+        await self.settle()
+        data = await self.disk.fetch(key)
+        if data is not None:
+            return data
+        await self.refresh(db)
+        await self.settle()
+        started = time.perf_counter()
+        data = self.renderer.render(self._entries(), z, x, y)
+        self._render_total += time.perf_counter() - started
+        self.rendered += 1
+        if data:
+            # Empty tiles are cheap to redraw (a bounds test per route); keep disk for real ones
+            await self.disk.store(key, data)
+        return data
+
+    def stats(self) -> dict:
+        return {
+            **self.disk.stats(),
+            "rendered": self.rendered,
+            "avg_render_ms": round(self._render_total / self.rendered * 1000, 3) if self.rendered else 0.0,
+            "dirty_routes": len(self._dirty),
+            "queued_invalidations": len(self._stale),
+        }
+
+
+route_tiles = RouteTileService(route_cache, TileCache())
+route_cache.on_change(route_tiles.on_route_change)
+
+
+# --- pre-seeding -------------------------------------------------------------
+
+_worker_entries: List[RouteEntry] = []
+_worker_renderer: Optional[RouteTileRenderer] = None
+_worker_disk: Optional[TileCache] = None
+
+
+def _init_worker(routes: List[Tuple[str, bytes]], directory: str) -> None:
+    global _worker_entries, _worker_renderer, _worker_disk
+    _worker_entries = [RouteEntry(route_id, RouteGeometry.from_bytes(packed)) for route_id, packed in routes]
+    _worker_renderer = RouteTileRenderer()
+    # Unbounded here; the server trims the directory to budget when it scans it
+    _worker_disk = TileCache(directory, max_bytes=2 ** 63)
+
+
+def _seed_batch(keys: List[TileKey]) -> Tuple[int, int]:
+    written = size = 0
+    for z, x, y in keys:
+        data = _worker_renderer.render(_worker_entries, z, x, y)
+        if data:
+            _worker_disk.put((z, x, y), data)
+            written += 1
+            size += len(data)
+    return written, size
+
+
+async def _load_routes() -> List[Tuple[str, RouteGeometry]]:
+    from crud import get_all_route_geometries
+    from database import async_session_maker
+
+    async with async_session_maker() as db:
+        return [(route_id, geometry) for route_id, geometry in await get_all_route_geometries(db) if geometry]
+
+
+def seed(routes: List[Tuple[str, RouteGeometry]], min_zoom: int, max_zoom: int, directory: str = ROUTE_TILE_DIR,
+         workers: Optional[int] = None, batch: int = 256, force: bool = False) -> dict:
+    """Draws every non-empty tile in a zoom range across a process pool."""
+    keys = []
+    for z in range(min_zoom, max_zoom + 1):
+        touched = set()
+        for _, geometry in routes:
+            touched |= tiles_touched(geometry, z)
+        keys += [(z, x, y) for x, y in sorted(touched)]
+    disk = TileCache(directory)
+    if not force:
+        keys = [key for key in keys if not os.path.exists(disk.path(key))]
+    batches = [keys[i:i + batch] for i in range(0, len(keys), batch)]
+
+    started = time.perf_counter()
+    packed = [(route_id, geometry.to_bytes()) for route_id, geometry in routes]
+    written = size = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(packed, directory)) as pool:
+        for batch_written, batch_size in pool.map(_seed_batch, batches):
+            written += batch_written
+            size += batch_size
+
+    # Record what the tiles were drawn from so the server keeps them on start
+    manifest = {route_id: _manifest_entry(RouteEntry(route_id, geometry)) for route_id, geometry in routes}
+    _write_manifest(directory, manifest)
+    return {"candidates": len(keys), "written": written, "bytes": size,
+            "seconds": round(time.perf_counter() - started, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("seed", help="render all tiles the routes cross in a zoom range")
+    p.add_argument("--min-zoom", type=int, default=ROUTE_TILE_MIN_ZOOM)
+    p.add_argument("--max-zoom", type=int, default=ROUTE_TILE_MAX_ZOOM)
+    p.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    p.add_argument("--directory", default=ROUTE_TILE_DIR)
+    p.add_argument("--force", action="store_true", help="redraw tiles that already exist")
+    args = parser.parse_args()
+
+    routes = asyncio.run(_load_routes())
+    print(f"Seeding {len(routes)} routes, zoom {args.min_zoom}-{args.max_zoom} into {args.directory}")
+    print(seed(routes, args.min_zoom, args.max_zoom, args.directory, args.workers, force=args.force))
+
+
+if __name__ == "__main__":
+    main()